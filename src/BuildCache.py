@@ -0,0 +1,244 @@
+import os
+import json
+import time
+import sqlite3
+import tempfile
+from optparse import OptionParser
+
+from ReportStore import JOB_RECORD_PATTERN
+from ReportStore import classify_branch
+from SetupManager.constants import RTS_RUN_COMMAND
+from SetupManager.reportUploader import MANIFEST_VERSION as REPORT_MANIFEST_VERSION
+
+# the database of the cache, placed in the report directory of the responsive server
+BUILD_CACHE_FILE_NAME = "build_cache.db"
+
+# the Travis state of a job whose results can be reused
+PASSED_STATE = "passed"
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS expected (
+    repo TEXT NOT NULL,
+    branch TEXT NOT NULL,
+    tree TEXT NOT NULL,
+    tool TEXT NOT NULL,
+    command TEXT NOT NULL,
+    PRIMARY KEY (repo, branch)
+);
+CREATE TABLE IF NOT EXISTS results (
+    tree TEXT NOT NULL,
+    tool TEXT NOT NULL,
+    command TEXT NOT NULL,
+    repo TEXT NOT NULL,
+    branch TEXT NOT NULL,
+    job_records TEXT NOT NULL,
+    manifests TEXT NOT NULL,
+    seconds REAL NOT NULL,
+    PRIMARY KEY (tree, tool, command)
+);
+CREATE TABLE IF NOT EXISTS lookups (
+    repo TEXT NOT NULL,
+    branch TEXT NOT NULL,
+    tree TEXT NOT NULL,
+    tool TEXT NOT NULL,
+    command TEXT NOT NULL,
+    hit INTEGER NOT NULL,
+    builds INTEGER NOT NULL,
+    seconds REAL,
+    time REAL NOT NULL
+);
+"""
+
+# Function that computes the key of the build a pushed branch triggers, which is
+# (tree, RTS tool, run command) where the tree is the content built after setup:
+#   * seed_{idx}: the tree of the seed with the command of the project, tool and command are ""
+#   * {tool}_seed_{idx}: the tree of the branch with the command of the tool
+#   * {tool}_{idx}-{idx-1}: the result recorded is the build after the increment, whose
+#       selection depends on the tree before and after it, so the tree is "{tree}..{tree of seed_{idx-1}}"
+# @param branch: the branch name
+# @param heads: dictionary that maps the branch names to (commit SHA, tree SHA)
+# @return tuple of (tree, tool, command), None if the branch is not a pipeline branch or
+#    is an experiment branch that has been incremented already
+def build_key(branch, heads):
+    kind, tool, idx = classify_branch(branch)
+    if kind == "seed":
+        return (heads[branch][1], "", "")
+    if kind == "tool_seed":
+        return (heads[branch][1], tool, RTS_RUN_COMMAND.get(tool, ""))
+    if kind == "increment":
+        tool_seed = heads.get("{}_seed_{}".format(tool, idx + 1))
+        seed = heads.get("seed_{}".format(idx))
+        # a branch that is not incremented yet still points to the commit of its {tool}_seed_{idx}
+        if tool_seed is None or seed is None or tool_seed[0] != heads[branch][0]:
+            return None
+        return ("{}..{}".format(heads[branch][1], seed[1]), tool, RTS_RUN_COMMAND.get(tool, ""))
+    return None
+
+# @param branch: the branch name
+# @return the number of CI builds triggered by pushing the branch
+def builds_of_branch(branch):
+    return 2 if classify_branch(branch)[0] == "increment" else 1
+
+# Function that sums up the job records written by the responsive server
+# @param job_records: the content of a {branch}.txt job record file
+# @return tuple of (total seconds, True if every job passed)
+def abstract_job_seconds(job_records):
+    seconds = 0.0
+    passed = True
+    for line in job_records.splitlines():
+        match = JOB_RECORD_PATTERN.search(line)
+        if match is not None:
+            seconds += float(match.group("seconds"))
+            passed &= match.group("state") == PASSED_STATE
+    return (seconds, passed)
+
+# BuildCache class keeps the results of the CI builds keyed by the content they built, see build_key,
+# so that a branch whose content has been built before is not pushed (and not built) again:
+#   * expected: the key of each branch pushed, the responsive server files the results of the build under it
+#   * results: the job records and the report manifests of a passed build, the reports themselves are
+#       stored by content in {report_dir}/objects already
+#   * lookups: one row per pushed branch and key, whether it was a hit and the CI builds and seconds it saved.
+#       A reused branch is never pushed, so a rerun looks it up again; the same lookup is recorded once
+# On a hit, the stored job records and manifests are written to the report directory as {branch}.txt
+# and {branch}_{job}.manifest, so that ReportStore sees the results as if the branch had been built.
+# The database is opened per operation, so that the pipeline (possibly several processes) and
+# the responsive server can share it
+class BuildCache:
+    # Constructor that instantiate the BuildCache object with respect to the provided directory
+    # @param report_dir: the report directory of the responsive server, created if it doesn't exist
+    def __init__(self, report_dir):
+        self.report_dir_ = report_dir
+        self.db_path_ = os.path.join(report_dir, BUILD_CACHE_FILE_NAME)
+        self.hits_ = 0
+        self.misses_ = 0
+        self.builds_saved_ = 0
+        self.seconds_saved_ = 0.0
+        os.makedirs(report_dir, exist_ok=True)
+        connection = self._connect()
+        connection.executescript(SCHEMA)
+        connection.close()
+
+    # Look up the results of a branch about to be pushed. On a hit, the results are written to the
+    # report directory under the name of the branch; on a miss, the key of the branch is kept for
+    # the results of its build. The lookup is recorded either way, unless the same lookup
+    # (branch, key and outcome) has been recorded before
+    # @param repo: the name of the repository
+    # @param branch: the branch name
+    # @param key: tuple of (tree, tool, command), see build_key
+    # @return True if the results are reused and the branch doesn't need to be built, False otherwise
+    def reuse(self, repo, branch, key):
+        connection = self._connect()
+        try:
+            with connection:
+                row = connection.execute("SELECT job_records, manifests, seconds FROM results " \
+                    "WHERE tree = ? AND tool = ? AND command = ?", key).fetchone()
+                builds = builds_of_branch(branch)
+                if row is None:
+                    connection.execute("INSERT OR REPLACE INTO expected VALUES (?, ?, ?, ?, ?)", (repo, branch) + key)
+                else:
+                    connection.execute("DELETE FROM expected WHERE repo = ? AND branch = ?", (repo, branch))
+                seen = connection.execute("SELECT 1 FROM lookups WHERE repo = ? AND branch = ? AND tree = ? " \
+                    "AND tool = ? AND command = ? AND hit = ?", (repo, branch) + key + (row is not None,)).fetchone() is not None
+                if not seen:
+                    connection.execute("INSERT INTO lookups VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)", (repo, branch) + key + \
+                        (row is not None, builds, row[2] if row is not None else None, time.time()))
+        finally:
+            connection.close()
+        if row is None:
+            self.misses_ += not seen
+            return False
+        self._write_file("{}.txt".format(branch), row[0])
+        for job, manifest in json.loads(row[1]).items():
+            self._write_file("{}_{}.manifest".format(branch, job), manifest)
+        if not seen:
+            self.hits_ += 1
+            self.builds_saved_ += builds
+            self.seconds_saved_ += row[2]
+        return True
+
+    # Store the results of a build of a branch pushed with a key, the build is left out
+    # unless every job of it passed
+    # @param repo: the name of the repository
+    # @param branch: the branch name
+    # @param job_records: the content of the {branch}.txt job record file
+    # @param jobs: the job numbers of the build, the reports of job {n} are listed by {branch}_{n}.manifest
+    # @return True if the results are stored, False otherwise.
+    def store(self, repo, branch, job_records, jobs):
+        seconds, passed = abstract_job_seconds(job_records)
+        if not passed:
+            return False
+        manifests = {}
+        for job in jobs:
+            try:
+                with open(os.path.join(self.report_dir_, "{}_{}.manifest".format(branch, job)), 'r') as read_file:
+                    manifest = read_file.read()
+            except (IOError, OSError):
+                continue
+            if manifest.startswith(REPORT_MANIFEST_VERSION + "\n"):
+                manifests[str(job)] = manifest
+        connection = self._connect()
+        try:
+            with connection:
+                key = connection.execute("SELECT tree, tool, command FROM expected WHERE repo = ? AND branch = ?", \
+                    (repo, branch)).fetchone()
+                if key is None:
+                    return False
+                connection.execute("INSERT OR REPLACE INTO results VALUES (?, ?, ?, ?, ?, ?, ?, ?)", tuple(key) + \
+                    (repo, branch, job_records, json.dumps(manifests, sort_keys=True), seconds))
+        finally:
+            connection.close()
+        return True
+
+    # Sum up the recorded lookups
+    # @param repo: only report this repository if provided
+    # @return a list of dictionaries, one per repository
+    def stats(self, repo=None):
+        query = """
+            SELECT repo, COUNT(*), SUM(hit), SUM(CASE WHEN hit THEN builds ELSE 0 END),
+                SUM(CASE WHEN hit THEN seconds ELSE 0 END)
+            FROM lookups"""
+        parameters = []
+        if repo is not None:
+            query += " WHERE repo = ?"
+            parameters.append(repo)
+        query += " GROUP BY repo ORDER BY repo"
+        connection = self._connect()
+        try:
+            return [{"repo" : row[0], "lookups" : row[1], "hits" : row[2], "misses" : row[1] - row[2], \
+                "builds_saved" : row[3], "seconds_saved" : row[4]} for row in connection.execute(query, parameters)]
+        finally:
+            connection.close()
+
+    # @return a summary of the cache usage as string
+    def summary(self):
+        return "Build cache: {} hits, {} misses, {} CI builds and {:.1f} CI minutes saved".format( \
+            self.hits_, self.misses_, self.builds_saved_, self.seconds_saved_ / 60)
+
+    # Helper function to open the database, waiting for the other processes that write to it
+    def _connect(self):
+        return sqlite3.connect(self.db_path_, timeout=60)
+
+    # Helper function to write a file of the report directory atomically
+    # @param file_name: the name of the file
+    # @param content: the content as string
+    def _write_file(self, file_name, content):
+        fd, tmp_path = tempfile.mkstemp(prefix=".reuse", dir=self.report_dir_)
+        with os.fdopen(fd, 'w') as write_file:
+            write_file.write(content)
+        os.replace(tmp_path, os.path.join(self.report_dir_, file_name))
+
+if __name__ == "__main__":
+    usage = "usage: python %prog [options] REPORT_DIR"
+    parser = OptionParser(usage=usage)
+    parser.add_option("--repo", dest="repo", default=None,
+                    help="only report this repository")
+    (options, args) = parser.parse_args()
+    if len(args) != 1:
+        parser.error("expecting the report directory")
+
+    cache = BuildCache(args[0])
+    print("repo\tlookups\thits\tmisses\tbuilds_saved\tminutes_saved")
+    for entry in cache.stats(options.repo):
+        print("{}\t{}\t{}\t{}\t{}\t{:.1f}".format(entry["repo"], entry["lookups"], entry["hits"], \
+            entry["misses"], entry["builds_saved"], (entry["seconds_saved"] or 0.0) / 60))
+    exit(0)
@@ -0,0 +1,152 @@
+import os
+
+# the changes that can affect which tests an RTS tool selects
+RELEVANT_SUFFIXES = (".java",)
+RELEVANT_FILE_NAMES = ["pom.xml"]
+
+STRATEGIES = ["recent", "every", "time", "budget"]
+
+# Function that checks if a changed file can affect the test selection
+# @param path: the path of the file relative to the root of the repository
+# @return True if it is a Java source or test file or a pom.xml, False otherwise
+def is_relevant_path(path):
+    return path.endswith(RELEVANT_SUFFIXES) or os.path.basename(path) in RELEVANT_FILE_NAMES
+
+# Function that checks if a commit is informative for RTS, that is, building it
+# after its predecessor may run a different set of tests
+# @param commit: tuple of (SHA, commit time, list of (path, added lines, deleted lines))
+# @return True if the commit changes any relevant file, False otherwise
+def is_informative(commit):
+    return any(is_relevant_path(path) for path, _, _ in commit[2])
+
+# Strategy that selects the most recent commits
+# @param commits: list of commits, the most recent first
+# @param count: the number of commits to be selected
+# @return list of the selected commits, the most recent first
+def select_recent(commits, count):
+    return commits[:count]
+
+# Strategy that selects every k-th commit starting from the most recent one
+# @param commits: list of commits, the most recent first
+# @param k: the distance between the selected commits
+# @return list of the selected commits, the most recent first
+def select_every(commits, k):
+    return commits[::max(k, 1)]
+
+# Strategy that selects the most recent commit in each time bucket, the buckets
+# are counted backward from the commit time of the most recent commit
+# @param commits: list of commits, the most recent first
+# @param seconds: the length of a bucket in seconds
+# @return list of the selected commits, the most recent first
+def select_time_buckets(commits, seconds):
+    if len(commits) == 0:
+        return []
+    newest = commits[0][1]
+    buckets = set()
+    res = []
+    for commit in commits:
+        # commit times along the first parent are not necessarily monotonic
+        bucket = max(newest - commit[1], 0) // max(seconds, 1)
+        if bucket not in buckets:
+            buckets.add(bucket)
+            res.append(commit)
+    return res
+
+# Function that estimates the number of CI builds of an experiment. Each pushed branch is built:
+# every seed_{idx} and {tool}_seed_{idx} once, and every {tool}_{idx}-{idx-1} (one per tool between
+# two consecutive seeds) twice, before and after the increment
+# @param num_seeds: the number of seeds
+# @param num_tools: the number of RTS tools in the experiment
+# @return the number of CI builds
+def estimate_builds(num_seeds, num_tools):
+    if num_seeds == 0:
+        return 0
+    return num_seeds + num_tools * (num_seeds + 2 * (num_seeds - 1))
+
+# Function that computes the number of seeds affordable with a budget of CI builds, see estimate_builds
+# @param builds: the maximum number of CI builds
+# @param num_tools: the number of RTS tools in the experiment
+# @return the number of seeds, 0 if not even one experiment branch is affordable
+def seeds_for_budget(builds, num_tools):
+    # seeds + num_tools * (3 * seeds - 2) <= builds
+    seeds = (builds + 2 * num_tools) // (1 + 3 * num_tools)
+    return seeds if seeds >= 2 else 0
+
+# Strategy that spreads the affordable number of seeds evenly over the commits,
+# the most recent and the oldest commits are always selected
+# @param commits: list of commits, the most recent first
+# @param builds: the maximum number of CI builds
+# @param num_tools: the number of RTS tools in the experiment
+# @return list of the selected commits, the most recent first
+def select_budget(commits, builds, num_tools):
+    count = min(seeds_for_budget(builds, num_tools), len(commits))
+    if count < 2:
+        return commits[:count]
+    last = len(commits) - 1
+    return [commits[(i * last + (count - 1) // 2) // (count - 1)] for i in range(count)]
+
+# CommitSelector class selects the commits to be rolled out as seeds. The first-parent history
+# of a revision range is read with one "git log --numstat" into a diff-stat index, so that
+# ranges of thousands of commits are selected without running git per commit. Merge commits
+# are diffed against their first parent, which is the change between two consecutive seeds
+class CommitSelector:
+    # Constructor that instantiate the selector of a repository
+    # @param git_command: the GitCommand object of the repository
+    def __init__(self, git_command):
+        self.git_ = git_command
+        # list of (SHA, commit time, list of (path, added lines, deleted lines)), the most recent first
+        self.commits_ = []
+
+    # Read the first-parent history of a revision range, the history read before is discarded
+    # @param revision_range: the revision range, i.e. "master" or "v1.0..master"
+    # @param max_count: the maximum number of commits to be read, all commits if None
+    # @return the number of commits read
+    def load(self, revision_range="master", max_count=None):
+        # with -z, each header and each numstat record ends with NUL and the paths are not quoted:
+        #   "{SHA} {commit time}\0" and, if the commit changes any file, "\n" and "{added}\t{deleted}\t{path}\0" per file
+        command = ['git', 'log', '--first-parent', '-m', '--numstat', '--no-renames', '-z', '--format=%H %ct']
+        if max_count is not None:
+            command.append('--max-count={}'.format(max_count))
+        byteRes = self.git_.output(command + [revision_range, '--'])
+        self.commits_ = []
+        for record in byteRes.decode("utf-8", "surrogateescape").split("\0"):
+            fields = record.lstrip("\n").split("\t", 2)
+            if len(fields) == 3:
+                # binary files have "-" as line counts
+                self.commits_[-1][2].append((fields[2], int(fields[0]) if fields[0] != "-" else 0, \
+                    int(fields[1]) if fields[1] != "-" else 0))
+            elif record != "":
+                sha, commit_time = record.split()
+                self.commits_.append((sha, int(commit_time), []))
+        return len(self.commits_)
+
+    # Get the informative commits of the history read by load
+    # @return list of commits that change any relevant file, the most recent first
+    def informative_commits(self):
+        return [commit for commit in self.commits_ if is_informative(commit)]
+
+    # Select the commits to be rolled out as seeds
+    # @param strategy: one of STRATEGIES
+    # @param count: the maximum number of commits to be selected, no maximum if None
+    # @param every: the distance between the selected commits for the "every" strategy
+    # @param bucket_seconds: the length of a bucket in seconds for the "time" strategy
+    # @param builds: the maximum number of CI builds for the "budget" strategy
+    # @param num_tools: the number of RTS tools in the experiment for the "budget" strategy
+    # @param skip_uninformative: boolean to indicate if the commits that change no relevant file are skipped
+    # @return list of SHAs, the most recent first
+    def select(self, strategy, count=None, every=1, bucket_seconds=86400, builds=0, num_tools=1, \
+            skip_uninformative=True):
+        commits = self.informative_commits() if skip_uninformative else self.commits_
+        if strategy == "recent":
+            selected = select_recent(commits, count if count is not None else len(commits))
+        elif strategy == "every":
+            selected = select_every(commits, every)
+        elif strategy == "time":
+            selected = select_time_buckets(commits, bucket_seconds)
+        elif strategy == "budget":
+            selected = select_budget(commits, builds, num_tools)
+        else:
+            raise ValueError("Unknown commit selection strategy {}".format(strategy))
+        if count is not None:
+            selected = selected[:count]
+        return [commit[0] for commit in selected]
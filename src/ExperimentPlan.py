@@ -0,0 +1,153 @@
+import time
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+
+# the resource classes tasks are bounded by, each class has its own number of slots:
+#   * git: local git I/O, i.e. writing refs and objects
+#   * cpu: running the experiment setup, i.e. rewriting pom.xml files
+#   * network: talking to the remote, i.e. pushing
+#   * ci: builds run by CI once the branches are pushed, these tasks are only estimated, never run
+# The classes only bound how many tasks of each kind run at the same time. All tasks run on threads of
+# this process, so the Python code of the cpu tasks is serialized by the GIL and they only overlap in
+# the git subprocesses and the pom.xml splicing worker processes (see PomManager.add_plugins)
+RESOURCE_CLASSES = ["git", "cpu", "network", "ci"]
+
+PENDING = "pending"
+SUCCEEDED = "succeeded"
+FAILED = "failed"
+SKIPPED = "skipped"
+EXPECTED = "expected"
+
+# Task class is one step of the experiment on one repository
+class Task:
+    # Constructor that instantiate the Task object
+    # @param repo: the name of the repository the task belongs to
+    # @param step: the name of the step, unique within the repository
+    # @param resource: one of RESOURCE_CLASSES
+    # @param function: the function to run the step, returns True on success; None for ci tasks
+    # @param dependencies: list of Task objects that must succeed before the task runs
+    # @param branches: the number of branches the task creates
+    # @param builds: the number of CI builds the task stands for
+    def __init__(self, repo, step, resource, function=None, dependencies=None, branches=0, builds=0):
+        if resource not in RESOURCE_CLASSES:
+            raise ValueError("Unknown resource class {}".format(resource))
+        self.repo_ = repo
+        self.step_ = step
+        self.resource_ = resource
+        self.function_ = function
+        self.dependencies_ = dependencies or []
+        self.branches_ = branches
+        self.builds_ = builds
+        self.status_ = PENDING
+        self.elapsed_ = 0.0
+        self.error_ = None
+
+    # @return the name of the task as {repo}:{step}
+    def name(self):
+        return "{}:{}".format(self.repo_, self.step_)
+
+# ExperimentPlan class is the task DAG of an experiment over several repositories,
+# it is built up front so that the branches and CI builds are known before anything is written
+# (see describe for the dry-run), and then executed with a bounded number of tasks per resource class
+class ExperimentPlan:
+    # Constructor that instantiate an empty plan
+    def __init__(self):
+        self.tasks_ = []
+
+    # Add a task, its dependencies must have been added before
+    # @param task: the Task object
+    # @return the task
+    def add(self, task):
+        for dependency in task.dependencies_:
+            if dependency not in self.tasks_:
+                raise ValueError("{} depends on {} which is not in the plan".format(task.name(), dependency.name()))
+        self.tasks_.append(task)
+        return task
+
+    # @return list of the names of the repositories in the plan, in the order they are added
+    def repos(self):
+        res = []
+        for task in self.tasks_:
+            if task.repo_ not in res:
+                res.append(task.repo_)
+        return res
+
+    # Sum up the estimates of the plan
+    # @return dictionary that maps the name of each repository to a dictionary of
+    #    the number of tasks, branches and CI builds
+    def estimate(self):
+        res = {}
+        for task in self.tasks_:
+            entry = res.setdefault(task.repo_, {"tasks" : 0, "branches" : 0, "builds" : 0})
+            entry["tasks"] += task.resource_ != "ci"
+            entry["branches"] += task.branches_
+            entry["builds"] += task.builds_
+        return res
+
+    # Format the plan as a table of tasks followed by the estimate of each repository
+    # @return the description as string
+    def describe(self):
+        lines = ["{:<48} {:<8} {:>8} {:>7}  {}".format("task", "resource", "branches", "builds", "after")]
+        for task in self.tasks_:
+            lines.append("{:<48} {:<8} {:>8} {:>7}  {}".format(task.name(), task.resource_, task.branches_, \
+                task.builds_, ", ".join(dependency.step_ for dependency in task.dependencies_) or "-"))
+        total = {"tasks" : 0, "branches" : 0, "builds" : 0}
+        for repo, entry in self.estimate().items():
+            lines.append("{}: {} tasks, {} branches, {} CI builds".format(repo, entry["tasks"], entry["branches"], entry["builds"]))
+            for key in total:
+                total[key] += entry[key]
+        lines.append("Total: {} tasks, {} branches, {} CI builds".format(total["tasks"], total["branches"], total["builds"]))
+        return "\n".join(lines)
+
+    # Run the tasks, a task runs once all its dependencies succeeded and a slot of its resource class
+    # is free. The tasks that depend on a failed task are skipped, the other tasks carry on.
+    # The tasks run on a thread pool, see RESOURCE_CLASSES for what runs in parallel
+    # @param limits: dictionary that maps each resource class to the number of tasks of the class
+    #    run at the same time, 1 for the classes not in it
+    # @param progress: function called with each finished task, None for no progress report
+    # @return True if every task succeeded, False otherwise.
+    def execute(self, limits, progress=None):
+        running = {}
+        slots = {resource : max(limits.get(resource, 1), 1) for resource in RESOURCE_CLASSES}
+        with ThreadPoolExecutor(max_workers=sum(slots.values())) as executor:
+            while True:
+                for task in self.tasks_:
+                    if task.status_ != PENDING or task in running.values():
+                        continue
+                    statuses = [dependency.status_ for dependency in task.dependencies_]
+                    if any(status in [FAILED, SKIPPED] for status in statuses):
+                        task.status_ = SKIPPED
+                        if progress is not None:
+                            progress(task)
+                    elif all(status in [SUCCEEDED, EXPECTED] for status in statuses):
+                        if task.resource_ == "ci":
+                            # run by CI once the branches are pushed
+                            task.status_ = EXPECTED
+                            if progress is not None:
+                                progress(task)
+                        elif slots[task.resource_] > 0:
+                            slots[task.resource_] -= 1
+                            running[executor.submit(self._run_task, task)] = task
+                if len(running) == 0:
+                    if all(task.status_ != PENDING for task in self.tasks_):
+                        break
+                    # a ci task or a skipped task finished, the tasks after it are ready now
+                    continue
+                done, _ = wait(list(running), return_when=FIRST_COMPLETED)
+                for future in done:
+                    task = running.pop(future)
+                    slots[task.resource_] += 1
+                    if progress is not None:
+                        progress(task)
+        return all(task.status_ in [SUCCEEDED, EXPECTED] for task in self.tasks_)
+
+    # Helper function to run one task and keep its outcome
+    # @param task: the Task object
+    def _run_task(self, task):
+        start = time.time()
+        try:
+            task.status_ = SUCCEEDED if task.function_() else FAILED
+        except Exception as e:
+            task.status_ = FAILED
+            task.error_ = "{}: {}".format(type(e).__name__, e)
+            print("{}: {}".format(task.name(), task.error_))
+        task.elapsed_ = time.time() - start
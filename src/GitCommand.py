@@ -0,0 +1,249 @@
+import os
+import sys
+import json
+import time
+import threading
+import functools
+from subprocess import Popen, PIPE, CalledProcessError
+
+# the amount of stderr kept in each record
+MAX_STDERR_BYTES = 4096
+
+# GitCommandError is raised when a git command exits with non-zero status in fail-fast mode,
+# or when the output of a failed command is requested
+class GitCommandError(CalledProcessError):
+    def __init__(self, returncode, cmd, output=None, stderr=None, method=None, repo=None):
+        CalledProcessError.__init__(self, returncode, cmd, output, stderr)
+        self.method = method
+        self.repo = repo
+
+    def __str__(self):
+        message = "'{}' failed with exit status {}".format(format_command(self.cmd), self.returncode)
+        if self.method is not None:
+            message += " in {}".format(self.method)
+        if self.repo is not None:
+            message += " ({})".format(self.repo)
+        if self.stderr:
+            message += ": {}".format(self.stderr.decode("utf-8", "replace").strip())
+        return message
+
+# Function that renders a command as it would be typed in shell
+# @param command: the command as list of arguments or as string
+# @return the command as string
+def format_command(command):
+    if isinstance(command, str):
+        return command
+    return " ".join(command)
+
+# Function that checks if a record is a command that failed unexpectedly
+# @param record: the record kept by GitCommand
+# @return True if the command exited with non-zero status and it was checked, False otherwise
+def is_failure(record):
+    return record["kind"] == "command" and record["returncode"] != 0 and not record["expected"]
+
+# Decorator that marks the GitReplay method the git commands are run from,
+# the commands are attributed to the innermost traced method of the calling thread
+# and the method itself is recorded as a span when tracing is enabled
+# @param function: the method to be traced
+def traced(function):
+    @functools.wraps(function)
+    def wrapper(self, *args, **kwargs):
+        stack = GitCommand._method_stack()
+        stack.append(function.__name__)
+        start = time.time()
+        try:
+            return function(self, *args, **kwargs)
+        finally:
+            stack.pop()
+            GitCommand._record({"kind" : "method", "method" : function.__name__, \
+                "repo" : getattr(self, "repo_dir_", None), "start" : start, "duration" : time.time() - start})
+    return wrapper
+
+# GitCommand class is the single layer the git commands of GitReplay go through.
+# Each command is timed and its exit status and stderr are recorded, the records are shared
+# by all GitCommand objects of the process so that a whole run can be summarized or exported
+class GitCommand:
+    # boolean to indicate if a non-zero exit status raises GitCommandError, shared by all objects
+    fail_fast_ = False
+    # boolean to indicate if the records are kept, shared by all objects
+    tracing_ = False
+
+    records_ = []
+    records_lock_ = threading.Lock()
+    local_ = threading.local()
+
+    # Constructor that instantiate the command runner of a repository
+    # @param repo_dir: the directory the commands are run in unless specified otherwise
+    def __init__(self, repo_dir):
+        self.repo_dir_ = repo_dir
+
+    # Run a git command and record it
+    # @param command: the command as list of arguments, or as string if shell is True
+    # @param cwd: the directory to run the command in, repo_dir_ if None
+    # @param input: byte string to be written to stdin of the command
+    # @param capture: boolean to indicate if stdout is captured instead of being inherited
+    # @param shell: boolean to indicate if the command is run through shell
+    # @param check: boolean to indicate if a non-zero exit status is a failure,
+    #    it is False for the commands expected to fail, i.e. probing for a ref
+    # @param quiet: boolean to indicate if stderr is only recorded instead of also being printed
+    # @param env: dictionary of environment variables set for the command in addition to the inherited ones,
+    #    i.e. GIT_INDEX_FILE to work on a temporary index
+    # @return tuple of (exit status, stdout as byte string or None)
+    def run(self, command, cwd=None, input=None, capture=False, shell=False, check=True, quiet=False, env=None):
+        if cwd is None:
+            cwd = self.repo_dir_
+        if env is not None:
+            env = dict(os.environ, **env)
+        sys.stdout.flush()
+        start = time.time()
+        process = Popen(command, cwd=cwd, shell=shell, env=env, stdin=PIPE if input is not None else None, \
+            stdout=PIPE if capture else None, stderr=PIPE)
+        output, error = process.communicate(input)
+        duration = time.time() - start
+        # keep the messages of git visible as they would be without the layer
+        if len(error) > 0 and not quiet:
+            sys.stderr.write(error.decode("utf-8", "replace"))
+            sys.stderr.flush()
+        method = self._current_method()
+        GitCommand._record({"kind" : "command", "method" : method, "repo" : self.repo_dir_, \
+            "cwd" : cwd, "command" : format_command(command), "start" : start, "duration" : duration, \
+            "returncode" : process.returncode, "expected" : not check, "stderr" : error[-MAX_STDERR_BYTES:].decode("utf-8", "replace")})
+        if check and process.returncode != 0 and GitCommand.fail_fast_:
+            raise GitCommandError(process.returncode, command, output, error, method, self.repo_dir_)
+        return (process.returncode, output)
+
+    # Run a git command and return its exit status, see run
+    def call(self, command, cwd=None, input=None, shell=False, check=True, env=None):
+        return self.run(command, cwd=cwd, input=input, shell=shell, check=check, env=env)[0]
+
+    # Run a git command and return its stdout, a failure always raises GitCommandError
+    # as the output of a failed command can't be used, see run
+    def output(self, command, cwd=None, input=None, env=None):
+        returncode, output = self.run(command, cwd=cwd, input=input, capture=True, env=env)
+        if returncode != 0:
+            raise GitCommandError(returncode, command, output, None, self._current_method(), self.repo_dir_)
+        return output
+
+    # Start a long-running git command that is talked to through its stdin and stdout,
+    # i.e. "git cat-file --batch", the command is recorded when it is finished by finish
+    # @param command: the command as list of arguments
+    # @param cwd: the directory to run the command in, repo_dir_ if None
+    # @return the Popen object of the command
+    def start(self, command, cwd=None):
+        if cwd is None:
+            cwd = self.repo_dir_
+        process = Popen(command, cwd=cwd, stdin=PIPE, stdout=PIPE, stderr=PIPE)
+        process.start_ = time.time()
+        process.cwd_ = cwd
+        return process
+
+    # Close the stdin of a command started by start, wait for it and record it
+    # @param process: the Popen object returned by start
+    # @param check: boolean to indicate if a non-zero exit status is a failure, see run
+    # @return the exit status of the command
+    def finish(self, process, check=True):
+        process.stdin.close()
+        process.stdout.close()
+        error = process.stderr.read()
+        process.stderr.close()
+        process.wait()
+        if len(error) > 0:
+            sys.stderr.write(error.decode("utf-8", "replace"))
+            sys.stderr.flush()
+        method = self._current_method()
+        GitCommand._record({"kind" : "command", "method" : method, "repo" : self.repo_dir_, \
+            "cwd" : process.cwd_, "command" : format_command(process.args), "start" : process.start_, \
+            "duration" : time.time() - process.start_, "returncode" : process.returncode, "expected" : not check, \
+            "stderr" : error[-MAX_STDERR_BYTES:].decode("utf-8", "replace")})
+        if check and process.returncode != 0 and GitCommand.fail_fast_:
+            raise GitCommandError(process.returncode, process.args, None, error, method, self.repo_dir_)
+        return process.returncode
+
+    # Helper function to get the traced method the command is run from
+    # @return the name of the innermost traced method, None if there is no traced method
+    def _current_method(self):
+        stack = GitCommand._method_stack()
+        if len(stack) == 0:
+            return None
+        return stack[-1]
+
+    # Helper function to get the traced methods of the calling thread
+    # @return the list of method names, the innermost last
+    @staticmethod
+    def _method_stack():
+        if not hasattr(GitCommand.local_, "stack"):
+            GitCommand.local_.stack = []
+        return GitCommand.local_.stack
+
+    # Helper function to keep a record if tracing is enabled
+    # @param record: the dictionary to be kept
+    @staticmethod
+    def _record(record):
+        if not GitCommand.tracing_:
+            return
+        record["pid"] = os.getpid()
+        record["tid"] = threading.get_ident()
+        with GitCommand.records_lock_:
+            GitCommand.records_.append(record)
+
+    # Take the records kept so far, the kept records are cleared
+    # @return the list of records
+    @staticmethod
+    def drain_records():
+        with GitCommand.records_lock_:
+            records = GitCommand.records_
+            GitCommand.records_ = []
+        return records
+
+    # Aggregate the command records per repository and per method
+    # @param records: the list of records
+    # @return dictionary that maps (repo, method) to a dictionary of the number of commands,
+    #    the number of failed commands (not counting expected failures) and the total duration in seconds
+    @staticmethod
+    def aggregate(records):
+        res = {}
+        for record in records:
+            if record["kind"] != "command":
+                continue
+            entry = res.setdefault((record["repo"], record["method"]), {"calls" : 0, "failures" : 0, "seconds" : 0.0})
+            entry["calls"] += 1
+            entry["seconds"] += record["duration"]
+            if is_failure(record):
+                entry["failures"] += 1
+        return res
+
+    # Format the aggregation of the records as a table, the slowest first
+    # @param records: the list of records
+    # @return the table as string
+    @staticmethod
+    def summary(records):
+        lines = ["{:<40} {:>6} {:>8} {:>10}  {}".format("method", "calls", "failures", "seconds", "repository")]
+        aggregation = GitCommand.aggregate(records)
+        for (repo, method), entry in sorted(aggregation.items(), key=lambda item: -item[1]["seconds"]):
+            lines.append("{:<40} {:>6} {:>8} {:>10.3f}  {}".format(method or "-", entry["calls"], \
+                entry["failures"], entry["seconds"], repo))
+        for record in records:
+            if is_failure(record):
+                lines.append("failed ({}) in {}: {} {}".format(record["returncode"], record["method"] or "-", \
+                    record["command"], record["stderr"].strip()))
+        return "\n".join(lines)
+
+    # Export the records as Chrome trace events, viewable in chrome://tracing or Perfetto
+    # @param records: the list of records
+    # @param file_path: the path of the JSON file to be written
+    @staticmethod
+    def export_chrome_trace(records, file_path):
+        events = []
+        for record in records:
+            event = {"ph" : "X", "ts" : int(record["start"] * 1e6), "dur" : int(record["duration"] * 1e6), \
+                "pid" : record["pid"], "tid" : record["tid"], "cat" : record["kind"]}
+            if record["kind"] == "command":
+                event["name"] = " ".join(record["command"].split()[:2])
+                event["args"] = {"command" : record["command"], "method" : record["method"], "repo" : record["repo"], \
+                    "cwd" : record["cwd"], "returncode" : record["returncode"], "stderr" : record["stderr"]}
+            else:
+                event["name"] = record["method"]
+                event["args"] = {"repo" : record["repo"]}
+            events.append(event)
+        with open(file_path, 'w') as write_file:
+            json.dump({"traceEvents" : events, "displayTimeUnit" : "ms"}, write_file)
@@ -1,21 +1,60 @@
-import re
 import os
-from subprocess import call, check_output, STDOUT
+import shutil
+import tempfile
+from concurrent.futures import ThreadPoolExecutor
+
+from BuildCache import build_key
+from GitCommand import GitCommand
+from GitCommand import traced
+from ObjectReader import ObjectReader
+from ObjectReader import SYMLINK_MODE
+from ObjectReader import GITLINK_MODE
+from PipelineJournal import PipelineJournal
+from PipelineJournal import SEED_STEP
+from RefIndex import RefIndex
+from SetupManager.PomManager import IGNORED_DIRECTORIES
+from SetupManager.SetupCache import SETUP_INPUT_FILES
 
 # GitReplay class is a wrapper of the pipeline purposed in README to simplify the interaction
 # with git and CI
 class GitReplay:
+    # Semaphore shared by all GitReplay objects (possibly across processes) to bound
+    # the number of concurrent pushes to remote, no bound if it is None
+    push_semaphore_ = None
+
     # Constructor that instantiate the GitReplay object with respect to the provided directory
     # @param repo_dir: the path to directory that is a git directory
-    def __init__(self, repo_dir):
+    # @param defer_push: boolean to indicate if the pushes requested by the methods
+    #    are collected and sent only when flush_push is called
+    # @param setup_cache: the SetupCache object used to memoize the experiment setup functions,
+    #    the setup functions are always run if None
+    # @param journal: boolean to indicate if the progress is kept in .git/cireinteract/journal.json,
+    #    so that a rerun resumes the steps that didn't complete and only adds the branches of newer seeds
+    # @param build_cache: the BuildCache object consulted before the branches are pushed, the branches
+    #    whose content has been built before are not pushed and their results are reused; all branches are pushed if None
+    def __init__(self, repo_dir, defer_push=False, setup_cache=None, journal=False, build_cache=None):
         self.repo_dir_ = repo_dir
+        self.defer_push_ = defer_push
+        self.setup_cache_ = setup_cache
+        self.build_cache_ = build_cache
+        # full names of the refs created, updated or deleted by the pipeline but not pushed yet
+        self.pending_refs_ = set()
+        # index of the pipeline branches, loaded on first use
+        self.ref_index_ = None
+        # every git command is run through it so that the commands are timed and checked
+        self.git_ = GitCommand(repo_dir)
         if not self.is_git_dir():
             self.repo_dir_ = None
+        # the PipelineJournal object of the repository, None if the progress is not kept
+        self.journal_ = None
+        if journal and self.repo_dir_ is not None:
+            git_dir = self.git_.output(['git', 'rev-parse', '--absolute-git-dir']).decode("utf-8").strip()
+            self.journal_ = PipelineJournal(os.path.join(git_dir, "cireinteract", "journal.json"))
 
     # Check if the GitReplay object is referring to a git directory
     # @return True if it is a git directory, False otherwise
     def is_git_dir(self):
-        return (call(["git", "branch"], stderr=STDOUT, stdout=open(os.devnull, 'w'), cwd=self.repo_dir_) == 0)
+        return (self.git_.run(["git", "branch"], capture=True, check=False, quiet=True)[0] == 0)
 
     # Create additional branches that reflect individual commits
     # It will generate the following branches:
@@ -24,54 +63,375 @@ class GitReplay:
     # For instance, if there are two commits (commit_0, commit_1) to be rolled out,
     # it will result in two additional branches seed_0, seed_1
     # where the content of seed_0 is identical to commit_0 and seed_1 is identical to commit_1
-    # @param num_rollout: the maximum number of commits to be rolled out [TODO] check return value
+    # @param num_rollout: the maximum number of commits to be rolled out
+    # @param push: boolean to indicate if the created branches will be pushed to remote
+    # @param batch: boolean to indicate if the seeds will be created without checkout,
+    #    the target commits are resolved by one rev-list and all refs are written in one transaction
+    # @return True if the creation is success, False otherwise.
+    @traced
+    def build_seeds_from_recent_commits(self, num_rollout, push=True, batch=False):
+        if self.repo_dir_ is None:
+            print("Not a Git directory")
+            return False
+        if batch:
+            if not self._build_seeds_in_batch(num_rollout):
+                print("Failed to generate seeds")
+                return False
+        else:
+            for i in range(num_rollout):
+                self.git_.call(['git', 'checkout', 'master~{}'.format(i)])
+                self.git_.call(['git', 'checkout', '-b', 'seed_{}'.format(i)])
+            self._refresh_ref_index(["refs/heads/seed_{}".format(i) for i in range(num_rollout)])
+        print("Done generating seeds")
+        if self._push_refs(["refs/heads/seed_{}".format(i) for i in range(num_rollout)], push):
+            print("Done pushing seeds")
+        return True
+
+    # Create seed_{idx} branches at the given commits, seed_{idx} points to the {idx}-th commit,
+    # see build_seeds_from_recent_commits. The commits are expected to be along the first parent,
+    # the most recent first, i.e. the commits selected by CommitSelector.
+    # With the journal, the seeds of a previous run are kept: only the commits newer than
+    # the most recent seed are added, and the existing branches are shifted to make room for them
+    # @param commits: list of SHAs, the most recent first
     # @param push: boolean to indicate if the created branches will be pushed to remote
+    # @param batch: boolean to indicate if the seeds will be created without checkout,
+    #    all refs are written in one transaction
     # @return True if the creation is success, False otherwise.
-    def build_seeds_from_recent_commits(self, num_rollout, push=True):
+    @traced
+    def build_seeds_from_commits(self, commits, push=True, batch=False):
         if self.repo_dir_ is None:
             print("Not a Git directory")
             return False
-        for i in range(num_rollout):
-            call(['git', 'checkout', 'master~{}'.format(i)], cwd=self.repo_dir_)
-            call(['git', 'checkout', '-b', 'seed_{}'.format(i)], cwd=self.repo_dir_)
+        seeds = commits
+        if self.journal_ is not None:
+            seeds, commits = self._extend_seeds(commits)
+            if commits is None:
+                return False
+        if batch:
+            if not self._write_seeds(commits):
+                print("Failed to generate seeds")
+                return False
+        else:
+            for idx, commit in enumerate(commits):
+                self.git_.call(['git', 'checkout', commit])
+                self.git_.call(['git', 'checkout', '-b', 'seed_{}'.format(idx)])
+            self._refresh_ref_index(["refs/heads/seed_{}".format(idx) for idx in range(len(commits))])
+        if self.journal_ is not None:
+            self.journal_.set_seeds(seeds)
+            self._record_steps([(idx, SEED_STEP, "refs/heads/seed_{}".format(idx)) for idx in range(len(seeds))])
         print("Done generating seeds")
-        if push:
-            call(['git', 'push', '--all'], cwd=self.repo_dir_)
+        if self._push_refs(["refs/heads/seed_{}".format(idx) for idx in range(len(seeds))], push):
             print("Done pushing seeds")
         return True
 
+    # Helper function to reconcile the selected commits with the seeds in the journal.
+    # Only the selected commits newer than the most recent seed are added, they become
+    # seed_0 to seed_{n-1} and all existing branches are renamed from {idx} to {idx+n}
+    # in one ref transaction. The renamed branches are pushed as new branches, so extending
+    # is refused once an experiment branch has been incremented, either by proceed_commit_history
+    # (recorded in the journal) or by the responsive server (seen in the branches themselves)
+    # @param commits: list of SHAs, the most recent first
+    # @return tuple of (list of SHAs of all seeds, list of SHAs of the seeds to be created),
+    #    the latter is None if the seeds can't be extended
+    def _extend_seeds(self, commits):
+        existing = self.journal_.seeds()
+        ref_index = self._get_ref_index()
+        if any(ref_index.get("refs/heads/seed_{}".format(idx)) != sha for idx, sha in enumerate(existing)):
+            if len(existing) > 0:
+                print("The journal doesn't match the seed branches, starting over")
+            self.journal_.clear()
+            existing = []
+        if len(existing) == 0 or len(commits) == 0:
+            return (existing or commits, [] if existing else commits)
+        if self.git_.call(['git', 'merge-base', '--is-ancestor', existing[0], commits[0]], check=False) != 0:
+            print("The selected commits are not newer than seed_0, run with clean to start over")
+            return (existing, [])
+        newer = set(self.git_.output(['git', 'rev-list', '--first-parent', \
+            '{}..{}'.format(existing[0], commits[0])]).decode("utf-8").split())
+        added = [commit for commit in commits if commit in newer]
+        ignored = len([commit for commit in commits if commit not in newer and commit not in existing])
+        if ignored > 0:
+            print("Ignored {} selected commits older than seed_0, run with clean to select them".format(ignored))
+        if len(added) == 0:
+            print("Resuming {} seeds".format(len(existing)))
+            return (existing, [])
+        moved = ref_index.moved_increments()
+        if self.journal_.has_increments() or len(moved) > 0:
+            print("Can't add newer seeds after the experiment branches are incremented ({}), " \
+                "run with clean to start over".format(", ".join("{}_{}-{}".format(tag, idx, idx-1) for tag, idx in moved) \
+                or "see the journal"))
+            return (existing, None)
+        if not self._shift_branches(len(added)):
+            print("Failed to shift the branches")
+            return (existing, None)
+        print("Extending {} seeds with {} newer seeds".format(len(existing), len(added)))
+        return (added + existing, added)
+
+    # Helper function to rename every pipeline branch from {idx} to {idx+offset} in one ref transaction,
+    # the renamed branches are pushed with the next push
+    # @param offset: the number added to the index of every branch
+    # @return True if the branches are renamed, False otherwise.
+    def _shift_branches(self, offset):
+        ref_index = self._get_ref_index()
+        old_refs = ref_index.refs()
+        new_refs = ref_index.refs(offset)
+        commands = []
+        for ref in sorted(set(old_refs) | set(new_refs)):
+            if ref not in old_refs:
+                commands.append("create {} {}".format(ref, new_refs[ref]))
+            elif ref not in new_refs:
+                commands.append("delete {} {}".format(ref, old_refs[ref]))
+            elif old_refs[ref] != new_refs[ref]:
+                commands.append("update {} {} {}".format(ref, new_refs[ref], old_refs[ref]))
+        self._detach_head_from(old_refs)
+        if not self._update_refs(commands):
+            return False
+        self.reload_ref_index()
+        self.pending_refs_.update(old_refs)
+        self.pending_refs_.update(new_refs)
+        return True
+
+    # Helper function to detach HEAD at the same commit if it is on one of the branches,
+    # so that the branches can be updated or deleted without touching the working tree
+    # @param refs: the full ref names of the branches
+    def _detach_head_from(self, refs):
+        head = self.git_.run(['git', 'symbolic-ref', '-q', 'HEAD'], capture=True, check=False)[1]
+        if head.decode("utf-8").strip() in refs:
+            self.git_.call(['git', 'checkout', '-q', '--detach'])
+
+    # Helper function to forget the steps of deleted branches in the journal
+    # @param tags: the tags of the deleted branches
+    def _forget_steps(self, tags):
+        if self.journal_ is None:
+            return
+        for tag in tags:
+            self.journal_.forget(tag)
+        self.journal_.save()
+
+    # Helper function to record completed steps in the journal, keyed by the commit of the seed
+    # @param steps: list of (idx, step, full ref name) tuples, the current value of the ref is recorded
+    def _record_steps(self, steps):
+        if self.journal_ is None or len(steps) == 0:
+            return
+        ref_values = self._parse_ref_listing(self.git_.output(['git', 'for-each-ref', \
+            '--format=%(objectname) %(refname)'] + [ref for _, _, ref in steps]))
+        seeds = self.journal_.seeds()
+        for idx, step, ref in steps:
+            if idx < len(seeds) and ref in ref_values:
+                self.journal_.record(seeds[idx], step, ref_values[ref])
+        self.journal_.save()
+
+    # Helper function to create seed_{idx} branches without touching the working tree
+    # Commits are resolved along the first parent of master so that seed_{idx}
+    # points to the same commit as master~{idx}
+    # @param num_rollout: the maximum number of commits to be rolled out
+    # @return True if the refs are written, False otherwise.
+    def _build_seeds_in_batch(self, num_rollout):
+        byteRes = self.git_.output(['git', 'rev-list', '--first-parent', \
+            '--max-count={}'.format(num_rollout), 'master'])
+        return self._write_seeds(byteRes.decode("utf-8").split())
+
+    # Helper function to point seed_{idx} to the {idx}-th commit in one ref transaction
+    # @param commits: list of SHAs
+    # @return True if the refs are written, False otherwise.
+    def _write_seeds(self, commits):
+        if not self._update_refs(["update refs/heads/seed_{} {}".format(idx, commit) \
+            for idx, commit in enumerate(commits)]):
+            return False
+        if self.ref_index_ is not None:
+            for idx, commit in enumerate(commits):
+                self.ref_index_.set("refs/heads/seed_{}".format(idx), commit)
+        return True
+
     # Delete the branches that contain "tag" in their names
     # NOTE: Given that it only check the "tag" in name, please make sure
     #   that the original branches in the repository doesn't contain "seed"
     #   and other string used as tag in their names
     # @param tag: the string used to filter the branches to be deleted
+    # @param batch: boolean to indicate if the branches will be deleted without checkout,
+    #    see delete_all_branches_with_tags
     # @return True if the deletion is success, False otherwise.
-    def delete_all_branches_with_tag(self, tag="seed"):
+    @traced
+    def delete_all_branches_with_tag(self, tag="seed", batch=False):
+        if batch:
+            return self.delete_all_branches_with_tags([tag])
         if self.repo_dir_ is None:
             print("Not a Git directory")
             return False
         # make sure no seeds are checked out
-        call(['git', 'checkout', 'master'], cwd=self.repo_dir_)
-        call(["git push origin --delete $(git for-each-ref --format='%(refname:short)' refs/heads/{}*)".format(tag)], cwd=self.repo_dir_, shell=True)
-        call(["git branch -D $(git for-each-ref --format='%(refname:short)' refs/heads/{}*)".format(tag)], cwd=self.repo_dir_, shell=True)
+        self.git_.call(['git', 'checkout', 'master'])
+        # both fail if there is no branch with the tag, which is fine for cleaning up
+        self._push(["git push origin --delete $(git for-each-ref --format='%(refname:short)' refs/heads/{}*)".format(tag)], shell=True, check=False)
+        self.git_.call(["git branch -D $(git for-each-ref --format='%(refname:short)' refs/heads/{}*)".format(tag)], shell=True, check=False)
+        # the deleted branches are not known here, load the index again on next use
+        self.ref_index_ = None
+        self._forget_steps([tag])
         print("Done deleting seeds")
         return True
 
+    # Delete the branches that contain any of the "tags" in their names
+    # with one ref listing, one ref transaction and one push for all tags.
+    # The working tree is never touched, if HEAD is on a branch to be deleted,
+    # HEAD is detached at the same commit instead of checking out master
+    # @param tags: the list of strings used to filter the branches to be deleted
+    # @param remote: boolean to indicate if the branches will also be deleted from remote
+    # @return True if the deletion is success, False otherwise.
+    @traced
+    def delete_all_branches_with_tags(self, tags, remote=True):
+        if self.repo_dir_ is None:
+            print("Not a Git directory")
+            return False
+        byteRes = self.git_.output(['git', 'for-each-ref', '--format=%(refname)'] + \
+            ['refs/heads/{}*'.format(tag) for tag in tags])
+        refs = byteRes.decode("utf-8").split()
+        if len(refs) == 0:
+            self._forget_steps(tags)
+            print("No branches to delete")
+            return True
+        self._detach_head_from(refs)
+        if not self._update_refs(["delete {}".format(ref) for ref in refs]):
+            print("Failed to delete branches")
+            return False
+        if self.ref_index_ is not None:
+            for ref in refs:
+                self.ref_index_.remove(ref)
+        self._forget_steps(tags)
+        print("Done deleting {} branches".format(len(refs)))
+        if remote:
+            self._push_refs(refs)
+        return True
+
+    # Push the pending refs to remote in one atomic push with explicit refspecs.
+    # Refs whose remote value already matches the local value are skipped,
+    # refs that no longer exist locally are deleted from remote. Each ref is
+    # pushed with a lease on the remote value observed so that recreated branches
+    # can be updated without overwriting changes made by others in the meantime.
+    # With the build cache, the branches whose builds are reused are not pushed (see _reuse_builds)
+    # @param remote: the remote to push to
+    # @return True if the push is success or there is nothing to push, False otherwise.
+    @traced
+    def flush_push(self, remote="origin"):
+        if self.repo_dir_ is None:
+            print("Not a Git directory")
+            return False
+        if len(self.pending_refs_) == 0:
+            return True
+        local_values = self._parse_ref_listing(self.git_.output(['git', 'for-each-ref', \
+            '--format=%(objectname) %(refname)', 'refs/heads']))
+        remote_values = self._parse_ref_listing(self.git_.output(['git', 'ls-remote', '--heads', remote]))
+        refs = [ref for ref in sorted(self.pending_refs_) if local_values.get(ref) != remote_values.get(ref)]
+        reused = set()
+        if self.build_cache_ is not None:
+            reused = self._reuse_builds([ref for ref in refs if ref in local_values])
+        leases = []
+        refspecs = []
+        for ref in refs:
+            if ref in reused and ref not in remote_values:
+                continue
+            leases.append("--force-with-lease={}:{}".format(ref, remote_values.get(ref, "")))
+            # the stale remote value of a reused branch is deleted so that the remote only has what is built
+            if ref in local_values and ref not in reused:
+                refspecs.append("{}:{}".format(ref, ref))
+            else:
+                refspecs.append(":{}".format(ref))
+        if len(refspecs) == 0:
+            print("Remote is up to date")
+            self.pending_refs_.clear()
+            return True
+        if self._push(['git', 'push', '--atomic', remote] + leases + refspecs) != 0:
+            print("Failed to push {} refs".format(len(refspecs)))
+            return False
+        print("Done pushing {} refs".format(len(refspecs)))
+        self.pending_refs_.clear()
+        return True
+
+    # Helper function to consult the build cache about the branches to be pushed, see BuildCache.reuse
+    # @param refs: list of full ref names of the branches to be pushed
+    # @return the set of full ref names whose builds are reused, they don't need to be pushed
+    def _reuse_builds(self, refs):
+        if len(refs) == 0:
+            return set()
+        heads = {}
+        for line in self.git_.output(['git', 'for-each-ref', '--format=%(refname) %(objectname) %(tree)', \
+            'refs/heads']).decode("utf-8").splitlines():
+            refname, commit, tree = line.split()
+            heads[refname[len("refs/heads/"):]] = (commit, tree)
+        repo = os.path.basename(os.path.normpath(self.repo_dir_))
+        reused = set()
+        for ref in refs:
+            branch = ref[len("refs/heads/"):]
+            key = build_key(branch, heads)
+            if key is not None and self.build_cache_.reuse(repo, branch, key):
+                reused.add(ref)
+        if len(reused) > 0:
+            print("Reused the builds of {} branches".format(len(reused)))
+        return reused
+
+    # Helper function to record the refs to be pushed, the refs are pushed
+    # right away if push is requested and pushes are not deferred
+    # @param refs: list of full ref names that are created, updated or deleted
+    # @param push: boolean to indicate if the refs should be pushed to remote
+    # @return True if the refs are pushed, False if the push is deferred or failed.
+    def _push_refs(self, refs, push=True):
+        self.pending_refs_.update(refs)
+        if not push or self.defer_push_:
+            return False
+        return self.flush_push()
+
+    # Helper function to parse the output of "git for-each-ref" or "git ls-remote"
+    # @param byteRes: the output as byte string with "{sha} {refname}" on each line
+    # @return dictionary that maps full ref name to sha
+    def _parse_ref_listing(self, byteRes):
+        res = {}
+        for line in byteRes.decode("utf-8").splitlines():
+            fields = line.split()
+            if len(fields) == 2:
+                res[fields[1]] = fields[0]
+        return res
+
+    # Helper function to run a push command, the push waits for push_semaphore_
+    # if it is set so that the number of concurrent pushes is bounded
+    # @param push_command: the push command to be run
+    # @param shell: boolean to indicate if the command is run through shell
+    # @param check: boolean to indicate if a failed push is a failure, see GitCommand.run
+    # @return the return code of the push command
+    def _push(self, push_command, shell=False, check=True):
+        if GitReplay.push_semaphore_ is None:
+            return self.git_.call(push_command, shell=shell, check=check)
+        with GitReplay.push_semaphore_:
+            return self.git_.call(push_command, shell=shell, check=check)
+
+    # Helper function to apply ref updates in one transaction via "git update-ref --stdin",
+    # either all of the commands are applied or none of them is
+    # @param commands: list of update-ref commands, i.e. "update refs/heads/seed_0 {sha}"
+    # @return True if the transaction is committed, False otherwise.
+    def _update_refs(self, commands):
+        if len(commands) == 0:
+            return True
+        return self.git_.call(['git', 'update-ref', '--stdin'], input="\n".join(commands + [""]).encode("utf-8")) == 0
+
     # Obtain a list of seed index in the repository
-    # NOTE: Given that it only check substring "seed_{idx}" in name, please make sure
+    # NOTE: Given that it only check "seed_{idx}" as name, please make sure
     #   that the original branches in the repository don't have name in this format
     # @return a list of the seed index in integer
     def get_existing_seed(self):
         if self.repo_dir_ is None:
             print("Not a Git directory")
             return []
-        # check_output returns byte string
-        byteRes = check_output(["git", "for-each-ref", r"--format='%(refname:short)'", r"refs/heads/seed*"], cwd=self.repo_dir_)
-        seed_index_pattern = re.compile(r'seed_(\d+)')
-        return [int(x) for x in seed_index_pattern.findall(byteRes.decode("utf-8"))]
+        return self._get_ref_index().seeds()
+
+    # Obtain a list of tags that have experiment branches in the repository
+    # NOTE: Given that it only check "{tag}_seed_{idx}" as name, please make sure
+    #   that the original branches in the repository don't have name in this format
+    # @return a sorted list of the tags
+    def get_experiment_tags(self):
+        if self.repo_dir_ is None:
+            print("Not a Git directory")
+            return []
+        return self._get_ref_index().tags()
 
     # Obtain a list of index of seed with "tag" in the repository
-    # NOTE: Given that it only check substring "{tag}_seed_{idx}" in name, please make sure
+    # NOTE: Given that it only check "{tag}_seed_{idx}" as name, please make sure
     #   that the original branches in the repository don't have name in this format
     # @param tag: the string used to filter the branches to be selected
     # @return a list of the seed index in integer
@@ -79,13 +439,10 @@ class GitReplay:
         if self.repo_dir_ is None:
             print("Not a Git directory")
             return []
-        # check_output returns byte string
-        byteRes = check_output(["git", "for-each-ref", r"--format='%(refname:short)'", r"refs/heads/{}_seed*".format(tag)], cwd=self.repo_dir_)
-        seed_index_pattern = re.compile(r'.*seed_(\d+)')
-        return [int(x) for x in seed_index_pattern.findall(byteRes.decode("utf-8"))]
+        return self._get_ref_index().tool_seeds(tag)
 
     # Obtain a list of index of experiment branches with "tag" in the repository
-    # NOTE: Given that it only check substring "{tag}_{idx}-{idx-1}" in name, please make sure
+    # NOTE: Given that it only check "{tag}_{idx}-{idx-1}" as name, please make sure
     #   that the original branches in the repository don't have name in this format
     # @param tag: the string used to filter the branches to be selected
     # @return a list of the index in integer
@@ -93,10 +450,37 @@ class GitReplay:
         if self.repo_dir_ is None:
             print("Not a Git directory")
             return []
-        # check_output returns byte string
-        byteRes = check_output(["git", "for-each-ref", r"--format='%(refname:short)'", r"refs/heads/{}*".format(tag)], cwd=self.repo_dir_)
-        seed_index_pattern = re.compile(r'{}_(\d+)-\d+'.format(tag))
-        return [int(x) for x in seed_index_pattern.findall(byteRes.decode("utf-8"))]
+        return self._get_ref_index().increments(tag)
+
+    # Load the index of the pipeline branches again with one for-each-ref,
+    # needed only if the branches are modified outside of this GitReplay object
+    @traced
+    def reload_ref_index(self):
+        ref_index = RefIndex()
+        ref_index.load(self.git_.output(['git', 'for-each-ref', '--format=%(objectname) %(refname)', \
+            'refs/heads']))
+        self.ref_index_ = ref_index
+
+    # Helper function to get the index of the pipeline branches, it is loaded on first use
+    # @return the RefIndex object of the repository
+    def _get_ref_index(self):
+        if self.ref_index_ is None:
+            self.reload_ref_index()
+        return self.ref_index_
+
+    # Helper function to update the index after the given branches are modified,
+    # the current values of all the branches are read with one for-each-ref
+    # @param refs: list of full ref names that are created, updated or deleted
+    def _refresh_ref_index(self, refs):
+        if self.ref_index_ is None or len(refs) == 0:
+            return
+        ref_values = self._parse_ref_listing(self.git_.output(['git', 'for-each-ref', \
+            '--format=%(objectname) %(refname)'] + refs))
+        for ref in refs:
+            if ref in ref_values:
+                self.ref_index_.set(ref, ref_values[ref])
+            else:
+                self.ref_index_.remove(ref)
 
     # Create the experiment branches for generating RTS results later on
     # The following branches will be generated:
@@ -110,29 +494,290 @@ class GitReplay:
     # @param experiment_setup_function: the function to be called to set up the experiment branches,
     #    for instance, setting up the RTS tool as Maven plugin and modifying the Travis configuration
     # @param push: boolean to indicate if the created branches will be pushed to remote
+    # @param fast_import: boolean to indicate if the branches will be created without any checkout,
+    #    see _materialize_experiment_branches
+    # With the journal, the branches completed by a previous run are kept and the creation
+    # continues from the most recent {tag}_seed_{idx} that is complete, see _resume_experiment_branches
     # @return True if the creation is success, False otherwise.
-    def create_experiment_branches_with_tag(self, tag, seed_index_list, experiment_setup_function=None, push=True):
+    @traced
+    def create_experiment_branches_with_tag(self, tag, seed_index_list, experiment_setup_function=None, push=True, \
+        fast_import=False):
+        if self.repo_dir_ is None:
+            print("Not a Git directory")
+            return False
+        base = None
+        refs = []
+        if self.journal_ is not None:
+            seed_index_list, base, refs = self._resume_experiment_branches(tag, seed_index_list)
+        if len(seed_index_list) == 0:
+            print("Experiment branches are up to date")
+        elif fast_import:
+            created = self._materialize_experiment_branches(tag, seed_index_list, experiment_setup_function, base)
+            if created is None:
+                print("Failed to generate experiment branches")
+                return False
+            self._record_steps(self._experiment_steps(tag, created))
+            refs += created
+        else:
+            refs += self._create_experiment_branches(tag, seed_index_list, experiment_setup_function, self.repo_dir_, base)
+        self._refresh_ref_index(refs)
+        print("Done generating experiment branches")
+        if self._push_refs(refs, push):
+            print("Done pushing experiment branches")
+        return True
+
+    # Create the experiment branches for several tags concurrently, see create_experiment_branches_with_tag.
+    # Each tag gets its own git worktree so that the checkouts, merges and setup commits
+    # of different tags don't interfere with each other, the worktrees are removed afterwards
+    # and the working directory of the repository is never touched
+    # @param tag_setup_functions: list of (tag, experiment_setup_function) pairs
+    # @param seed_index_list: the list of index to create the experiment branches from,
+    #    note that the index should be valid (the seed_{idx} branch exists)
+    # @param push: boolean to indicate if the created branches will be pushed to remote
+    # @param max_workers: the maximum number of tags to be processed at the same time,
+    #    all tags are processed at the same time if None
+    # @return True if the creation is success for all tags, False otherwise.
+    @traced
+    def create_experiment_branches_with_tags(self, tag_setup_functions, seed_index_list, push=True, max_workers=None):
         if self.repo_dir_ is None:
             print("Not a Git directory")
             return False
-        # using merely max idx to start the creation assumes that no seeds are missing
-        call(['git', 'checkout', 'seed_{}'.format(max(seed_index_list))], cwd=self.repo_dir_)
+        if len(tag_setup_functions) == 0:
+            return True
+        worktrees = []
+        refs = []
+        pending = []
+        for tag, experiment_setup_function in tag_setup_functions:
+            base = None
+            tag_index_list = seed_index_list
+            if self.journal_ is not None:
+                tag_index_list, base, tag_refs = self._resume_experiment_branches(tag, seed_index_list)
+                refs += tag_refs
+            if len(tag_index_list) > 0:
+                pending.append((tag, experiment_setup_function, tag_index_list, base))
+        try:
+            for tag, _, tag_index_list, base in pending:
+                work_dir = tempfile.mkdtemp(prefix="{}_".format(tag))
+                worktrees.append(work_dir)
+                if self.git_.call(['git', 'worktree', 'add', '--detach', work_dir, \
+                    base or 'seed_{}'.format(max(tag_index_list))]) != 0:
+                    print("Failed to create worktree for {}".format(tag))
+                    return False
+            with ThreadPoolExecutor(max_workers=max_workers or max(len(pending), 1)) as executor:
+                futures = [executor.submit(self._create_experiment_branches, \
+                    tag, tag_index_list, experiment_setup_function, work_dir, base) \
+                    for (tag, experiment_setup_function, tag_index_list, base), work_dir in zip(pending, worktrees)]
+                for future in futures:
+                    refs += future.result()
+        finally:
+            for work_dir in worktrees:
+                self.git_.call(['git', 'worktree', 'remove', '--force', work_dir], check=False)
+                shutil.rmtree(work_dir, ignore_errors=True)
+            self.git_.call(['git', 'worktree', 'prune'], check=False)
+            self._refresh_ref_index(refs)
+        print("Done generating experiment branches for {}".format(", ".join(tag for tag, _ in tag_setup_functions)))
+        if self._push_refs(refs, push):
+            print("Done pushing experiment branches")
+        return True
+
+    # Helper function to create the experiment branches of one tag in the given working directory
+    # @param tag: the tag used for identifying the generated branches
+    # @param seed_index_list: the list of index to create the experiment branches from
+    # @param experiment_setup_function: the function to be called to set up the experiment branches
+    # @param work_dir: the working directory of the repository, either repo_dir_ or one of its worktrees
+    # @param base: the branch to continue from, i.e. {tag}_seed_{max+1} when resuming, seed_{max} if None
+    # @return list of full ref names of the created branches
+    @traced
+    def _create_experiment_branches(self, tag, seed_index_list, experiment_setup_function, work_dir, base=None):
+        refs = []
+        # using merely max idx to start the creation assumes that no seeds are missing,
+        # detach so that the same seed can be the starting point in several worktrees
+        self.git_.call(['git', 'checkout', '--detach', base or 'seed_{}'.format(max(seed_index_list))], cwd=work_dir)
         # propagate the rest
         for idx in reversed(range(max(seed_index_list)+1)):
-            call(['git', 'checkout', '-b', '{}_seed_{}'.format(tag, idx)], cwd=self.repo_dir_)
-            call(['git', 'merge', '--strategy-option=theirs', \
-                '-m', "Recent {} commit".format(idx), 'seed_{}'.format(idx)], cwd=self.repo_dir_)
-            #call(['git', 'checkout', 'seed_{}'.format(idx)], cwd=self.repo_dir_)
-            self._perform_setup(tag, experiment_setup_function)
+            # -B as the branch may be left over by a run that didn't complete
+            self.git_.call(['git', 'checkout', '-B', '{}_seed_{}'.format(tag, idx)], cwd=work_dir)
+            refs.append('refs/heads/{}_seed_{}'.format(tag, idx))
+            self.git_.call(['git', 'merge', '--strategy-option=theirs', \
+                '-m', "Recent {} commit".format(idx), 'seed_{}'.format(idx)], cwd=work_dir)
+            #self.git_.call(['git', 'checkout', 'seed_{}'.format(idx)], cwd=work_dir)
+            self._perform_setup(tag, experiment_setup_function, work_dir=work_dir)
             # idx 0 is the seed of the most recent commit
             if idx != 0:
-                call(['git', 'checkout', '-b', '{}_{}-{}'.format(tag, idx, idx-1)], cwd=self.repo_dir_)
+                self.git_.call(['git', 'checkout', '-B', '{}_{}-{}'.format(tag, idx, idx-1)], cwd=work_dir)
+                refs.append('refs/heads/{}_{}-{}'.format(tag, idx, idx-1))
                 #self._generate_empty_commit('{}_{}-{}'.format(tag, idx, idx-1))
-        print("Done generating experiment branches")
-        if push:
-            call(['git', 'push', '--all'], cwd=self.repo_dir_)
-            print("Done pushing experiment branches")
-        return True
+            # a run that stops here resumes from the next seed
+            self._record_steps(self._experiment_steps(tag, refs[-2:] if idx != 0 else refs[-1:]))
+        return refs
+
+    # Helper function to find the experiment branches of one tag that a previous run completed.
+    # The {tag}_seed_{idx} branches form a chain from the oldest seed, so the creation continues
+    # from the most recent {tag}_seed_{idx} whose chain is complete. The missing {tag}_{idx}-{idx-1}
+    # branches of complete seeds (i.e. of the seed that was the most recent before extending)
+    # are pointed to their {tag}_seed_{idx} right away
+    # @param tag: the tag used for identifying the generated branches
+    # @param seed_index_list: the list of index to create the experiment branches from
+    # @return tuple of (list of index still to be created, the branch to continue from or None,
+    #    list of full ref names of the branches pointed)
+    def _resume_experiment_branches(self, tag, seed_index_list):
+        if len(seed_index_list) == 0:
+            return ([], None, [])
+        seeds = self.journal_.seeds()
+        ref_index = self._get_ref_index()
+        def is_done(idx, step, ref):
+            value = ref_index.get(ref)
+            return idx < len(seeds) and value is not None and value in \
+                [self.journal_.get(seeds[idx], step), self.journal_.get(seeds[idx], "{}_increment".format(tag))]
+        top = max(seed_index_list)
+        complete = top + 1
+        while complete > 0 and is_done(complete - 1, "{}_seed".format(tag), \
+            "refs/heads/{}_seed_{}".format(tag, complete - 1)):
+            complete -= 1
+        commands = []
+        steps = []
+        for idx in range(max(complete, 1), top + 1):
+            ref = "refs/heads/{}_{}-{}".format(tag, idx, idx-1)
+            if not is_done(idx, "{}_branch".format(tag), ref):
+                commands.append("update {} {}".format(ref, ref_index.get("refs/heads/{}_seed_{}".format(tag, idx))))
+                steps.append((idx, "{}_branch".format(tag), ref))
+        if not self._update_refs(commands):
+            print("Failed to update experiment branches")
+            steps = []
+        self._refresh_ref_index([ref for _, _, ref in steps])
+        self._record_steps(steps)
+        if 0 < complete <= top:
+            print("Resuming {} experiment branches from {}_seed_{}".format(tag, tag, complete))
+        return (list(range(complete)), "{}_seed_{}".format(tag, complete) if complete <= top else None, \
+            [ref for _, _, ref in steps])
+
+    # Helper function to name the journal steps of the experiment branches
+    # @param tag: the tag used for identifying the generated branches
+    # @param refs: list of full ref names of {tag}_seed_{idx} and {tag}_{idx}-{idx-1} branches
+    # @return list of (idx, step, full ref name) tuples, see _record_steps
+    def _experiment_steps(self, tag, refs):
+        steps = []
+        for ref in refs:
+            name = ref[len("refs/heads/{}_".format(tag)):]
+            if name.startswith("seed_"):
+                steps.append((int(name[len("seed_"):]), "{}_seed".format(tag), ref))
+            else:
+                steps.append((int(name.split("-")[0]), "{}_branch".format(tag), ref))
+        return steps
+
+    # Helper function to create the experiment branches of one tag without any checkout.
+    # Only the pom.xml files and the other setup input files of each seed are read, all through
+    # one ObjectReader, and written to a scratch directory where the setup function is run.
+    # The commits and branches are then written with one "git fast-import" stream, resulting
+    # in the same branch structure as _create_experiment_branches:
+    #   * {tag}_seed_{max} is a commit on top of seed_{max} with the setup applied
+    #   * {tag}_seed_{idx} is a merge of {tag}_seed_{idx+1} and seed_{idx} whose content is
+    #       seed_{idx} with the setup applied (the merge and the setup are one commit here)
+    #   * {tag}_{idx}-{idx-1} points to the same commit as {tag}_seed_{idx}
+    # The content is not always the same: the setup is run on the pristine files of each seed, while
+    # the checkout merges seed_{idx} into the set up {tag}_seed_{idx+1} first. A file the seed deletes
+    # but the setup modified survives that merge as a modify/delete conflict, and a change of the seed
+    # next to a spliced plugin (i.e. declaring the same plugin) keeps both, so the two are not interchangeable
+    # @param tag: the tag used for identifying the generated branches
+    # @param seed_index_list: the list of index to create the experiment branches from
+    # @param experiment_setup_function: the function to be called to set up the experiment branches
+    # @param base: the branch to continue from, i.e. {tag}_seed_{max+1} when resuming, seed_{max} if None
+    # @return list of full ref names of the created branches, None if fast-import failed
+    @traced
+    def _materialize_experiment_branches(self, tag, seed_index_list, experiment_setup_function, base=None):
+        seeds = {}
+        for line in self.git_.output(['git', 'for-each-ref', '--format=%(refname) %(objectname) %(tree)'] + \
+            ['refs/heads/seed_{}'.format(idx) for idx in range(max(seed_index_list)+1)]).decode("utf-8").splitlines():
+            refname, commit, tree = line.split()
+            seeds[refname] = (commit, tree)
+        committer = self.git_.output(['git', 'var', 'GIT_COMMITTER_IDENT']).decode("utf-8").strip()
+        reader = ObjectReader(self.git_)
+        scratch_dir = tempfile.mkdtemp(prefix="{}_setup_".format(tag))
+        stream = []
+        refs = []
+        try:
+            # the commit the next experiment seed is based on, either a SHA or a fast-import mark,
+            # and if it has the same content as the previous seed
+            parent = None
+            parent_is_seed = False
+            if base is not None:
+                parent = self._get_ref_index().get("refs/heads/{}".format(base))
+            for idx in reversed(range(max(seed_index_list)+1)):
+                commit, tree = seeds["refs/heads/seed_{}".format(idx)]
+                input_files = reader.find_files(tree, ["pom.xml"], SETUP_INPUT_FILES, IGNORED_DIRECTORIES)
+                modified_files = self._setup_in_scratch(experiment_setup_function, reader, input_files, scratch_dir)
+                if len(modified_files) == 0 and (parent is None or parent_is_seed):
+                    # nothing set up so far, the same as a fast-forward merge without setup commit
+                    stream.append("reset refs/heads/{}_seed_{}\nfrom {}\n\n".format(tag, idx, commit).encode("utf-8"))
+                    parent = commit
+                    parent_is_seed = True
+                else:
+                    mark = ":{}".format(idx + 1)
+                    if parent is None:
+                        message = "Modified for {}".format(tag)
+                        parents = "from {}\n".format(commit)
+                    else:
+                        message = "Recent {} commit\n\nModified for {}".format(idx, tag)
+                        # start from the content of the seed rather than the content of the first parent
+                        parents = "from {}\nmerge {}\nM 040000 {} \"\"\n".format(parent, commit, tree)
+                    message = message.encode("utf-8")
+                    stream.append("commit refs/heads/{}_seed_{}\nmark {}\ncommitter {}\ndata {}\n".format( \
+                        tag, idx, mark, committer, len(message)).encode("utf-8") + message + b"\n" + parents.encode("utf-8"))
+                    for path, (mode, content) in sorted(modified_files.items()):
+                        stream.append("M {} inline {}\ndata {}\n".format(mode, path, len(content)).encode("utf-8") + \
+                            content + b"\n")
+                    stream.append(b"\n")
+                    parent = mark
+                    parent_is_seed = False
+                refs.append("refs/heads/{}_seed_{}".format(tag, idx))
+                # idx 0 is the seed of the most recent commit
+                if idx != 0:
+                    stream.append("reset refs/heads/{}_{}-{}\nfrom {}\n\n".format(tag, idx, idx-1, parent).encode("utf-8"))
+                    refs.append("refs/heads/{}_{}-{}".format(tag, idx, idx-1))
+        finally:
+            reader.close()
+            shutil.rmtree(scratch_dir, ignore_errors=True)
+        stream.append(b"done\n")
+        # fast-import moves the branches without updating the index and the working tree of a checked out one
+        self._detach_head_from(refs)
+        if self.git_.call(['git', 'fast-import', '--quiet', '--force', '--done'], input=b"".join(stream)) != 0:
+            return None
+        return refs
+
+    # Helper function to run the setup on the setup input files of a seed, the files are
+    # written to the scratch directory (emptied first) and the setup function is run there.
+    # Symbolic links are left out, the files they point to are set up on their own
+    # @param experiment_setup_function: the function to be called to set up the experiment branches
+    # @param reader: the ObjectReader to read the content of the files with
+    # @param input_files: dictionary that maps the path of the files to (mode, blob SHA)
+    # @param scratch_dir: the directory to run the setup function in
+    # @return dictionary that maps the path of the files changed by the setup to (mode, new content)
+    def _setup_in_scratch(self, experiment_setup_function, reader, input_files, scratch_dir):
+        if experiment_setup_function is None:
+            return {}
+        shutil.rmtree(scratch_dir)
+        os.makedirs(scratch_dir)
+        original_contents = {}
+        for path, (mode, sha) in input_files.items():
+            if mode == SYMLINK_MODE:
+                continue
+            original_contents[path] = reader.read(sha)[2]
+            file_path = os.path.join(scratch_dir, path)
+            os.makedirs(os.path.dirname(file_path), exist_ok=True)
+            with open(file_path, 'wb') as write_file:
+                write_file.write(original_contents[path])
+        if self.setup_cache_ is not None and self.setup_cache_.is_cacheable(experiment_setup_function):
+            modified_files = self.setup_cache_.run(experiment_setup_function, scratch_dir)
+        else:
+            modified_files = experiment_setup_function(scratch_dir)
+        res = {}
+        for modified_file in modified_files:
+            path = os.path.relpath(os.path.join(scratch_dir, modified_file), scratch_dir).replace(os.sep, "/")
+            with open(os.path.join(scratch_dir, path), 'rb') as read_file:
+                content = read_file.read()
+            if content != original_contents.get(path):
+                res[path] = (input_files.get(path, ("100644", None))[0], content)
+        return res
 
     # The helper function to call the experiment_setup_function
     # and commit the changes via git
@@ -141,68 +786,236 @@ class GitReplay:
     # @param skip_ci: boolean to specify if this commit will trigger CI,
     #    note that it only works for Travis CI for now because the skip string is hard-coded
     #    to what Travis CI can recognize
-    def _perform_setup(self, tag, experiment_setup_function, skip_ci=False):
+    # @param work_dir: the working directory to set up, repo_dir_ if None
+    @traced
+    def _perform_setup(self, tag, experiment_setup_function, skip_ci=False, work_dir=None):
+        if work_dir is None:
+            work_dir = self.repo_dir_
         skip_ci_string = ""
         if skip_ci:
             skip_ci_string = "[skip ci]"
         if experiment_setup_function is not None:
-            modified_files = experiment_setup_function(self.repo_dir_)
+            if self.setup_cache_ is not None and self.setup_cache_.is_cacheable(experiment_setup_function):
+                modified_files = self.setup_cache_.run(experiment_setup_function, work_dir)
+            else:
+                modified_files = experiment_setup_function(work_dir)
             for modified_file in modified_files:
-                call(['git', 'add', '{}'.format(modified_file)], cwd=self.repo_dir_)
+                self.git_.call(['git', 'add', '{}'.format(modified_file)], cwd=work_dir)
             if len(modified_files) > 0:
-                call(['git', 'commit', '-m', '{}Modified for {}'.format(skip_ci_string, tag)], cwd=self.repo_dir_)
+                # there is nothing to commit if the setup leaves the files as they are
+                self.git_.call(['git', 'commit', '-m', '{}Modified for {}'.format(skip_ci_string, tag)], cwd=work_dir, check=False)
 
     # Update the content of experiment branches by one commit, for instance,
     # if the experiment branch is {tag}_{idx}-{idx-1}, it will be merged with
     # seed_{idx-1} such that it simulates the behavior of programmer makes 
     # new changes and commits it
-    # Note that this function is not being used because the same procedure
-    # is done by Azure function
+    # Note that this function is not being used by decomposeRepo because the same procedure
+    # is done by the responsive server once the first build of the branch is finished
     # @param tag: tag to identify the commit
     # @param push: boolean to indicate if the created branches will be pushed to remote
     # @param skip_ci: boolean to specify if this commit will trigger CI,
     #    note that it only works for Travis CI for now because the skip string is hard-coded
     #    to what Travis CI can recognize
+    # @param idx_list: the list of {idx} of the {tag}_{idx}-{idx-1} branches to be updated,
+    #    all experiment branches with the tag are updated if None
+    # @param in_memory: boolean to indicate if the branches will be merged without any checkout,
+    #    see merge_increments
     # @return True if the operation is success, False otherwise.
-    def proceed_commit_history(self, tag, push=True, skip_ci=False):
+    @traced
+    def proceed_commit_history(self, tag, push=True, skip_ci=False, idx_list=None, in_memory=False):
         if self.repo_dir_ is None:
             print("Not a Git directory")
             return False
+        if in_memory:
+            return len(self.merge_increments(tag, push=push, skip_ci=skip_ci, idx_list=idx_list)) == 0
         skip_ci_string = ""
         if skip_ci:
             skip_ci_string = "[skip ci]"
-        idx_list = self.get_experiment_branches_with_tag(tag)
+        if idx_list is None:
+            idx_list = self.get_experiment_branches_with_tag(tag)
+        refs = ['refs/heads/{}_{}-{}'.format(tag, idx, idx-1) for idx in idx_list]
+        if self.journal_ is not None:
+            # the branches incremented by a previous run are left as they are
+            seeds = self.journal_.seeds()
+            ref_index = self._get_ref_index()
+            idx_list = [idx for idx in idx_list if idx >= len(seeds) or ref_index.get( \
+                'refs/heads/{}_{}-{}'.format(tag, idx, idx-1)) != self.journal_.get(seeds[idx], "{}_increment".format(tag))]
         for idx in idx_list:
             next_commit_idx = idx - 1
-            call(['git', 'checkout', '{}_{}-{}'.format(tag, idx, next_commit_idx)], cwd=self.repo_dir_)
-            call(['git', 'merge', '--strategy-option=theirs', \
-                '-m', "{}increment commit to recent {}".format(skip_ci_string, next_commit_idx), '{}_seed_{}'.format(tag, next_commit_idx)], \
-                cwd=self.repo_dir_)
+            self.git_.call(['git', 'checkout', '{}_{}-{}'.format(tag, idx, next_commit_idx)])
+            self.git_.call(['git', 'merge', '--strategy-option=theirs', \
+                '-m', "{}increment commit to recent {}".format(skip_ci_string, next_commit_idx), '{}_seed_{}'.format(tag, next_commit_idx)])
+            self._record_steps([(idx, "{}_increment".format(tag), 'refs/heads/{}_{}-{}'.format(tag, idx, next_commit_idx))])
+        self._refresh_ref_index(refs)
         print("Done proceeding experiment branches")
-        if push:
-            call(['git', 'push', '--all'], cwd=self.repo_dir_)
+        if self._push_refs(refs, push):
             print("Done pushing experiment branches")
         return True
 
+    # Increment the experiment branches without any checkout, see proceed_commit_history.
+    # Each {tag}_{idx}-{idx-1} branch is fast-forwarded to {tag}_seed_{idx-1} when possible,
+    # otherwise the two are merged with "git merge-tree --write-tree" and the content conflicts
+    # are resolved in favor of {tag}_seed_{idx-1} as "git merge --strategy-option=theirs" does.
+    # All branches are updated in one ref transaction, the branches with conflicts that can't be
+    # resolved that way (i.e. modify/delete) are left as they are and reported
+    # @param tag: tag to identify the commit
+    # @param push: boolean to indicate if the updated branches will be pushed to remote
+    # @param skip_ci: boolean to specify if the merge commits will trigger CI, see proceed_commit_history
+    # @param idx_list: the list of {idx} of the {tag}_{idx}-{idx-1} branches to be updated,
+    #    all experiment branches with the tag are updated if None
+    # @return dictionary that maps the name of each branch that isn't incremented to the list of
+    #    conflicted paths or the reason it isn't incremented, empty if all branches are incremented
+    @traced
+    def merge_increments(self, tag, push=True, skip_ci=False, idx_list=None):
+        if self.repo_dir_ is None:
+            print("Not a Git directory")
+            return {}
+        skip_ci_string = ""
+        if skip_ci:
+            skip_ci_string = "[skip ci]"
+        if idx_list is None:
+            idx_list = self.get_experiment_branches_with_tag(tag)
+        ref_index = self._get_ref_index()
+        updates = []
+        conflicts = {}
+        for idx in idx_list:
+            branch = '{}_{}-{}'.format(tag, idx, idx-1)
+            ours = ref_index.get('refs/heads/{}'.format(branch))
+            theirs = ref_index.get('refs/heads/{}_seed_{}'.format(tag, idx-1))
+            if ours is None or theirs is None:
+                conflicts[branch] = ["missing {}".format(branch if ours is None else '{}_seed_{}'.format(tag, idx-1))]
+                continue
+            returncode, byteRes = self.git_.run(['git', 'merge-base', ours, theirs], capture=True, check=False)
+            base = byteRes.decode("utf-8").strip()
+            if returncode != 0:
+                conflicts[branch] = ["no merge base"]
+            elif base == theirs:
+                # incremented before
+                continue
+            elif base == ours:
+                updates.append((idx, branch, theirs, ours))
+            else:
+                tree, unresolved = self._merge_trees(ours, theirs)
+                if tree is None:
+                    conflicts[branch] = unresolved
+                    continue
+                message = "{}increment commit to recent {}".format(skip_ci_string, idx-1)
+                commit = self.git_.output(['git', 'commit-tree', tree, '-p', ours, '-p', theirs, '-m', message])
+                updates.append((idx, branch, commit.decode("utf-8").strip(), ours))
+        refs = ['refs/heads/{}'.format(branch) for _, branch, _, _ in updates]
+        self._detach_head_from(refs)
+        if not self._update_refs(["update refs/heads/{} {} {}".format(branch, new, old) \
+            for _, branch, new, old in updates]):
+            print("Failed to update {} experiment branches".format(len(updates)))
+            return dict(conflicts, **{branch : ["ref transaction failed"] for _, branch, _, _ in updates})
+        self._refresh_ref_index(refs)
+        self._record_steps([(idx, "{}_increment".format(tag), 'refs/heads/{}'.format(branch)) \
+            for idx, branch, _, _ in updates])
+        for branch, paths in sorted(conflicts.items()):
+            print("Failed to increment {}: {}".format(branch, ", ".join(paths)))
+        print("Done proceeding {} experiment branches".format(len(updates)))
+        if self._push_refs(refs, push):
+            print("Done pushing experiment branches")
+        return conflicts
+
+    # Helper function to merge two commits without any checkout, the content conflicts
+    # are resolved in favor of theirs, hunk by hunk, see merge_increments
+    # @param ours: the SHA of the commit merged into
+    # @param theirs: the SHA of the commit to be merged
+    # @return tuple of (SHA of the merged tree or None, list of conflicted paths that can't be resolved)
+    def _merge_trees(self, ours, theirs):
+        returncode, byteRes = self.git_.run(['git', 'merge-tree', '--write-tree', '-z', '--no-messages', \
+            ours, theirs], capture=True, check=False)
+        if returncode not in [0, 1]:
+            return (None, ["merge-tree exited with {}".format(returncode)])
+        # the tree, the conflicted entries ("{mode} {sha} {stage}\t{path}") and an empty field
+        fields = byteRes.decode("utf-8", "surrogateescape").split("\0")
+        tree = fields[0]
+        if returncode == 0:
+            return (tree, [])
+        stages = {}
+        for field in fields[1:]:
+            if field == "":
+                break
+            info, path = field.split("\t", 1)
+            mode, sha, stage = info.split()
+            stages.setdefault(path, {})[int(stage)] = (mode, sha)
+        if len(stages) == 0:
+            return (None, ["conflict without conflicted paths"])
+        resolved = []
+        unresolved = []
+        for path, entries in sorted(stages.items()):
+            if 2 not in entries or 3 not in entries:
+                # modify/delete and the like, which the strategy option doesn't resolve either
+                unresolved.append(path)
+            elif entries[3][0] in [SYMLINK_MODE, GITLINK_MODE] or entries[2][0] in [SYMLINK_MODE, GITLINK_MODE]:
+                resolved.append((path, entries[3][0], entries[3][1]))
+            else:
+                merged = self._merge_blobs(entries.get(1), entries[2], entries[3])
+                if merged is None:
+                    unresolved.append(path)
+                else:
+                    resolved.append((path, entries[3][0], merged))
+        if len(unresolved) > 0:
+            return (None, unresolved)
+        # replace the files with conflict markers in the merged tree through a temporary index
+        index_dir = tempfile.mkdtemp(prefix="merge_index_")
+        env = {"GIT_INDEX_FILE" : os.path.join(index_dir, "index")}
+        try:
+            self.git_.call(['git', 'read-tree', tree], env=env)
+            self.git_.call(['git', 'update-index', '--index-info'], env=env, input="".join( \
+                "{} {}\t{}\n".format(mode, sha, path) for path, mode, sha in resolved).encode("utf-8", "surrogateescape"))
+            return (self.git_.output(['git', 'write-tree'], env=env).decode("utf-8").strip(), [])
+        finally:
+            shutil.rmtree(index_dir, ignore_errors=True)
+
+    # Helper function to merge the content of a conflicted file in favor of theirs with "git merge-file --theirs"
+    # @param base: tuple of (mode, SHA) of the common ancestor, None if the file is added on both sides
+    # @param ours: tuple of (mode, SHA) of the file merged into
+    # @param theirs: tuple of (mode, SHA) of the file to be merged
+    # @return the SHA of the merged blob, theirs for binary files; None if the content can't be merged
+    def _merge_blobs(self, base, ours, theirs):
+        merge_dir = tempfile.mkdtemp(prefix="merge_file_")
+        try:
+            paths = []
+            for name, entry in [("ours", ours), ("base", base), ("theirs", theirs)]:
+                paths.append(os.path.join(merge_dir, name))
+                with open(paths[-1], 'wb') as write_file:
+                    if entry is not None:
+                        write_file.write(self.git_.output(['git', 'cat-file', 'blob', entry[1]]))
+            # the exit status is the number of conflicts left (none with --theirs), or negative or
+            # above 127 on errors such as binary files, which nothing is written to stdout for
+            returncode, merged = self.git_.run(['git', 'merge-file', '-p', '--theirs'] + paths, capture=True, check=False)
+            if returncode < 0 or returncode >= 128:
+                # the same as "git merge -X theirs", which takes their version of a binary file as a whole
+                return theirs[1]
+            if returncode != 0:
+                return None
+            return self.git_.output(['git', 'hash-object', '-w', '--stdin'], input=merged).decode("utf-8").strip()
+        finally:
+            shutil.rmtree(merge_dir, ignore_errors=True)
+
     # It creates new empty commits on the experiment seeds such that
     # the experiment seeds will be different from any existing branches for sure.
     # Note that it is also not being used as it is used in previous procedure
     # @param tag: tag to identify the commit
     # @param push: boolean to indicate if the created branches will be pushed to remote
+    @traced
     def generate_empty_commit_on_experiment_seeds(self, tag, push=True):
         idx_list = self.get_experiment_seed_with_tag(tag)
         for idx in idx_list:
             self._generate_empty_commit('{}_seed_{}'.format(tag, idx))
+        refs = ['refs/heads/{}_seed_{}'.format(tag, idx) for idx in idx_list]
+        self._refresh_ref_index(refs)
         print("Done generating empy commit for branches with tag {}".format(tag))
-        if push:
-            call(['git', 'push', '--all'], cwd=self.repo_dir_)
+        if self._push_refs(refs, push):
             print("Done pushing experiment branches")
 
     # Helper function to create empty commit on specific branch
     # @param branch: the branch to create empty commit on
     def _generate_empty_commit(self, branch):
-        call(['git', 'checkout', '{}'.format(branch)], cwd=self.repo_dir_)
-        call(['git', 'commit', '--allow-empty', '-m "Empty commit to allow meaningless merge"'], cwd=self.repo_dir_)
+        self.git_.call(['git', 'checkout', '{}'.format(branch)])
+        self.git_.call(['git', 'commit', '--allow-empty', '-m "Empty commit to allow meaningless merge"'])
 
 # Function that instantiate the git directories as GitReplay objects
 # @param repo_base: the path of the directory that contains git directories as sub-directories (non-recurssive)
@@ -0,0 +1,250 @@
+import os
+import time
+import shutil
+import tarfile
+import tempfile
+import threading
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from optparse import OptionParser
+from subprocess import call, check_output, DEVNULL, STDOUT
+
+import yaml
+
+from GitReplay import GitReplay
+from GitReplay import populate_GitReplays
+from ResponsiveServer import format_job_record
+from SetupManager.artifactCache import restore_artifacts
+from SetupManager.artifactCache import store_artifacts
+from SetupManager.constants import RTS_ARTIFACT_SUFFIXES
+
+# the command used when the branch has no CI configuration to read it from
+DEFAULT_RUN_COMMAND = "mvn test"
+
+# LocalExecutor class runs the builds of the interactive pipeline on the local machine
+# instead of Travis-CI. It reads the branches generated by GitReplay and runs:
+#   * one build on each seed_{idx} branch (baseline)
+#   * one build on each {tag}_seed_{idx} branch
+#   * for each {tag}_{idx}-{idx-1} branch: the first build to generate RTS artifacts,
+#     the increment (merging {tag}_seed_{idx-1}) and the second build that uses the artifacts
+# The RTS artifacts are kept in a per-branch cache directory by the same artifact cache tool
+# the Travis configuration generated by travis_setup calls: the artifacts with the suffixes in
+# RTS_ARTIFACT_SUFFIXES are stored after a build and restored into a fresh checkout before the next build on the branch.
+# Every build runs in its own git worktree so that builds are scheduled on a pool of workers,
+# and the job records are written to {result_dir}/{branch}.txt in the format of the webhook handler.
+class LocalExecutor:
+    # Constructor that instantiate the LocalExecutor object with respect to the provided repository
+    # @param git_repo: the GitReplay object of the repository
+    # @param result_dir: the directory to write the job records, build logs and test reports to
+    # @param cache_base: the directory that holds the per-branch RTS artifact caches
+    # @param workers: the number of builds run concurrently
+    # @param run_command: the command to run for every build, if None the script
+    #    in the .travis.yml of the branch is used
+    def __init__(self, git_repo, result_dir, cache_base, workers=4, run_command=None):
+        self.git_repo_ = git_repo
+        self.result_dir_ = result_dir
+        self.cache_base_ = cache_base
+        self.workers_ = workers
+        self.run_command_ = run_command
+        self.job_counter_ = 0
+        self.lock_ = threading.Lock()
+        for directory in [result_dir, cache_base]:
+            if not os.path.isdir(directory):
+                os.makedirs(directory)
+
+    # Run the builds of all the pipeline branches in the repository
+    # @param tags: the list of tags to run the experiment branches of, all tags found if None
+    # @param run_seeds: boolean to indicate if the baseline builds of seed_{idx} branches are run
+    # @return a list of (branch, job id, state, seconds) of the recorded builds
+    def run(self, tags=None, run_seeds=True):
+        git_repo = self.git_repo_
+        if git_repo.repo_dir_ is None:
+            print("Not a Git directory")
+            return []
+        if tags is None:
+            tags = git_repo.get_experiment_tags()
+        tasks = []
+        if run_seeds:
+            tasks += [(self._run_single_build, 'seed_{}'.format(idx), None) for idx in git_repo.get_existing_seed()]
+        for tag in tags:
+            tasks += [(self._run_single_build, '{}_seed_{}'.format(tag, idx), tag) \
+                for idx in git_repo.get_experiment_seed_with_tag(tag)]
+            tasks += [(self._run_increment_chain, '{}_{}-{}'.format(tag, idx, idx-1), tag) \
+                for idx in git_repo.get_experiment_branches_with_tag(tag)]
+        records = []
+        with ThreadPoolExecutor(max_workers=self.workers_) as executor:
+            futures = {executor.submit(function, branch, tag) : branch for function, branch, tag in tasks}
+            for future in as_completed(futures):
+                try:
+                    record = future.result()
+                except Exception as e:
+                    print("Failed to build {}: {}: {}".format(futures[future], type(e).__name__, e))
+                    continue
+                records.append(record)
+                print("[{}/{}] {}: {} in {:.1f}s".format(len(records), len(tasks), record[0], record[2], record[3]))
+        # the increments moved the branches
+        git_repo.reload_ref_index()
+        return records
+
+    # Helper function to run the one build on a seed_{idx} or {tag}_seed_{idx} branch
+    # @param branch: the branch to build
+    # @param tag: the tag of the RTS tool, None for seed_{idx} branches
+    # @return (branch, job id, state, seconds) of the build
+    def _run_single_build(self, branch, tag):
+        work_dir = self._add_worktree(branch)
+        try:
+            record = self._build(branch, tag, work_dir)
+            self._write_record(branch, [record])
+            return (branch,) + record
+        finally:
+            self._remove_worktree(work_dir)
+
+    # Helper function to run the first build, the increment and the second build
+    # of a {tag}_{idx}-{idx-1} branch, only the second build is recorded
+    # @param branch: the branch to build
+    # @param tag: the tag of the RTS tool
+    # @return (branch, job id, state, seconds) of the second build
+    def _run_increment_chain(self, branch, tag):
+        recent_k = int(branch.rsplit("-", 1)[1])
+        work_dir = self._add_worktree(branch)
+        try:
+            self._build(branch, tag, work_dir)
+            old_head = self._rev_parse("HEAD", work_dir)
+            if call(['git', 'merge', '--strategy-option=theirs', '-m', \
+                "increment commit to recent {}".format(recent_k), \
+                '{}_seed_{}'.format(tag, recent_k)], cwd=work_dir, \
+                stdout=DEVNULL, stderr=STDOUT) != 0:
+                raise ValueError("failed to merge {}_seed_{}".format(tag, recent_k))
+            call(['git', 'update-ref', 'refs/heads/{}'.format(branch), \
+                self._rev_parse("HEAD", work_dir), old_head], cwd=work_dir)
+            # the second build starts from a fresh checkout as it does on CI
+            call(['git', 'clean', '-ffdxq'], cwd=work_dir)
+            record = self._build(branch, tag, work_dir)
+            self._write_record(branch, [record])
+            return (branch,) + record
+        finally:
+            self._remove_worktree(work_dir)
+
+    # Helper function to run one build in the worktree, with the RTS artifacts
+    # restored from the branch cache before and stored to it after the build
+    # @param branch: the branch being built
+    # @param tag: the tag of the RTS tool, None if there is no RTS artifact
+    # @param work_dir: the worktree of the branch
+    # @return (job id, state, seconds) of the build
+    def _build(self, branch, tag, work_dir):
+        with self.lock_:
+            self.job_counter_ += 1
+            job_id = self.job_counter_
+        cache_dir = os.path.join(self.cache_base_, branch)
+        if tag is not None:
+            restore_artifacts(work_dir, cache_dir)
+        env = dict(os.environ, TRAVIS_BUILD_DIR=work_dir, TRAVIS_BRANCH=branch, \
+            TRAVIS_JOB_NUMBER="{}.1".format(job_id))
+        start = time.time()
+        returncode = 0
+        with open(os.path.join(self.result_dir_, "{}_{}.log".format(branch, job_id)), 'w') as log_file:
+            for command in self._get_run_commands(work_dir):
+                log_file.write("$ {}\n".format(command))
+                log_file.flush()
+                returncode = call(command, shell=True, cwd=work_dir, env=env, stdout=log_file, stderr=STDOUT)
+                if returncode != 0:
+                    break
+        elapsed = time.time() - start
+        if tag is not None:
+            store_artifacts(work_dir, cache_dir, RTS_ARTIFACT_SUFFIXES.get(tag, []))
+        self._archive_test_reports(branch, work_dir)
+        return (job_id, "passed" if returncode == 0 else "failed", elapsed)
+
+    # Helper function to get the commands of a build
+    # @param work_dir: the worktree of the branch
+    # @return a list of shell commands
+    def _get_run_commands(self, work_dir):
+        if self.run_command_ is not None:
+            return [self.run_command_]
+        travis_file = os.path.join(work_dir, ".travis.yml")
+        if not os.path.isfile(travis_file):
+            return [DEFAULT_RUN_COMMAND]
+        with open(travis_file, 'r') as read_file:
+            travis_setting = yaml.safe_load(read_file) or {}
+        script = travis_setting.get("script", [DEFAULT_RUN_COMMAND])
+        if not isinstance(script, list):
+            script = [script]
+        return script
+
+    # Helper function to pack the surefire reports of a build as {branch}_{job}.tar.gz,
+    # the same name the CI configuration generated by travis_setup uploads them with
+    # @param branch: the branch being built
+    # @param work_dir: the worktree of the branch
+    def _archive_test_reports(self, branch, work_dir):
+        reports = []
+        for root, dirs, files in os.walk(work_dir):
+            if ".git" in dirs:
+                dirs.remove(".git")
+            reports += [os.path.join(root, file_name) for file_name in files \
+                if file_name.startswith("TEST") and file_name.endswith(".xml")]
+        if len(reports) == 0:
+            return
+        # a branch has one job per build, the job number of the uploaded archive is always 1
+        with tarfile.open(os.path.join(self.result_dir_, "{}_1.tar.gz".format(branch)), "w:gz") as archive:
+            for report in reports:
+                archive.add(report, arcname=os.path.relpath(report, work_dir))
+
+    # Helper function to write the job records of a branch
+    # @param branch: the branch being built
+    # @param records: list of (job id, state, seconds)
+    def _write_record(self, branch, records):
+        with open(os.path.join(self.result_dir_, "{}.txt".format(branch)), 'w') as write_file:
+            for job_id, state, elapsed in records:
+                write_file.write(format_job_record(job_id, state, elapsed))
+
+    # Helper function to create a detached worktree of the branch
+    # @param branch: the branch to be checked out
+    # @return the path to the worktree
+    def _add_worktree(self, branch):
+        work_dir = tempfile.mkdtemp(prefix="{}_".format(branch))
+        with self.lock_:
+            if call(['git', 'worktree', 'add', '--detach', work_dir, 'refs/heads/{}'.format(branch)], \
+                cwd=self.git_repo_.repo_dir_, stdout=DEVNULL, stderr=STDOUT) != 0:
+                shutil.rmtree(work_dir, ignore_errors=True)
+                raise ValueError("failed to check out {}".format(branch))
+        return work_dir
+
+    # Helper function to remove a worktree created by _add_worktree
+    # @param work_dir: the path to the worktree
+    def _remove_worktree(self, work_dir):
+        with self.lock_:
+            call(['git', 'worktree', 'remove', '--force', work_dir], cwd=self.git_repo_.repo_dir_)
+        shutil.rmtree(work_dir, ignore_errors=True)
+
+    # Helper function to resolve a revision in the worktree
+    # @param revision: the revision to be resolved
+    # @param work_dir: the worktree
+    # @return the SHA as string
+    def _rev_parse(self, revision, work_dir):
+        return check_output(['git', 'rev-parse', revision], cwd=work_dir).decode("utf-8").strip()
+
+if __name__ == "__main__":
+    usage = "usage: python %prog [options]"
+    parser = OptionParser(usage=usage)
+    parser.add_option("--repo-base", dest="repo_base", default=os.environ.get('REPO_BASE'),
+                    help="directory that contains the git repositories [default: $REPO_BASE]")
+    parser.add_option("--result-dir", dest="result_dir", default="test-reports",
+                    help="directory to write the job records and test reports to [default: %default]")
+    parser.add_option("--cache-dir", dest="cache_dir", default=None,
+                    help="directory for the per-branch RTS artifact caches [default: {result-dir}/cache]")
+    parser.add_option("-j", "--jobs", type="int", dest="jobs", default=os.cpu_count(),
+                    help="number of builds run concurrently [default: %default]")
+    parser.add_option("--command", dest="command", default=None,
+                    help="command to run for every build instead of the script in .travis.yml")
+    parser.add_option("--skip-seeds", action="store_false", dest="run_seeds", default=True,
+                    help="don't run the baseline builds of seed branches")
+    (options, args) = parser.parse_args()
+
+    success = True
+    for git_repo in populate_GitReplays(options.repo_base):
+        repo_name = os.path.basename(git_repo.repo_dir_)
+        cache_dir = options.cache_dir or os.path.join(options.result_dir, "cache")
+        executor = LocalExecutor(git_repo, os.path.join(options.result_dir, repo_name), \
+            os.path.join(cache_dir, repo_name), options.jobs, options.command)
+        records = executor.run(run_seeds=options.run_seeds)
+        success &= all(record[2] == "passed" for record in records)
+    exit(0 if success else 1)
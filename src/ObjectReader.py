@@ -0,0 +1,73 @@
+TREE_MODE = "40000"
+SYMLINK_MODE = "120000"
+GITLINK_MODE = "160000"
+
+# ObjectReader class reads git objects through one "git cat-file --batch" process,
+# so that the files of many commits can be read without a checkout and without
+# starting one git process per object. Tree objects are cached by SHA, the trees
+# shared by several commits (directories that didn't change) are read only once
+class ObjectReader:
+    # Constructor that starts the cat-file process
+    # @param git_command: the GitCommand object of the repository
+    def __init__(self, git_command):
+        self.git_ = git_command
+        self.process_ = git_command.start(['git', 'cat-file', '--batch'])
+        self.trees_ = {}
+
+    # Read one object
+    # @param name: anything git can resolve to an object, i.e. a SHA, "seed_0^{tree}" or "seed_0:pom.xml"
+    # @return tuple of (SHA, type, content as byte string), None if the object doesn't exist
+    def read(self, name):
+        self.process_.stdin.write("{}\n".format(name).encode("utf-8"))
+        self.process_.stdin.flush()
+        header = self.process_.stdout.readline().decode("utf-8").split()
+        if len(header) != 3:
+            # "{name} missing" or "{name} ambiguous"
+            return None
+        sha, object_type, size = header
+        content = self.process_.stdout.read(int(size))
+        # the content is followed by a newline
+        self.process_.stdout.read(1)
+        return (sha, object_type, content)
+
+    # Read the entries of a tree object
+    # @param sha: the SHA of the tree
+    # @return list of (mode, name, SHA) tuples
+    def read_tree(self, sha):
+        if sha not in self.trees_:
+            entries = []
+            content = self.read(sha)[2]
+            pos = 0
+            while pos < len(content):
+                name_end = content.index(b"\0", pos)
+                mode, name = content[pos:name_end].decode("utf-8", "surrogateescape").split(" ", 1)
+                entries.append((mode, name, content[name_end + 1:name_end + 21].hex()))
+                pos = name_end + 21
+            self.trees_[sha] = entries
+        return self.trees_[sha]
+
+    # Find files by name in a tree
+    # @param tree_sha: the SHA of the root tree, i.e. the tree of a commit
+    # @param file_names: the names of the files to be found in any directory
+    # @param root_files: the paths of the files to be found relative to the root
+    # @param ignored_directories: the names of the directories that are not searched
+    # @return dictionary that maps the path relative to the root to (mode, blob SHA)
+    def find_files(self, tree_sha, file_names, root_files=None, ignored_directories=None):
+        res = {}
+        root_files = set(root_files or [])
+        ignored_directories = set(ignored_directories or [])
+        pending = [("", tree_sha)]
+        while len(pending) > 0:
+            directory, sha = pending.pop()
+            for mode, name, entry_sha in self.read_tree(sha):
+                path = directory + name
+                if mode == TREE_MODE:
+                    if name not in ignored_directories:
+                        pending.append((path + "/", entry_sha))
+                elif mode != GITLINK_MODE and (name in file_names or path in root_files):
+                    res[path] = (mode, entry_sha)
+        return res
+
+    # Stop the cat-file process
+    def close(self):
+        self.git_.finish(self.process_)
@@ -0,0 +1,104 @@
+import os
+import json
+import tempfile
+import threading
+
+JOURNAL_VERSION = 1
+
+# the step of a commit whose seed_{idx} branch is created, the steps of an RTS tool are
+# "{tag}_seed", "{tag}_branch" and "{tag}_increment" for the {tag}_seed_{idx} branch,
+# the {tag}_{idx}-{idx-1} branch and the increment of the {tag}_{idx}-{idx-1} branch
+SEED_STEP = "seed"
+
+# PipelineJournal class keeps the progress of the pipeline on a repository across runs.
+# The branch names are positional (seed_{idx} is the {idx}-th seed, the most recent first)
+# and shift whenever newer seeds are added, so the journal keys the progress by commit SHA:
+#   * seeds: the SHAs of the seeds, seed_{idx} is the commit seeds[idx]
+#   * commits: maps the SHA of a seed to its completed steps, each step maps to the SHA
+#       of the branch it produced, so that a step is only done if the branch still points there
+# The journal is written to a JSON file, replaced atomically on each save
+class PipelineJournal:
+    # Constructor that loads the journal if the file exists
+    # @param path: the path to the JSON file, i.e. .git/cireinteract/journal.json
+    def __init__(self, path):
+        self.path_ = path
+        self.lock_ = threading.Lock()
+        self.seeds_ = []
+        self.commits_ = {}
+        self.load()
+
+    # Load the journal from the file, the journal is empty if the file doesn't exist or is unreadable
+    def load(self):
+        self.seeds_ = []
+        self.commits_ = {}
+        try:
+            with open(self.path_, 'r') as read_file:
+                content = json.load(read_file)
+        except (IOError, OSError, ValueError):
+            return
+        if not isinstance(content, dict) or content.get("version") != JOURNAL_VERSION:
+            return
+        self.seeds_ = content.get("seeds", [])
+        self.commits_ = content.get("commits", {})
+
+    # Write the journal to the file
+    def save(self):
+        with self.lock_:
+            content = json.dumps({"version" : JOURNAL_VERSION, "seeds" : self.seeds_, "commits" : self.commits_}, \
+                indent=1, sort_keys=True)
+        directory = os.path.dirname(self.path_)
+        os.makedirs(directory, exist_ok=True)
+        fd, tmp_path = tempfile.mkstemp(prefix=".tmp", dir=directory)
+        with os.fdopen(fd, 'w') as write_file:
+            write_file.write(content)
+        os.replace(tmp_path, self.path_)
+
+    # @return the list of SHAs of the seeds, the most recent first
+    def seeds(self):
+        return list(self.seeds_)
+
+    # Set the seeds, the steps of the commits that are no longer seeds are dropped
+    # @param seeds: the list of SHAs of the seeds, the most recent first
+    def set_seeds(self, seeds):
+        with self.lock_:
+            self.seeds_ = list(seeds)
+            self.commits_ = {sha : steps for sha, steps in self.commits_.items() if sha in self.seeds_}
+
+    # Get the result of a step
+    # @param sha: the SHA of the seed
+    # @param step: the name of the step, i.e. SEED_STEP or "ekstazi_seed"
+    # @return the SHA of the branch produced by the step, None if the step is not done
+    def get(self, sha, step):
+        with self.lock_:
+            return self.commits_.get(sha, {}).get(step)
+
+    # Record a completed step
+    # @param sha: the SHA of the seed
+    # @param step: the name of the step
+    # @param value: the SHA of the branch produced by the step
+    def record(self, sha, step, value):
+        with self.lock_:
+            self.commits_.setdefault(sha, {})[step] = value
+
+    # Check if any experiment branch has been incremented
+    # @return True if any increment step is recorded, False otherwise
+    def has_increments(self):
+        with self.lock_:
+            return any(step.endswith("_increment") for steps in self.commits_.values() for step in steps)
+
+    # Forget the steps of the branches deleted by tag, see GitReplay.delete_all_branches_with_tags
+    # @param tag: the tag of the deleted branches, the whole journal is cleared for "seed"
+    def forget(self, tag):
+        with self.lock_:
+            if tag == SEED_STEP:
+                self.seeds_ = []
+                self.commits_ = {}
+                return
+            prefix = "{}_".format(tag)
+            for steps in self.commits_.values():
+                for step in [step for step in steps if step.startswith(prefix)]:
+                    del steps[step]
+
+    # Clear the journal
+    def clear(self):
+        self.forget(SEED_STEP)
@@ -0,0 +1,112 @@
+import re
+
+SEED_PATTERN = re.compile(r'^seed_(\d+)$')
+TOOL_SEED_PATTERN = re.compile(r'^(.+)_seed_(\d+)$')
+INCREMENT_PATTERN = re.compile(r'^(.+)_(\d+)-\d+$')
+
+BRANCH_PREFIX = "refs/heads/"
+
+# RefIndex class keeps the branches generated by the pipeline in memory so that
+# looking up the seeds and the experiment branches doesn't require running git each time.
+# The branches are indexed as:
+#   * seed_{idx} by idx
+#   * {tag}_seed_{idx} by (tag, idx)
+#   * {tag}_{idx}-{idx-1} by (tag, idx)
+# and each entry stores the SHA the branch points to
+class RefIndex:
+    # Constructor that instantiate an empty index
+    def __init__(self):
+        self.seeds_ = {}
+        self.tool_seeds_ = {}
+        self.increments_ = {}
+
+    # Fill the index from the output of "git for-each-ref --format='%(objectname) %(refname)'",
+    # the existing entries are discarded
+    # @param byteRes: the output as byte string with "{sha} {refname}" on each line
+    def load(self, byteRes):
+        self.seeds_ = {}
+        self.tool_seeds_ = {}
+        self.increments_ = {}
+        for line in byteRes.decode("utf-8").splitlines():
+            fields = line.split()
+            if len(fields) == 2:
+                self.set(fields[1], fields[0])
+
+    # Add or update the entry of a branch, branches not generated by the pipeline are ignored
+    # @param refname: the full ref name, i.e. refs/heads/seed_0
+    # @param sha: the SHA the branch points to
+    def set(self, refname, sha):
+        key = self._parse(refname)
+        if key is not None:
+            key[0][key[1]] = sha
+
+    # Remove the entry of a branch if it is in the index
+    # @param refname: the full ref name, i.e. refs/heads/seed_0
+    def remove(self, refname):
+        key = self._parse(refname)
+        if key is not None:
+            key[0].pop(key[1], None)
+
+    # Get the SHA a branch points to
+    # @param refname: the full ref name, i.e. refs/heads/seed_0
+    # @return the SHA as string. None if the branch is not in the index
+    def get(self, refname):
+        key = self._parse(refname)
+        if key is None:
+            return None
+        return key[0].get(key[1])
+
+    # @return a sorted list of the index of seed_{idx} branches
+    def seeds(self):
+        return sorted(self.seeds_)
+
+    # @return a sorted list of the tags that have {tag}_seed_{idx} branches
+    def tags(self):
+        return sorted(set(tag for (tag, _) in self.tool_seeds_))
+
+    # @param tag: the tag of the experiment branches
+    # @return a sorted list of the index of {tag}_seed_{idx} branches
+    def tool_seeds(self, tag):
+        return sorted(idx for (seed_tag, idx) in self.tool_seeds_ if seed_tag == tag)
+
+    # @param tag: the tag of the experiment branches
+    # @return a sorted list of the index of {tag}_{idx}-{idx-1} branches
+    def increments(self, tag):
+        return sorted(idx for (increment_tag, idx) in self.increments_ if increment_tag == tag)
+
+    # @return a sorted list of (tag, idx) of the {tag}_{idx}-{idx-1} branches that no longer point to
+    #    the commit of {tag}_seed_{idx} they are created at, that is, the branches incremented since
+    def moved_increments(self):
+        return sorted(key for key, sha in self.increments_.items() if self.tool_seeds_.get(key) != sha)
+
+    # Get all branches in the index, optionally with their index shifted, i.e. to rename
+    # the branches when newer seeds are put in front of the existing ones
+    # @param offset: the number added to the index of every branch
+    # @return dictionary that maps the full ref name to the SHA the branch points to
+    def refs(self, offset=0):
+        res = {}
+        for idx, sha in self.seeds_.items():
+            res["{}seed_{}".format(BRANCH_PREFIX, idx + offset)] = sha
+        for (tag, idx), sha in self.tool_seeds_.items():
+            res["{}{}_seed_{}".format(BRANCH_PREFIX, tag, idx + offset)] = sha
+        for (tag, idx), sha in self.increments_.items():
+            res["{}{}_{}-{}".format(BRANCH_PREFIX, tag, idx + offset, idx + offset - 1)] = sha
+        return res
+
+    # Helper function to find where a branch is stored in the index
+    # @param refname: the full ref name
+    # @return tuple of (dictionary, key) for pipeline branches, None otherwise
+    def _parse(self, refname):
+        if not refname.startswith(BRANCH_PREFIX):
+            return None
+        name = refname[len(BRANCH_PREFIX):]
+        match = SEED_PATTERN.match(name)
+        if match is not None:
+            return (self.seeds_, int(match.group(1)))
+        match = TOOL_SEED_PATTERN.match(name)
+        if match is not None:
+            return (self.tool_seeds_, (match.group(1), int(match.group(2))))
+        match = INCREMENT_PATTERN.match(name)
+        if match is not None:
+            return (self.increments_, (match.group(1), int(match.group(2))))
+        return None
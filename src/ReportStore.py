@@ -0,0 +1,363 @@
+import os
+import re
+import sqlite3
+import tarfile
+import xml.etree.ElementTree as ET
+from optparse import OptionParser
+
+from RefIndex import SEED_PATTERN, TOOL_SEED_PATTERN, INCREMENT_PATTERN
+
+# {branch}_{job}.tar.gz as uploaded by the CI configuration generated by travis_setup
+ARCHIVE_PATTERN = re.compile(r'^(?P<branch>.+)_(?P<job>\d+)\.tar\.gz$')
+# {branch}_{job}.manifest as written by the responsive server for the deduplicated report uploads,
+# the reports it lists are stored by content in objects/ next to it
+MANIFEST_PATTERN = re.compile(r'^(?P<branch>.+)_(?P<job>\d+)\.manifest$')
+# {branch}.txt as written by the responsive server
+JOB_RECORD_PATTERN = re.compile(r'id (?P<job_id>\S+); state (?P<state>\S+); time (?P<seconds>[-\d.eE+]+)')
+INCREMENT_RECENT_PATTERN = re.compile(r'^(.+)_\d+-(\d+)$')
+
+# status of a test case
+PASSED = 0
+FAILURE = 1
+ERROR = 2
+SKIPPED = 3
+
+# number of rows inserted per executemany
+INSERT_BATCH_SIZE = 10000
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS branches (
+    id INTEGER PRIMARY KEY,
+    repo TEXT NOT NULL,
+    name TEXT NOT NULL,
+    kind TEXT,
+    tool TEXT,
+    idx INTEGER,
+    UNIQUE (repo, name)
+);
+CREATE INDEX IF NOT EXISTS branches_by_kind ON branches (repo, kind, tool, idx);
+CREATE TABLE IF NOT EXISTS names (
+    id INTEGER PRIMARY KEY,
+    name TEXT NOT NULL UNIQUE
+);
+CREATE TABLE IF NOT EXISTS test_cases (
+    branch_id INTEGER NOT NULL,
+    job INTEGER NOT NULL,
+    class_id INTEGER NOT NULL,
+    name_id INTEGER NOT NULL,
+    seconds REAL NOT NULL,
+    status INTEGER NOT NULL
+);
+CREATE INDEX IF NOT EXISTS test_cases_by_branch ON test_cases (branch_id, job);
+CREATE INDEX IF NOT EXISTS test_cases_by_class ON test_cases (class_id);
+CREATE TABLE IF NOT EXISTS branch_stats (
+    branch_id INTEGER NOT NULL,
+    job INTEGER NOT NULL,
+    test_classes INTEGER NOT NULL,
+    tests INTEGER NOT NULL,
+    failures INTEGER NOT NULL,
+    skipped INTEGER NOT NULL,
+    test_seconds REAL NOT NULL,
+    PRIMARY KEY (branch_id, job)
+);
+CREATE TABLE IF NOT EXISTS builds (
+    branch_id INTEGER NOT NULL,
+    job_id TEXT NOT NULL,
+    state TEXT,
+    seconds REAL,
+    PRIMARY KEY (branch_id, job_id)
+);
+"""
+
+# Function that classifies a branch generated by the pipeline
+# @param branch: the branch name
+# @return tuple of (kind, tool, idx) where kind is "seed", "tool_seed" or "increment" and
+#    idx is the commit the build measures ({idx-1} for {tool}_{idx}-{idx-1}); (None, None, None) otherwise
+def classify_branch(branch):
+    match = SEED_PATTERN.match(branch)
+    if match is not None:
+        return ("seed", None, int(match.group(1)))
+    match = TOOL_SEED_PATTERN.match(branch)
+    if match is not None:
+        return ("tool_seed", match.group(1), int(match.group(2)))
+    if INCREMENT_PATTERN.match(branch) is not None:
+        match = INCREMENT_RECENT_PATTERN.match(branch)
+        return ("increment", match.group(1), int(match.group(2)))
+    return (None, None, None)
+
+# ReportStore class loads the results of the pipeline into a SQLite database for analysis:
+#   * the surefire reports (TEST*.xml) inside {branch}_{job}.tar.gz or listed by {branch}_{job}.manifest,
+#     one row per test case
+#   * the job records {branch}.txt, one row per CI job
+# The archives are read as a stream and the XML is parsed incrementally, so the memory
+# used doesn't depend on the size of the archives. Test and class names are interned and
+# the per-branch aggregates are computed at ingestion time, so the queries about
+# RTS savings only touch small tables.
+class ReportStore:
+    # Constructor that opens (and creates if necessary) the database
+    # @param db_path: the path to the SQLite database file
+    def __init__(self, db_path):
+        self.connection_ = sqlite3.connect(db_path)
+        self.connection_.executescript(SCHEMA)
+        self.name_ids_ = {}
+
+    # Close the database
+    def close(self):
+        self.connection_.close()
+
+    # Ingest all the archives, report manifests and job records in a directory (recursively)
+    # @param result_dir: the directory that contains the results
+    # @param repo: the name of the repository the results belong to
+    # @return tuple of (number of archives and manifests, number of job record files) ingested
+    def ingest_directory(self, result_dir, repo=""):
+        archives = 0
+        job_records = 0
+        for root, dirs, files in os.walk(result_dir):
+            # the reports stored by content are read through the manifests
+            dirs[:] = [sub_dir for sub_dir in dirs if sub_dir != "objects"]
+            for file_name in sorted(files):
+                path = os.path.join(root, file_name)
+                if ARCHIVE_PATTERN.match(file_name) is not None:
+                    self.ingest_archive(path, repo)
+                    archives += 1
+                elif MANIFEST_PATTERN.match(file_name) is not None:
+                    self.ingest_manifest(path, repo)
+                    archives += 1
+                elif file_name.endswith(".txt"):
+                    self.ingest_job_records(path, repo)
+                    job_records += 1
+        return (archives, job_records)
+
+    # Ingest the surefire reports in a {branch}_{job}.tar.gz archive, the reports
+    # ingested before for the same branch and job are replaced
+    # @param archive_path: the path to the archive
+    # @param repo: the name of the repository the results belong to
+    # @return the number of test cases ingested
+    def ingest_archive(self, archive_path, repo=""):
+        match = ARCHIVE_PATTERN.match(os.path.basename(archive_path))
+        if match is None:
+            raise ValueError("{} is not named as {{branch}}_{{job}}.tar.gz".format(archive_path))
+        with tarfile.open(archive_path, mode="r|gz") as archive:
+            reports = (archive.extractfile(member) for member in archive \
+                if member.isfile() and self._is_report(member.name))
+            return self.ingest_reports(match.group("branch"), int(match.group("job")), reports, repo)
+
+    # Ingest the surefire reports listed in a {branch}_{job}.manifest, the reports
+    # ingested before for the same branch and job are replaced
+    # @param manifest_path: the path to the manifest
+    # @param repo: the name of the repository the results belong to
+    # @return the number of test cases ingested
+    def ingest_manifest(self, manifest_path, repo=""):
+        match = MANIFEST_PATTERN.match(os.path.basename(manifest_path))
+        if match is None:
+            raise ValueError("{} is not named as {{branch}}_{{job}}.manifest".format(manifest_path))
+        objects_dir = os.path.join(os.path.dirname(manifest_path), "objects")
+        def open_reports():
+            with open(manifest_path, 'r') as read_file:
+                # the first line is the version of the manifest
+                read_file.readline()
+                for line in read_file:
+                    fields = line.rstrip("\n").split(" ", 2)
+                    if len(fields) == 3 and self._is_report(fields[2]):
+                        with open(os.path.join(objects_dir, fields[0][:2], fields[0][2:]), 'rb') as report:
+                            yield report
+        return self.ingest_reports(match.group("branch"), int(match.group("job")), open_reports(), repo)
+
+    # Ingest a stream of surefire reports of one build
+    # @param branch: the branch of the build
+    # @param job: the job number of the build
+    # @param reports: iterable of file objects of TEST*.xml files
+    # @param repo: the name of the repository the results belong to
+    # @return the number of test cases ingested
+    def ingest_reports(self, branch, job, reports, repo=""):
+        with self.connection_:
+            branch_id = self._get_branch_id(repo, branch)
+            self.connection_.execute("DELETE FROM test_cases WHERE branch_id = ? AND job = ?", (branch_id, job))
+            self.connection_.execute("DELETE FROM branch_stats WHERE branch_id = ? AND job = ?", (branch_id, job))
+            rows = []
+            test_classes = set()
+            tests = failures = skipped = 0
+            test_seconds = 0.0
+            for report in reports:
+                for class_name, test_name, seconds, status in self._parse_report(report):
+                    class_id = self._get_name_id(class_name)
+                    test_classes.add(class_id)
+                    rows.append((branch_id, job, class_id, self._get_name_id(test_name), seconds, status))
+                    tests += 1
+                    failures += status in [FAILURE, ERROR]
+                    skipped += status == SKIPPED
+                    test_seconds += seconds
+                    if len(rows) >= INSERT_BATCH_SIZE:
+                        self._insert_test_cases(rows)
+                        rows = []
+            self._insert_test_cases(rows)
+            self.connection_.execute("INSERT INTO branch_stats VALUES (?, ?, ?, ?, ?, ?, ?)", \
+                (branch_id, job, len(test_classes), tests, failures, skipped, test_seconds))
+        return tests
+
+    # Ingest the job records of a branch written by the responsive server as {branch}.txt,
+    # the records ingested before for the same branch are replaced
+    # @param record_path: the path to the job record file
+    # @param repo: the name of the repository the results belong to
+    # @return the number of jobs ingested
+    def ingest_job_records(self, record_path, repo=""):
+        branch = os.path.basename(record_path)[:-len(".txt")]
+        rows = []
+        with open(record_path, 'r') as read_file:
+            for line in read_file:
+                match = JOB_RECORD_PATTERN.search(line)
+                if match is not None:
+                    rows.append((match.group("job_id"), match.group("state"), float(match.group("seconds"))))
+        with self.connection_:
+            branch_id = self._get_branch_id(repo, branch)
+            self.connection_.execute("DELETE FROM builds WHERE branch_id = ?", (branch_id,))
+            self.connection_.executemany("INSERT OR REPLACE INTO builds VALUES (?, ?, ?, ?)", \
+                [(branch_id,) + row for row in rows])
+        return len(rows)
+
+    # Compute the RTS savings of each commit: the second build of {tool}_{idx+1}-{idx}
+    # (the RTS tool selecting tests for commit idx) against the build of seed_{idx}
+    # (all tests of commit idx)
+    # @param tool: only report this tool if provided
+    # @param repo: only report this repository if provided
+    # @return a list of dictionaries, one per (repo, tool, idx)
+    def rts_savings(self, tool=None, repo=None):
+        query = """
+            WITH stats AS (
+                SELECT branch_id, SUM(test_classes) AS test_classes, SUM(tests) AS tests,
+                    SUM(test_seconds) AS test_seconds
+                FROM branch_stats GROUP BY branch_id
+            ), build_time AS (
+                SELECT branch_id, SUM(seconds) AS seconds FROM builds GROUP BY branch_id
+            )
+            SELECT rts.repo, rts.tool, rts.idx,
+                rts_stats.test_classes, base_stats.test_classes,
+                rts_stats.tests, base_stats.tests,
+                rts_stats.test_seconds, base_stats.test_seconds,
+                rts_build.seconds, base_build.seconds
+            FROM branches AS rts
+            JOIN branches AS base
+                ON base.repo = rts.repo AND base.kind = 'seed' AND base.idx = rts.idx
+            LEFT JOIN stats AS rts_stats ON rts_stats.branch_id = rts.id
+            LEFT JOIN stats AS base_stats ON base_stats.branch_id = base.id
+            LEFT JOIN build_time AS rts_build ON rts_build.branch_id = rts.id
+            LEFT JOIN build_time AS base_build ON base_build.branch_id = base.id
+            WHERE rts.kind = 'increment'"""
+        parameters = []
+        if tool is not None:
+            query += " AND rts.tool = ?"
+            parameters.append(tool)
+        if repo is not None:
+            query += " AND rts.repo = ?"
+            parameters.append(repo)
+        query += " ORDER BY rts.repo, rts.tool, rts.idx"
+        res = []
+        for row in self.connection_.execute(query, parameters):
+            entry = {
+                "repo" : row[0], "tool" : row[1], "idx" : row[2],
+                "selected_classes" : row[3], "total_classes" : row[4],
+                "selected_tests" : row[5], "total_tests" : row[6],
+                "rts_test_seconds" : row[7], "baseline_test_seconds" : row[8],
+                "rts_build_seconds" : row[9], "baseline_build_seconds" : row[10],
+            }
+            entry["test_seconds_saved"] = self._difference(row[8], row[7])
+            entry["build_seconds_saved"] = self._difference(row[10], row[9])
+            res.append(entry)
+        return res
+
+    # Helper function to check if a member of the archive is a surefire report
+    # @param member_name: the path of the member in the archive
+    # @return True if it is a TEST*.xml file
+    def _is_report(self, member_name):
+        file_name = os.path.basename(member_name)
+        return file_name.startswith("TEST") and file_name.endswith(".xml")
+
+    # Helper function to parse a surefire report incrementally,
+    # each test case element is dropped once it is read
+    # @param report: the file object of the report
+    # @return generator of (class name, test name, seconds, status)
+    def _parse_report(self, report):
+        root = None
+        for event, element in ET.iterparse(report, events=("start", "end")):
+            if event == "start":
+                if root is None:
+                    root = element
+                continue
+            if element.tag != "testcase":
+                continue
+            status = PASSED
+            for child in element:
+                if child.tag == "failure":
+                    status = FAILURE
+                elif child.tag == "error":
+                    status = ERROR
+                elif child.tag == "skipped":
+                    status = SKIPPED
+            try:
+                seconds = float(element.get("time", "0").replace(",", ""))
+            except ValueError:
+                seconds = 0.0
+            yield (element.get("classname", ""), element.get("name", ""), seconds, status)
+            element.clear()
+            # drop the processed test cases from the tree
+            root.clear()
+
+    # Helper function to insert a batch of test cases
+    # @param rows: list of test case rows
+    def _insert_test_cases(self, rows):
+        if len(rows) > 0:
+            self.connection_.executemany("INSERT INTO test_cases VALUES (?, ?, ?, ?, ?, ?)", rows)
+
+    # Helper function to get the id of a branch, the branch is added if it doesn't exist
+    # @param repo: the name of the repository
+    # @param branch: the branch name
+    # @return the id of the branch
+    def _get_branch_id(self, repo, branch):
+        kind, tool, idx = classify_branch(branch)
+        self.connection_.execute("INSERT OR IGNORE INTO branches (repo, name, kind, tool, idx) VALUES (?, ?, ?, ?, ?)", \
+            (repo, branch, kind, tool, idx))
+        return self.connection_.execute("SELECT id FROM branches WHERE repo = ? AND name = ?", \
+            (repo, branch)).fetchone()[0]
+
+    # Helper function to get the id of an interned class or test name
+    # @param name: the name
+    # @return the id of the name
+    def _get_name_id(self, name):
+        name_id = self.name_ids_.get(name)
+        if name_id is None:
+            self.connection_.execute("INSERT OR IGNORE INTO names (name) VALUES (?)", (name,))
+            name_id = self.connection_.execute("SELECT id FROM names WHERE name = ?", (name,)).fetchone()[0]
+            self.name_ids_[name] = name_id
+        return name_id
+
+    # @return baseline - value, None if either of them is missing
+    def _difference(self, baseline, value):
+        if baseline is None or value is None:
+            return None
+        return baseline - value
+
+if __name__ == "__main__":
+    usage = "usage: python %prog [options] ingest RESULT_DIR... | python %prog [options] savings"
+    parser = OptionParser(usage=usage)
+    parser.add_option("--db", dest="db", default="results.db",
+                    help="path to the SQLite database [default: %default]")
+    parser.add_option("--repo", dest="repo", default=None,
+                    help="name of the repository the results belong to")
+    parser.add_option("--tool", dest="tool", default=None,
+                    help="only report this RTS tool")
+    (options, args) = parser.parse_args()
+    if len(args) == 0 or args[0] not in ["ingest", "savings"]:
+        parser.error("expecting a command: ingest or savings")
+
+    store = ReportStore(options.db)
+    if args[0] == "ingest":
+        for result_dir in args[1:]:
+            archives, job_records = store.ingest_directory(result_dir, options.repo or "")
+            print("Ingested {} archives and {} job records from {}".format(archives, job_records, result_dir))
+    else:
+        print("repo\ttool\tidx\tselected_tests\ttotal_tests\ttest_seconds_saved\tbuild_seconds_saved")
+        for entry in store.rts_savings(options.tool, options.repo):
+            print("\t".join(str(entry[key]) for key in ["repo", "tool", "idx", "selected_tests", \
+                "total_tests", "test_seconds_saved", "build_seconds_saved"]))
+    store.close()
+    exit(0)
@@ -0,0 +1,664 @@
+import os
+import re
+import json
+import queue
+import asyncio
+import hashlib
+import tarfile
+import tempfile
+from datetime import datetime
+from concurrent.futures import ThreadPoolExecutor
+from optparse import OptionParser
+from urllib.parse import parse_qs, urlsplit
+from subprocess import call
+
+from BuildCache import BuildCache
+from GitReplay import GitReplay
+from SetupManager.reportUploader import MANIFEST_VERSION as REPORT_MANIFEST_VERSION
+from SetupManager.reportUploader import REPORT_STREAM_CONTENT_TYPE
+
+# The branches whose builds are recorded, same as the Azure function:
+#   1. seed branch as baseline;
+#   2. tool_seed branch to make sure the tool doesn't break the build;
+#   3. second build of tool_commit_increment branch to check the effect of the tool
+SEED_BRANCH_PATTERN = re.compile(r'.*seed_(?P<recent_k>\d+)$', re.IGNORECASE)
+INCREMENT_BRANCH_PATTERN = re.compile(r'(?P<tool_name>\w+)_\d+-(?P<recent_k>\d+)$', re.IGNORECASE)
+
+NOTIFICATION_PATH = "/api/cinotificationendpoint"
+REPORT_STORAGE_PATH = "/api/storereportendpoint"
+
+READ_CHUNK_SIZE = 64 * 1024
+MAX_HEADER_BYTES = 64 * 1024
+
+# the number of body chunks buffered between the connection and the thread unpacking a report stream
+REPORT_STREAM_BUFFER_CHUNKS = 16
+
+# the number of report streams unpacked at the same time, the other uploads wait before their body is read
+REPORT_WORKERS = 4
+
+REPORT_HASH_PATTERN = re.compile(r'^[0-9a-f]{40}$')
+
+HTTP_REASONS = {
+    200 : "OK",
+    202 : "Accepted",
+    400 : "Bad Request",
+    404 : "Not Found",
+    405 : "Method Not Allowed",
+    413 : "Payload Too Large",
+    500 : "Internal Server Error",
+}
+
+# Exception raised when the request can't be served, carries the HTTP status to respond with
+class HttpError(Exception):
+    def __init__(self, status, message):
+        Exception.__init__(self, message)
+        self.status = status
+
+# Function that formats the record of one CI job, the same format as the Azure function logs
+# @param job_id: the id of the job
+# @param job_state: the state of the job, i.e. "passed"
+# @param time_elapsed_sec: the duration of the job in seconds
+# @return the record as string
+def format_job_record(job_id, job_state, time_elapsed_sec):
+    return "Finished abstracting data: id {}; state {}; time {}\n".format(job_id, job_state, time_elapsed_sec)
+
+# Function that parses the time format used in Travis webhook payload, i.e. "2019-04-28T02:41:58Z"
+# @param timestamp: the time as string
+# @return datetime object. None if the timestamp is missing
+def parse_travis_time(timestamp):
+    if timestamp is None:
+        return None
+    return datetime.strptime(timestamp, "%Y-%m-%dT%H:%M:%SZ")
+
+# Function that abstracts the job records out of the Travis webhook payload
+# (format: https://docs.travis-ci.com/user/notifications#webhooks-delivery-format)
+# @param payload: the payload as dictionary
+# @return the records of the jobs in the build as string
+def abstract_job_records(payload):
+    log_string = ""
+    for job_detail in payload.get("matrix", []):
+        start = parse_travis_time(job_detail.get("started_at"))
+        end = parse_travis_time(job_detail.get("finished_at"))
+        time_elapsed_sec = 0.0
+        if start is not None and end is not None:
+            time_elapsed_sec = (end - start).total_seconds()
+        log_string += format_job_record(job_detail.get("id"), job_detail.get("state"), time_elapsed_sec)
+    return log_string
+
+# Function that makes a file name received from remote safe to be written into a directory
+# @param file_name: the file name provided by the client
+# @return the base name without path separators. None if nothing is left
+def sanitize_file_name(file_name):
+    file_name = os.path.basename(file_name.replace("\\", "/")).strip()
+    if file_name in ["", ".", ".."]:
+        return None
+    return file_name
+
+# QueueReader class is a read-only file object over the chunks put into a queue, so that
+# a request body received by the event loop can be read by a blocking reader in another thread.
+# None put into the queue marks the end of the body. The writer never blocks: it takes a credit
+# per chunk, and the reader gives one back for each chunk it takes and once more when it is closed
+class QueueReader:
+    # @param chunks: the queue.Queue object the chunks are put into
+    # @param give_back: function called by the reader to give a credit back, None if there are no credits
+    def __init__(self, chunks, give_back=None):
+        self.chunks_ = chunks
+        self.give_back_ = give_back
+        self.buffer_ = b""
+        self.eof_ = False
+        self.closed_ = False
+
+    def read(self, size=-1):
+        while not self.eof_ and (size < 0 or len(self.buffer_) < size):
+            chunk = self.chunks_.get()
+            if self.give_back_ is not None:
+                self.give_back_()
+            if chunk is None:
+                self.eof_ = True
+            else:
+                self.buffer_ += chunk
+        if size < 0:
+            size = len(self.buffer_)
+        data = self.buffer_[:size]
+        self.buffer_ = self.buffer_[size:]
+        return data
+
+    # Stop reading, the writer waiting for a credit is woken up to find the reader closed
+    def close(self):
+        self.closed_ = True
+        if self.give_back_ is not None:
+            self.give_back_()
+
+# Function that reads the headers of a HTTP request
+# @param reader: the asyncio StreamReader of the connection
+# @return tuple of (method, path, version, headers) where headers are keyed by lower case name.
+#    None if the connection is closed before a request arrives
+async def read_request_head(reader):
+    try:
+        head = await reader.readuntil(b"\r\n\r\n")
+    except asyncio.IncompleteReadError:
+        return None
+    except asyncio.LimitOverrunError:
+        raise HttpError(413, "Request header too large")
+    lines = head.decode("latin-1").split("\r\n")
+    request_line = lines[0].split()
+    if len(request_line) != 3:
+        raise HttpError(400, "Malformed request line")
+    headers = {}
+    for line in lines[1:]:
+        if ":" in line:
+            name, value = line.split(":", 1)
+            headers[name.strip().lower()] = value.strip()
+    return (request_line[0].upper(), request_line[1], request_line[2], headers)
+
+# Function that streams the body of a HTTP request, either sized by Content-Length or chunked
+# @param reader: the asyncio StreamReader of the connection
+# @param headers: the headers of the request
+# @param max_bytes: the maximum size of the body
+# @return async generator of the body as byte strings
+async def iter_request_body(reader, headers, max_bytes):
+    received = 0
+    if headers.get("transfer-encoding", "").lower() == "chunked":
+        while True:
+            size_line = await reader.readline()
+            size = int(size_line.split(b";")[0].strip() or b"0", 16)
+            if size == 0:
+                # trailers end with an empty line
+                while (await reader.readline()) not in [b"\r\n", b"\n", b""]:
+                    pass
+                return
+            received += size
+            if received > max_bytes:
+                raise HttpError(413, "Request body too large")
+            remaining = size
+            while remaining > 0:
+                chunk = await reader.read(min(remaining, READ_CHUNK_SIZE))
+                if len(chunk) == 0:
+                    raise HttpError(400, "Truncated request body")
+                remaining -= len(chunk)
+                yield chunk
+            await reader.readline()
+    else:
+        remaining = int(headers.get("content-length", "0"))
+        if remaining > max_bytes:
+            raise HttpError(413, "Request body too large")
+        while remaining > 0:
+            chunk = await reader.read(min(remaining, READ_CHUNK_SIZE))
+            if len(chunk) == 0:
+                raise HttpError(400, "Truncated request body")
+            remaining -= len(chunk)
+            yield chunk
+
+# Function that stores the files of a multipart/form-data body into a directory as the body
+# streams in, a file is only visible under its name once it has been received completely
+# @param body: async iterator of the body as byte strings
+# @param boundary: the multipart boundary as byte string
+# @param target_dir: the directory to store the files in
+# @return a list of the stored file names
+async def store_multipart_files(body, boundary, target_dir):
+    delimiter = b"\r\n--" + boundary
+    # the first delimiter is not preceded by CRLF
+    buffer = b"\r\n"
+    state = "preamble"
+    part_file = None
+    part_path = None
+    part_name = None
+    stored_files = []
+    async for chunk in body:
+        buffer += chunk
+        while True:
+            if state == "preamble":
+                idx = buffer.find(delimiter)
+                if idx < 0:
+                    buffer = buffer[-len(delimiter):]
+                    break
+                buffer = buffer[idx + len(delimiter):]
+                state = "boundary"
+            elif state == "boundary":
+                if len(buffer) < 2:
+                    break
+                if buffer[:2] == b"--":
+                    state = "epilogue"
+                elif buffer[:2] == b"\r\n":
+                    buffer = buffer[2:]
+                    state = "headers"
+                else:
+                    raise HttpError(400, "Malformed multipart boundary")
+            elif state == "headers":
+                idx = buffer.find(b"\r\n\r\n")
+                if idx < 0:
+                    if len(buffer) > MAX_HEADER_BYTES:
+                        raise HttpError(413, "Multipart header too large")
+                    break
+                match = re.search(r'filename="([^"]*)"', buffer[:idx].decode("utf-8", "replace"), re.IGNORECASE)
+                part_name = None if match is None else sanitize_file_name(match.group(1))
+                if part_name is not None:
+                    fd, part_path = tempfile.mkstemp(prefix=".upload", dir=target_dir)
+                    part_file = os.fdopen(fd, 'wb')
+                buffer = buffer[idx + 4:]
+                state = "body"
+            elif state == "body":
+                idx = buffer.find(delimiter)
+                if idx < 0:
+                    # keep the tail in case it is the start of the delimiter
+                    keep = len(delimiter)
+                    if part_file is not None and len(buffer) > keep:
+                        part_file.write(buffer[:-keep])
+                    buffer = buffer[-keep:]
+                    break
+                if part_file is not None:
+                    part_file.write(buffer[:idx])
+                    part_file.close()
+                    os.replace(part_path, os.path.join(target_dir, part_name))
+                    stored_files.append(part_name)
+                    part_file = None
+                buffer = buffer[idx + len(delimiter):]
+                state = "boundary"
+            else:
+                buffer = b""
+                break
+    if part_file is not None:
+        part_file.close()
+        os.remove(part_path)
+        raise HttpError(400, "Truncated multipart body")
+    return stored_files
+
+# ResponsiveServer class is a self-hosted replacement of the Azure functions in azure_function_code.
+# It serves the two endpoints the CI configuration generated by travis_setup reports to:
+#   * /api/CINotificationEndPoint receives the Travis webhook, records the job timings
+#     of the builds of interest as {branch}.txt and increments the {tag}_{idx}-{idx-1}
+#     branches after their first build by merging {tag}_seed_{idx-1} in the local repository
+#   * /api/StoreReportEndPoint receives the compressed test reports as multipart/form-data
+#     and streams them to {report_dir}/{file name}, or receives the report streams of
+#     SetupManager/reportUploader.py and stores each distinct report once in {report_dir}/objects
+# The increments are processed by a bounded pool of workers so that a burst of notifications
+# only queues up merges, and merges on the same repository are serialized. The report streams are
+# unpacked by threads of their own, so that a burst of uploads never takes the threads of the increments.
+class ResponsiveServer:
+    # Constructor that instantiate the ResponsiveServer object
+    # @param repo_base: the directory that contains the local git repositories as sub-directories,
+    #    the repository of a notification is found by its name
+    # @param report_dir: the directory to store the job records and the test reports
+    # @param merge_workers: the number of increments processed concurrently
+    # @param queue_size: the maximum number of increments waiting to be processed,
+    #    notifications wait for a free slot once the queue is full
+    # @param push: boolean to indicate if the incremented branches will be pushed to remote
+    # @param max_body_bytes: the maximum size of a request body
+    # @param build_cache: boolean to indicate if the results of the recorded builds are stored in
+    #    the build cache of the report directory, see BuildCache
+    # @param report_workers: the number of report streams unpacked at the same time
+    def __init__(self, repo_base, report_dir, merge_workers=4, queue_size=1000, push=True, \
+            max_body_bytes=1024 * 1024 * 1024, build_cache=False, report_workers=REPORT_WORKERS):
+        self.repo_base_ = repo_base
+        self.report_dir_ = report_dir
+        self.merge_workers_ = merge_workers
+        self.queue_size_ = queue_size
+        self.push_ = push
+        self.max_body_bytes_ = max_body_bytes
+        self.queue_ = None
+        self.workers_ = []
+        self.repo_locks_ = {}
+        self.server_ = None
+        self.report_workers_ = max(report_workers, 1)
+        self.report_executor_ = None
+        self.report_slots_ = None
+        self.record_executor_ = None
+        if not os.path.isdir(report_dir):
+            os.makedirs(report_dir)
+        self.build_cache_ = BuildCache(report_dir) if build_cache else None
+
+    # Start listening and start the merge workers
+    # @param host: the address to listen on
+    # @param port: the port to listen on, 0 to pick a free port
+    # @return the port the server listens on
+    async def start(self, host="127.0.0.1", port=8080):
+        self.queue_ = asyncio.Queue(maxsize=self.queue_size_)
+        # one thread per slot, an upload holds a slot until its thread is done
+        self.report_executor_ = ThreadPoolExecutor(max_workers=self.report_workers_)
+        self.report_slots_ = asyncio.Semaphore(self.report_workers_)
+        # the job records are written one at a time, waiting for the lock of the build cache off the event loop
+        self.record_executor_ = ThreadPoolExecutor(max_workers=1)
+        self.workers_ = [asyncio.ensure_future(self._merge_worker()) for _ in range(self.merge_workers_)]
+        self.server_ = await asyncio.start_server(self._handle_connection, host, port, limit=MAX_HEADER_BYTES)
+        return self.server_.sockets[0].getsockname()[1]
+
+    # Stop accepting connections, wait for the queued increments and stop the workers
+    async def stop(self):
+        self.server_.close()
+        await self.server_.wait_closed()
+        await self.queue_.join()
+        for worker in self.workers_:
+            worker.cancel()
+        await asyncio.gather(*self.workers_, return_exceptions=True)
+        self.report_executor_.shutdown(wait=True)
+        self.record_executor_.shutdown(wait=True)
+
+    # Helper function to serve the requests of one connection, the connection is kept alive
+    # unless the client asks to close it
+    # @param reader: the asyncio StreamReader of the connection
+    # @param writer: the asyncio StreamWriter of the connection
+    async def _handle_connection(self, reader, writer):
+        try:
+            while True:
+                try:
+                    request = await read_request_head(reader)
+                    if request is None:
+                        break
+                    method, target, version, headers = request
+                    status, message = await self._dispatch(method, urlsplit(target).path, \
+                        parse_qs(urlsplit(target).query), headers, iter_request_body(reader, headers, self.max_body_bytes_))
+                except HttpError as e:
+                    status, message = e.status, str(e)
+                    headers = {"connection" : "close"}
+                    version = "HTTP/1.1"
+                except Exception as e:
+                    print("Unexpected error: {}: {}".format(type(e).__name__, e))
+                    status, message = 500, "Unexpected error"
+                    headers = {"connection" : "close"}
+                    version = "HTTP/1.1"
+                keep_alive = version == "HTTP/1.1" and headers.get("connection", "").lower() != "close"
+                body = message.encode("utf-8")
+                writer.write("HTTP/1.1 {} {}\r\nContent-Type: text/plain; charset=utf-8\r\n" \
+                    "Content-Length: {}\r\nConnection: {}\r\n\r\n".format(status, HTTP_REASONS[status], \
+                    len(body), "keep-alive" if keep_alive else "close").encode("latin-1") + body)
+                await writer.drain()
+                if not keep_alive:
+                    break
+        except (ConnectionError, asyncio.IncompleteReadError):
+            pass
+        finally:
+            writer.close()
+
+    # Helper function to route a request to its handler, the body must be consumed by the handler
+    # @param method: the HTTP method
+    # @param path: the path of the request
+    # @param query: the query parameters of the request as returned by parse_qs
+    # @param headers: the headers of the request
+    # @param body: async iterator of the body as byte strings
+    # @return tuple of (HTTP status, response message)
+    async def _dispatch(self, method, path, query, headers, body):
+        path = path.rstrip("/").lower()
+        if path not in [NOTIFICATION_PATH, REPORT_STORAGE_PATH]:
+            async for _ in body:
+                pass
+            return (404, "Unknown endpoint")
+        if method != "POST":
+            async for _ in body:
+                pass
+            return (405, "Only POST is supported")
+        if path == NOTIFICATION_PATH:
+            return await self._handle_notification(headers, body)
+        return await self._handle_report(query, headers, body)
+
+    # Handle the CI notification, see CINotificationEndpoint.csx
+    # @param headers: the headers of the request
+    # @param body: async iterator of the body as byte strings
+    # @return tuple of (HTTP status, response message)
+    async def _handle_notification(self, headers, body):
+        request_body = b""
+        async for chunk in body:
+            request_body += chunk
+        request_body = request_body.decode("utf-8")
+        if headers.get("content-type", "").startswith("application/x-www-form-urlencoded"):
+            request_body = parse_qs(request_body).get("payload", [""])[0]
+        try:
+            payload = json.loads(request_body)
+            branch = payload["branch"]
+        except (ValueError, KeyError, TypeError):
+            raise HttpError(400, "Malformed payload")
+        print("Received commit {}: {} from {}".format(payload.get("commit"), payload.get("message"), branch))
+
+        match = INCREMENT_BRANCH_PATTERN.search(branch)
+        if match is not None:
+            # whether it is the first build (to be incremented) or the second build (to be recorded)
+            # is only known once the repository is checked, leave it to the workers
+            await self.queue_.put((payload, match.group("tool_name"), int(match.group("recent_k"))))
+            return (202, "Queued for increment")
+        if SEED_BRANCH_PATTERN.search(branch) is None:
+            return (200, "Build for {} branch will not be recorded".format(branch))
+        await asyncio.get_running_loop().run_in_executor(self.record_executor_, self._record_jobs, branch, payload)
+        return (200, "Message Received")
+
+    # Handle the test report upload, see StoreReportEndpoint.csx. Besides the multipart upload of
+    # the Azure function, the deduplicating protocol of SetupManager/reportUploader.py is served:
+    # a JSON list of report hashes is answered with the hashes not stored yet, and a report stream
+    # stores the new reports by content and the manifest of the job as {report_dir}/{name}.manifest
+    # @param query: the query parameters of the request, "name" names the report stream
+    # @param headers: the headers of the request
+    # @param body: async iterator of the body as byte strings
+    # @return tuple of (HTTP status, response message)
+    async def _handle_report(self, query, headers, body):
+        content_type = headers.get("content-type", "")
+        if content_type.startswith("application/json"):
+            return await self._check_reports(body)
+        if content_type.startswith(REPORT_STREAM_CONTENT_TYPE):
+            name = sanitize_file_name(query.get("name", [""])[0])
+            if name is None:
+                async for _ in body:
+                    pass
+                raise HttpError(400, "Expecting the name of the reports")
+            return await self._store_report_stream(name, body)
+        match = re.search(r'boundary="?([^";]+)"?', content_type)
+        if not headers.get("content-type", "").startswith("multipart/form-data") or match is None:
+            async for _ in body:
+                pass
+            raise HttpError(400, "Expecting multipart/form-data")
+        stored_files = await store_multipart_files(body, match.group(1).encode("latin-1"), self.report_dir_)
+        for stored_file in stored_files:
+            print("Stored report {}".format(stored_file))
+        return (200, "Message Received")
+
+    # Helper function to answer which of the reports are not stored yet
+    # @param body: async iterator of the body as byte strings, {"hashes": [...]}
+    # @return tuple of (HTTP status, response message) where the message is {"missing": [...]}
+    async def _check_reports(self, body):
+        request_body = b""
+        async for chunk in body:
+            request_body += chunk
+        try:
+            hashes = json.loads(request_body.decode("utf-8"))["hashes"]
+        except (ValueError, KeyError, TypeError):
+            raise HttpError(400, "Malformed payload")
+        missing = [digest for digest in hashes if not isinstance(digest, str) \
+            or not os.path.isfile(self._report_object_path(digest))]
+        return (200, json.dumps({"missing" : missing}))
+
+    # Helper function to store a report stream, the body is unpacked by a thread of the report executor
+    # as it streams in. The event loop hands the chunks over without blocking, see QueueReader
+    # @param name: the name of the reports, {branch}_{job}
+    # @param body: async iterator of the body as byte strings
+    # @return tuple of (HTTP status, response message)
+    async def _store_report_stream(self, name, body):
+        loop = asyncio.get_running_loop()
+        async with self.report_slots_:
+            chunks = queue.Queue()
+            credits = asyncio.Semaphore(REPORT_STREAM_BUFFER_CHUNKS)
+            reader = QueueReader(chunks, lambda: loop.call_soon_threadsafe(credits.release))
+            unpacking = loop.run_in_executor(self.report_executor_, self._store_report_archive, name, reader)
+            try:
+                # keep reading until the body ends, the rest of the body is discarded if unpacking stops early
+                async for chunk in body:
+                    if not reader.closed_:
+                        await credits.acquire()
+                        chunks.put(chunk)
+            except BaseException:
+                # the client is gone, the thread unpacks what it has got and the slot is freed once it is done
+                chunks.put(None)
+                await asyncio.gather(unpacking, return_exceptions=True)
+                raise
+            chunks.put(None)
+            try:
+                stored, deduplicated, missing = await unpacking
+            except (tarfile.TarError, OSError, EOFError, ValueError) as e:
+                raise HttpError(400, "Malformed report stream: {}".format(e))
+        print("Stored reports {}: {} new, {} deduplicated, {} missing".format(name, stored, deduplicated, len(missing)))
+        return (200, json.dumps({"stored" : stored, "deduplicated" : deduplicated, "missing" : missing}))
+
+    # Helper function to unpack a report stream, the reports are stored by content in
+    # {report_dir}/objects and the manifest of the reports is written to {report_dir}/{name}.manifest.
+    # A report listed in the manifest but neither sent nor stored before is left out and reported as missing
+    # @param name: the name of the reports
+    # @param reader: the QueueReader object of the body, closed once the archive is unpacked or unpacking failed
+    # @return tuple of (number of new reports, number of reports stored before, list of missing paths)
+    def _store_report_archive(self, name, reader):
+        try:
+            stored = 0
+            deduplicated = 0
+            received = {}
+            manifest = None
+            with tarfile.open(fileobj=reader, mode="r|gz") as archive:
+                for member in archive:
+                    if not member.isfile():
+                        continue
+                    if member.name == "manifest":
+                        manifest = archive.extractfile(member).read().decode("utf-8")
+                    elif member.name.startswith("reports/"):
+                        digest, is_new = self._store_report_object(archive.extractfile(member))
+                        received[member.name[len("reports/"):]] = digest
+                        if is_new:
+                            stored += 1
+                        else:
+                            deduplicated += 1
+            # read what is left such as the end of the gzip stream
+            reader.read()
+        finally:
+            reader.close()
+        if manifest is None or not manifest.startswith(REPORT_MANIFEST_VERSION + "\n"):
+            raise ValueError("missing manifest")
+        entries = []
+        missing = []
+        for line in manifest.splitlines()[1:]:
+            fields = line.split(" ", 2)
+            if len(fields) != 3:
+                continue
+            digest, size, path = fields
+            if path in received:
+                digest = received[path]
+            elif os.path.isfile(self._report_object_path(digest)):
+                deduplicated += 1
+            else:
+                missing.append(path)
+                continue
+            entries.append("{} {} {}\n".format(digest, size, path))
+        fd, tmp_path = tempfile.mkstemp(prefix=".upload", dir=self.report_dir_)
+        with os.fdopen(fd, 'w') as write_file:
+            write_file.write(REPORT_MANIFEST_VERSION + "\n" + "".join(entries))
+        os.replace(tmp_path, os.path.join(self.report_dir_, "{}.manifest".format(name)))
+        return (stored, deduplicated, missing)
+
+    # Helper function to store one report by its content, nothing is written if it is stored already
+    # @param source: the file object of the report
+    # @return tuple of (hash of the content, True if the report is new)
+    def _store_report_object(self, source):
+        objects_dir = os.path.join(self.report_dir_, "objects")
+        os.makedirs(objects_dir, exist_ok=True)
+        digest = hashlib.sha1()
+        fd, tmp_path = tempfile.mkstemp(prefix=".upload", dir=objects_dir)
+        with os.fdopen(fd, 'wb') as write_file:
+            for chunk in iter(lambda: source.read(READ_CHUNK_SIZE), b""):
+                digest.update(chunk)
+                write_file.write(chunk)
+        digest = digest.hexdigest()
+        object_path = self._report_object_path(digest)
+        if os.path.isfile(object_path):
+            os.remove(tmp_path)
+            return (digest, False)
+        os.makedirs(os.path.dirname(object_path), exist_ok=True)
+        os.replace(tmp_path, object_path)
+        return (digest, True)
+
+    # @param digest: the hash of a report
+    # @return the path the report is stored at, a path that never exists if the hash is malformed
+    def _report_object_path(self, digest):
+        if REPORT_HASH_PATTERN.match(digest) is None:
+            return os.path.join(self.report_dir_, "objects", "invalid")
+        return os.path.join(self.report_dir_, "objects", digest[:2], digest[2:])
+
+    # Helper function to write the job records of a build to {report_dir}/{branch}.txt,
+    # the results of a passed build are also stored in the build cache if it is used.
+    # It blocks on the database of the build cache, so it is run by the record executor
+    # @param branch: the branch of the build
+    # @param payload: the webhook payload as dictionary
+    def _record_jobs(self, branch, payload):
+        file_name = sanitize_file_name("{}.txt".format(branch))
+        job_records = abstract_job_records(payload)
+        with open(os.path.join(self.report_dir_, file_name), 'w') as write_file:
+            write_file.write(job_records)
+        if self.build_cache_ is not None:
+            # the reports of job "{build}.{n}" are uploaded as {branch}_{n}, see reportUploader.default_name
+            jobs = [str(job_detail.get("number", "")).split(".")[-1] for job_detail in payload.get("matrix", [])]
+            if self.build_cache_.store(payload.get("repository", {}).get("name", ""), branch, job_records, jobs):
+                print("Stored the results of {} in the build cache".format(branch))
+
+    # Helper function run by each merge worker, it takes the queued notifications of
+    # {tag}_{idx}-{idx-1} branches and either increments the branch or records the build
+    async def _merge_worker(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            payload, tag, recent_k = await self.queue_.get()
+            try:
+                repo_name = payload.get("repository", {}).get("name", "")
+                repo_dir = os.path.join(self.repo_base_, sanitize_file_name(repo_name) or "")
+                if repo_dir not in self.repo_locks_:
+                    self.repo_locks_[repo_dir] = asyncio.Lock()
+                async with self.repo_locks_[repo_dir]:
+                    incremented = await loop.run_in_executor(None, \
+                        self._increment, repo_dir, payload["branch"], tag, recent_k)
+                if incremented:
+                    print("Trigger commit incrementation on branch {}".format(payload["branch"]))
+                else:
+                    await loop.run_in_executor(self.record_executor_, self._record_jobs, payload["branch"], payload)
+            except Exception as e:
+                print("Failed to process {}: {}: {}".format(payload.get("branch"), type(e).__name__, e))
+            finally:
+                self.queue_.task_done()
+
+    # Helper function to increment a {tag}_{idx}-{idx-1} branch in the local repository without
+    # touching its working tree, the branch is left as is if {tag}_seed_{idx-1} has been merged already
+    # @param repo_dir: the path to the local repository
+    # @param branch: the branch to be incremented
+    # @param tag: the tag of the branch
+    # @param recent_k: the {idx-1} of the branch
+    # @return True if the branch is incremented, False if it has been incremented before.
+    def _increment(self, repo_dir, branch, tag, recent_k):
+        git_repo = GitReplay(repo_dir)
+        if git_repo.repo_dir_ is None:
+            raise ValueError("{} is not a Git directory".format(repo_dir))
+        if call(['git', 'merge-base', '--is-ancestor', 'refs/heads/{}_seed_{}'.format(tag, recent_k), \
+            'refs/heads/{}'.format(branch)], cwd=repo_dir) == 0:
+            return False
+        if not git_repo.proceed_commit_history(tag, push=self.push_, idx_list=[recent_k + 1], in_memory=True):
+            raise ValueError("failed to increment {}".format(branch))
+        return True
+
+if __name__ == "__main__":
+    usage = "usage: python %prog [options]"
+    parser = OptionParser(usage=usage)
+    parser.add_option("--host", dest="host", default="127.0.0.1",
+                    help="address to listen on [default: %default]")
+    parser.add_option("--port", type="int", dest="port", default=8080,
+                    help="port to listen on [default: %default]")
+    parser.add_option("--repo-base", dest="repo_base", default=os.environ.get('REPO_BASE'),
+                    help="directory that contains the git repositories [default: $REPO_BASE]")
+    parser.add_option("--report-dir", dest="report_dir", default="test-reports",
+                    help="directory to store job records and test reports [default: %default]")
+    parser.add_option("--workers", type="int", dest="workers", default=4,
+                    help="number of increments processed concurrently [default: %default]")
+    parser.add_option("--no-push", action="store_false", dest="push", default=True,
+                    help="don't push the incremented branches to remote")
+    parser.add_option("--report-workers", type="int", dest="report_workers", default=REPORT_WORKERS,
+                    help="number of report streams unpacked concurrently [default: %default]")
+    parser.add_option("--build-cache", action="store_true", dest="build_cache", default=False,
+                    help="store the results of the recorded builds in the build cache of the report directory")
+    (options, args) = parser.parse_args()
+
+    server = ResponsiveServer(options.repo_base, options.report_dir, options.workers, push=options.push, \
+        build_cache=options.build_cache, report_workers=options.report_workers)
+    loop = asyncio.new_event_loop()
+    port = loop.run_until_complete(server.start(options.host, options.port))
+    print("Listening on {}:{}".format(options.host, port))
+    try:
+        loop.run_forever()
+    except KeyboardInterrupt:
+        loop.run_until_complete(server.stop())
+    exit(0)
@@ -1,10 +1,207 @@
 import os
+import codecs
 import xml.etree.ElementTree as ET
+from xml.parsers import expat
+from concurrent.futures import ProcessPoolExecutor
 
 # avoid ET filling namespace
 POM_NAMESPACE = "http://maven.apache.org/POM/4.0.0"
 ET.register_namespace("", POM_NAMESPACE)
 
+# directories that never contain pom.xml files of interest: build output and VCS metadata
+IGNORED_DIRECTORIES = set(["target", ".git", ".hg", ".svn"])
+
+# the pom.xml files are spliced by a pool of worker processes only when there are at least this many
+MIN_FILES_PER_POOL = 16
+
+# the indentation of a plugin when the plugins element has no plugin to take it from
+DEFAULT_INDENT = "    "
+
+# encodings whose bytes of "<", ">", "/" and whitespace are the ASCII bytes, the offsets of the splice
+# are only valid for those, the pom.xml files in other encodings are rewritten by ElementTree
+ASCII_COMPATIBLE_ENCODINGS = set(["utf-8", "ascii", "latin-1", "iso8859-1", "cp1252"])
+
+# Function that reads the plugin configuration as text for splicing, see add_plugin for the format
+# @param plugin_setting_xml: path to the separate xml file that defines the plugin configuration
+# @return the configuration without XML declaration and surrounding whitespace as string
+def read_plugin_text(plugin_setting_xml):
+    with open(plugin_setting_xml, 'r', encoding="utf-8") as read_file:
+        text = read_file.read().strip()
+    if text.startswith("<?xml"):
+        text = text[text.index("?>") + 2:].strip()
+    return text
+
+# Function that finds where the plugins are spliced into a pom.xml file, with one expat pass over the
+# file and the same rule as the ElementTree rewrite: the immediate plugins elements of the first build
+# @param content: the content of the pom.xml file as byte string
+# @return tuple of (encoding of the file, list of insertion points) where each insertion point is
+#    a dictionary of the byte offsets of the build element ("build") and the plugins element in it
+#    ("start", "close" of "</plugins>", and "end" after "/>" if it is an empty element), the byte offset
+#    of the first plugin in it ("first") and the set of artifact IDs of the plugins in it ("artifact_ids")
+def find_insertion_points(content):
+    parser = expat.ParserCreate(namespace_separator=" ")
+    build_name = "{} build".format(POM_NAMESPACE)
+    plugins_name = "{} plugins".format(POM_NAMESPACE)
+    plugin_name = "{} plugin".format(POM_NAMESPACE)
+    artifact_id_name = "{} artifactId".format(POM_NAMESPACE)
+    state = {"encoding" : "utf-8", "depth" : 0, "build_depth" : None, "build_start" : None, "build_done" : False, \
+        "point" : None, "plugin_depth" : None, "artifact_id" : None}
+    points = []
+
+    def xml_decl(version, encoding, standalone):
+        if encoding is not None:
+            state["encoding"] = encoding
+
+    def start_element(name, attributes):
+        state["depth"] += 1
+        depth = state["depth"]
+        if state["build_depth"] is None:
+            if name == build_name and not state["build_done"]:
+                state["build_depth"] = depth
+                state["build_start"] = parser.CurrentByteIndex
+            return
+        if depth == state["build_depth"] + 1 and name == plugins_name:
+            state["point"] = {"build" : state["build_start"], "start" : parser.CurrentByteIndex, "first" : None, \
+                "artifact_ids" : set()}
+        elif state["point"] is not None:
+            if depth == state["build_depth"] + 2 and state["point"]["first"] is None:
+                state["point"]["first"] = parser.CurrentByteIndex
+            if name == plugin_name and state["plugin_depth"] is None:
+                state["plugin_depth"] = depth
+            elif name == artifact_id_name and state["plugin_depth"] is not None:
+                state["artifact_id"] = []
+
+    def end_element(name):
+        depth = state["depth"]
+        state["depth"] -= 1
+        if state["build_depth"] is None:
+            return
+        if depth == state["build_depth"]:
+            state["build_depth"] = None
+            state["build_done"] = True
+        elif depth == state["build_depth"] + 1 and state["point"] is not None:
+            state["point"]["close"] = parser.CurrentByteIndex
+            points.append(state["point"])
+            state["point"] = None
+        elif name == artifact_id_name and state["artifact_id"] is not None:
+            state["point"]["artifact_ids"].add("".join(state["artifact_id"]))
+            state["artifact_id"] = None
+        elif depth == state["plugin_depth"]:
+            state["plugin_depth"] = None
+
+    def character_data(data):
+        if state["artifact_id"] is not None:
+            state["artifact_id"].append(data)
+
+    parser.XmlDeclHandler = xml_decl
+    parser.StartElementHandler = start_element
+    parser.EndElementHandler = end_element
+    parser.CharacterDataHandler = character_data
+    parser.Parse(content, True)
+    for point in points:
+        # an empty element has no end tag
+        if not content.startswith(b"</", point["close"]):
+            point["end"] = content.index(b">", point["start"]) + 1
+    return (state["encoding"], points)
+
+# Helper function to get the whitespace a line starts with up to a byte offset
+# @param content: the content as byte string
+# @param offset: the byte offset
+# @return tuple of (offset of the line start, the whitespace), the whitespace is None
+#    if the line has anything else before the offset
+def line_indent(content, offset):
+    line_start = content.rfind(b"\n", 0, offset) + 1
+    indent = content[line_start:offset]
+    return (line_start, indent if indent.strip() == b"" else None)
+
+# Function that indents a plugin configuration, each indentation level of the configuration
+# becomes one unit of the indentation of the pom.xml file
+# @param text: the plugin configuration as byte string
+# @param indent: the indentation of the plugin element as byte string
+# @param unit: one level of indentation as byte string
+# @return list of the indented lines as byte strings
+def indent_lines(text, indent, unit):
+    lines = [line.rstrip() for line in text.splitlines()]
+    widths = [len(line) - len(line.lstrip()) for line in lines if line != b""]
+    text_unit = min([width for width in widths if width > 0], default=1)
+    return [indent + unit * ((len(line) - len(line.lstrip())) // text_unit) + line.lstrip() if line != b"" else line \
+        for line in lines]
+
+# Function that splices the plugin configurations into the plugins elements found by find_insertion_points,
+# the plugins are indented after the plugins already there (or the enclosing elements) and the rest
+# of the file is untouched
+# @param content: the content of the pom.xml file as byte string
+# @param plugin_texts: list of the plugin configurations as string, see read_plugin_text
+# @param plugin_artifact_ids: list of the artifact IDs of the plugins
+# @param ignore: boolean to indicate if the plugins included already are left out
+# @return the new content as byte string, None if the file can't be spliced
+def splice_plugins(content, plugin_texts, plugin_artifact_ids, ignore=True):
+    encoding, points = find_insertion_points(content)
+    if codecs.lookup(encoding).name not in ASCII_COMPATIBLE_ENCODINGS:
+        return None
+    newline = b"\r\n" if b"\r\n" in content else b"\n"
+    # splice from the end so that the offsets before stay valid
+    for point in reversed(points):
+        texts = [plugin_text.encode(encoding) for plugin_text, plugin_artifact_id in zip(plugin_texts, plugin_artifact_ids) \
+            if not (ignore and plugin_artifact_id in point["artifact_ids"])]
+        if len(texts) == 0:
+            continue
+        line_start, close_indent = line_indent(content, point["start"] if "end" in point else point["close"])
+        own_line = close_indent is not None and "end" not in point
+        if close_indent is None:
+            # "</plugins>" follows the last plugin on its line, the plugins go on lines of their own
+            # with "</plugins>" indented as the "<plugins>" line
+            close_indent = line_indent(content, point["start"])[1]
+        if close_indent is None:
+            # no line of its own, no indentation to follow
+            inserted = b"".join(texts)
+        else:
+            build_indent = line_indent(content, point["build"])[1]
+            plugin_indent = line_indent(content, point["first"])[1] if point["first"] is not None else None
+            unit = DEFAULT_INDENT.encode(encoding)
+            for outer, inner in [(close_indent, plugin_indent), (build_indent, close_indent)]:
+                if outer is not None and inner is not None and len(inner) > len(outer) and inner.startswith(outer):
+                    unit = inner[len(outer):]
+                    break
+            inserted = b"".join(newline.join(indent_lines(text, close_indent + unit, unit)) + newline for text in texts)
+        if own_line:
+            content = content[:line_start] + inserted + content[line_start:]
+            continue
+        if close_indent is not None:
+            inserted = newline + inserted + close_indent
+        if "end" in point:
+            # <plugins/> becomes <plugins>...</plugins>
+            tag = content[point["start"]:point["end"]]
+            name = tag[1:-2].split()[0]
+            content = content[:point["start"]] + tag[:-2].rstrip() + b">" + inserted + b"</" + name + b">" + \
+                content[point["end"]:]
+        else:
+            content = content[:point["close"]] + inserted + content[point["close"]:]
+    return content
+
+# Function that adds the plugins to one pom.xml file with a minimal textual edit, run by the worker processes.
+# The result is checked to be well-formed before it is written
+# @param pom_file: the path to the pom.xml file
+# @param plugin_texts: list of the plugin configurations as string, see read_plugin_text
+# @param plugin_artifact_ids: list of the artifact IDs of the plugins
+# @param ignore: boolean to indicate if the plugins included already are left out
+# @param output_file: the path to write to
+# @return True if the file is spliced, False if it has to be rewritten by ElementTree instead
+def splice_plugins_into_pom(pom_file, plugin_texts, plugin_artifact_ids, ignore, output_file):
+    with open(pom_file, 'rb') as read_file:
+        content = read_file.read()
+    try:
+        spliced = splice_plugins(content, plugin_texts, plugin_artifact_ids, ignore)
+        if spliced is None:
+            return False
+        ET.fromstring(spliced)
+    except (expat.ExpatError, ET.ParseError, LookupError, ValueError):
+        return False
+    if spliced != content or output_file != pom_file:
+        with open(output_file, 'wb') as write_file:
+            write_file.write(spliced)
+    return True
+
 # PomManager class is a wrapper over xml library to handle common operations
 # specifically for pom.xml files: finding specific plugin and adding specific plugin
 # Note that the PomManager modify pom.xml files in a given directory recursively if specified.
@@ -26,9 +223,11 @@ class PomManager:
         for root, dirs, files in os.walk(repo_dir):
             if "pom.xml" in files:
                 result.append(os.path.join(root, "pom.xml"))
-            if (recursive):
-                for sub_dir in dirs:
-                    result += self.find_pom_files(sub_dir)
+            if recursive:
+                # os.walk visits the remaining sub directories by itself, prune the ignored ones in place
+                dirs[:] = sorted(sub_dir for sub_dir in dirs if sub_dir not in IGNORED_DIRECTORIES)
+            else:
+                dirs[:] = []
         return result
 
     # Add a plugin defined in a separate xml file to all the pom.xml files managed by this PomManager
@@ -42,11 +241,37 @@ class PomManager:
     # @param output_file_name: the output file to be written to. If None, overwrite the pom.xml file.
     #    Usually used to verify if the output matches the expectation before trying to
     #    overwrite the original files
-    def add_plugin(self, plugin_setting_xml, ignore=True, output_file_name=None):
-        plugin_tree = ET.parse(plugin_setting_xml)
-        plugin = plugin_tree.getroot()
-        plugin_artifact_id = self.get_artifact_id(plugin)
-        for pom_file in self.pom_list:
+    # @param preserve_format: boolean to indicate if the plugin is spliced into the files as text, see add_plugins
+    # @param max_workers: the number of worker processes to splice the files with, see add_plugins
+    def add_plugin(self, plugin_setting_xml, ignore=True, output_file_name=None, preserve_format=False, max_workers=None):
+        self.add_plugins([plugin_setting_xml], ignore, output_file_name, preserve_format, max_workers)
+
+    # Add several plugins defined in separate xml files to all the pom.xml files managed by this PomManager,
+    # each pom.xml file is parsed once and written once no matter how many plugins are added.
+    # See add_plugin for the format of the xml files and the meaning of the other parameters
+    # @param plugin_setting_xmls: list of paths to the separate xml files that define the plugin configurations,
+    #    the plugins are appended in the order of the list
+    # @param ignore: boolean to indicate if the plugin will be added even if 
+    #    it has been included in the pom.xml file. If False, the plugin will be added anyway
+    # @param output_file_name: the output file to be written to. If None, overwrite the pom.xml file.
+    # @param preserve_format: boolean to indicate if the plugins are spliced into the files as text before
+    #    "</plugins>" instead of writing the whole document again with ElementTree, so that the rest of the
+    #    files (formatting, comments, declarations) is untouched. The files are located with one expat pass
+    #    and spliced by a pool of worker processes; a file whose result doesn't parse is rewritten by ElementTree
+    # @param max_workers: the number of worker processes to splice the files with, the number of CPUs if None;
+    #    the files are spliced in this process if there are fewer than MIN_FILES_PER_POOL
+    def add_plugins(self, plugin_setting_xmls, ignore=True, output_file_name=None, preserve_format=False, \
+            max_workers=None):
+        plugins = [ET.parse(plugin_setting_xml).getroot() for plugin_setting_xml in plugin_setting_xmls]
+        plugin_artifact_ids = [self.get_artifact_id(plugin) for plugin in plugins]
+        pom_files = self.pom_list
+        if preserve_format:
+            plugin_texts = [read_plugin_text(plugin_setting_xml) for plugin_setting_xml in plugin_setting_xmls]
+            pom_files = [pom_file for pom_file, spliced in zip(self.pom_list, self._splice_plugins( \
+                plugin_texts, plugin_artifact_ids, ignore, output_file_name, max_workers)) if not spliced]
+        for pom_file in pom_files:
+            if preserve_format:
+                print("Failed to splice plugins into {}, rewriting it".format(pom_file))
             pom_tree = ET.parse(pom_file)
             pom_root = pom_tree.getroot()
             # only care about the (immediate) plugins field in the first build (ignore plugins in pluginManagement)
@@ -54,17 +279,35 @@ class PomManager:
             for build in pom_root.iter("{" + POM_NAMESPACE + "}" + "build"):
                 for child in build:
                     if child.tag == "{" + POM_NAMESPACE + "}" + "plugins":
-                        # The plugin has been added
-                        if self.get_plugin_by_artifact_id(child, plugin_artifact_id) is not None \
-                            and ignore:
-                            continue
-                        child.append(plugin)
+                        for plugin, plugin_artifact_id in zip(plugins, plugin_artifact_ids):
+                            # The plugin has been added
+                            if self.get_plugin_by_artifact_id(child, plugin_artifact_id) is not None \
+                                and ignore:
+                                continue
+                            child.append(plugin)
                 break
             if output_file_name is not None:
                 pom_tree.write(os.path.join(os.path.dirname(pom_file), output_file_name))
             else:
                 pom_tree.write(pom_file)
 
+    # Helper function to splice the plugins into all the pom.xml files, see splice_plugins_into_pom
+    # @param plugin_texts: list of the plugin configurations as string
+    # @param plugin_artifact_ids: list of the artifact IDs of the plugins
+    # @param ignore: boolean to indicate if the plugins included already are left out
+    # @param output_file_name: the output file to be written to. If None, overwrite the pom.xml file.
+    # @param max_workers: the number of worker processes, the number of CPUs if None
+    # @return list of booleans in the order of pom_list, True if the file is spliced
+    def _splice_plugins(self, plugin_texts, plugin_artifact_ids, ignore, output_file_name, max_workers):
+        jobs = [(pom_file, plugin_texts, plugin_artifact_ids, ignore, pom_file if output_file_name is None \
+            else os.path.join(os.path.dirname(pom_file), output_file_name)) for pom_file in self.pom_list]
+        max_workers = max_workers or os.cpu_count() or 1
+        if max_workers <= 1 or len(jobs) < MIN_FILES_PER_POOL:
+            return [splice_plugins_into_pom(*job) for job in jobs]
+        with ProcessPoolExecutor(max_workers=max_workers) as executor:
+            return list(executor.map(splice_plugins_into_pom, *zip(*jobs), \
+                chunksize=max(len(jobs) // (max_workers * 4), 1)))
+
     # Get the specified plugin configuration as ET object if it exists
     # @param pom_root: the root as ET object to search for the specified plugin
     # @param plugin_artifact_id: the artifact ID that specify the plugin
@@ -0,0 +1,208 @@
+import os
+import json
+import hashlib
+import tempfile
+
+from .PomManager import PomManager
+from .constants import *
+
+# bump it whenever the output of the setup functions changes for the same input
+SETUP_CACHE_VERSION = 2
+
+# files besides pom.xml files that the setup functions read
+SETUP_INPUT_FILES = [".travis.yml"]
+
+# SetupCache class memoizes the setup functions returned by ExperimentHelper.get_setup_function.
+# The result of a setup is keyed by the git blob hashes of the files the setup reads
+# (pom.xml files and the CI configuration) and the identity of the setup function, and
+# the content of the files it writes are stored as blobs. Seeds whose input files are
+# identical to a previous seed reuse the stored output instead of running the setup again.
+# The cache is stored in a directory so that it persists across runs:
+#   * objects/{blob hash}: the content of the output files, shared by all entries
+#   * entries/{key}.json: the output files of one setup, the modification time records the last use
+# The size of the objects is bounded, the least recently used entries are evicted first.
+class SetupCache:
+    # Constructor that instantiate the SetupCache object with respect to the provided directory
+    # @param cache_dir: the path to directory where the cache is stored, created if it doesn't exist
+    # @param max_bytes: the maximum total size of the stored output files
+    def __init__(self, cache_dir, max_bytes=512 * 1024 * 1024):
+        self.cache_dir_ = cache_dir
+        self.max_bytes_ = max_bytes
+        self.hits_ = 0
+        self.misses_ = 0
+        for sub_dir in ["objects", "entries"]:
+            os.makedirs(os.path.join(cache_dir, sub_dir), exist_ok=True)
+
+    # Check if the setup function can be memoized
+    # @param setup_function: the setup function to be checked
+    # @return True if the function carries the identity set by ExperimentHelper.get_setup_function
+    @staticmethod
+    def is_cacheable(setup_function):
+        return getattr(setup_function, "setup_identity", None) is not None
+
+    # Run the setup function on the given directory, or reuse the stored output
+    # if the same setup has been run on identical input files before
+    # @param setup_function: the setup function, see is_cacheable
+    # @param repo_dir: the directory to be set up
+    # @return a list of files that are modified by the setup function
+    def run(self, setup_function, repo_dir):
+        key = self._compute_key(setup_function.setup_identity, repo_dir)
+        entry = self._load_entry(key)
+        if entry is not None:
+            self.hits_ += 1
+            return self._restore(entry, repo_dir)
+        self.misses_ += 1
+        modified_files = setup_function(repo_dir)
+        self._store(key, repo_dir, modified_files)
+        return modified_files
+
+    # @return a summary of the cache usage as string
+    def summary(self):
+        return "Setup cache: {} hits, {} misses".format(self.hits_, self.misses_)
+
+    # Helper function to compute the key of a setup
+    # @param setup_identity: the identity of the setup function
+    # @param repo_dir: the directory to be set up
+    # @return the key as hex string
+    def _compute_key(self, setup_identity, repo_dir):
+        digest = hashlib.sha256()
+        digest.update(json.dumps([SETUP_CACHE_VERSION, list(setup_identity)]).encode("utf-8"))
+        # the plugin configurations and the shipped scripts are part of the setup as well
+        for plugin_setting_xml in [EKSTAZI_XML_PATH, STARTS_XML_PATH, SUREFIRE_XML_PATH, ARTIFACT_CACHE_SCRIPT_PATH, \
+            REPORT_UPLOADER_SCRIPT_PATH]:
+            digest.update(self._hash_file(plugin_setting_xml).encode("utf-8"))
+        for input_file in self._find_input_files(repo_dir):
+            digest.update("{} {}\n".format(os.path.relpath(input_file, repo_dir), \
+                self._hash_file(input_file)).encode("utf-8"))
+        return digest.hexdigest()
+
+    # Helper function to list the files that the setup functions read
+    # @param repo_dir: the directory to be set up
+    # @return a sorted list of paths
+    def _find_input_files(self, repo_dir):
+        input_files = PomManager(repo_dir).pom_list
+        input_files += [os.path.join(repo_dir, input_file) for input_file in SETUP_INPUT_FILES \
+            if os.path.isfile(os.path.join(repo_dir, input_file))]
+        return sorted(input_files)
+
+    # Helper function to hash a file the same way git hashes a blob
+    # @param path: the path to the file
+    # @return the blob hash as hex string
+    def _hash_file(self, path):
+        with open(path, 'rb') as read_file:
+            return self._hash_blob(read_file.read())
+
+    # @param content: the content of the blob as byte string
+    # @return the git blob hash of the content as hex string
+    def _hash_blob(self, content):
+        return hashlib.sha1("blob {}\0".format(len(content)).encode("utf-8") + content).hexdigest()
+
+    # Helper function to read a stored entry and mark it as recently used
+    # @param key: the key of the setup
+    # @return dictionary that maps relative path to blob hash. None if it is not stored
+    def _load_entry(self, key):
+        entry_file = os.path.join(self.cache_dir_, "entries", "{}.json".format(key))
+        try:
+            with open(entry_file, 'r') as read_file:
+                entry = json.load(read_file)
+            os.utime(entry_file, None)
+        except (IOError, OSError, ValueError):
+            return None
+        for blob in entry.values():
+            if not os.path.isfile(os.path.join(self.cache_dir_, "objects", blob)):
+                # the blob is evicted by another run
+                return None
+        return entry
+
+    # Helper function to write the stored output files into the directory
+    # @param entry: dictionary that maps relative path to blob hash
+    # @param repo_dir: the directory to be set up
+    # @return a list of files that are written
+    def _restore(self, entry, repo_dir):
+        modified_files = []
+        for relative_path, blob in sorted(entry.items()):
+            with open(os.path.join(self.cache_dir_, "objects", blob), 'rb') as read_file:
+                content = read_file.read()
+            output_file = os.path.join(repo_dir, relative_path)
+            os.makedirs(os.path.dirname(output_file), exist_ok=True)
+            with open(output_file, 'wb') as write_file:
+                write_file.write(content)
+            modified_files.append(output_file)
+        return modified_files
+
+    # Helper function to store the output files of a setup
+    # @param key: the key of the setup
+    # @param repo_dir: the directory that has been set up
+    # @param modified_files: the list of files that are modified by the setup function
+    def _store(self, key, repo_dir, modified_files):
+        entry = {}
+        for modified_file in modified_files:
+            with open(modified_file, 'rb') as read_file:
+                content = read_file.read()
+            blob = self._hash_blob(content)
+            blob_file = os.path.join(self.cache_dir_, "objects", blob)
+            if not os.path.isfile(blob_file):
+                self._write_atomically(blob_file, content)
+            entry[os.path.relpath(modified_file, repo_dir)] = blob
+        self._write_atomically(os.path.join(self.cache_dir_, "entries", "{}.json".format(key)), \
+            json.dumps(entry, sort_keys=True).encode("utf-8"))
+        self._evict()
+
+    # Helper function to write a file such that concurrent readers never see partial content
+    # @param path: the path to the file
+    # @param content: the content as byte string
+    def _write_atomically(self, path, content):
+        fd, tmp_path = tempfile.mkstemp(prefix=".tmp", dir=os.path.dirname(path))
+        with os.fdopen(fd, 'wb') as write_file:
+            write_file.write(content)
+        os.replace(tmp_path, path)
+
+    # Helper function to evict the least recently used entries until the stored
+    # output files fit in max_bytes_, the blobs no longer referenced are removed
+    def _evict(self):
+        objects_dir = os.path.join(self.cache_dir_, "objects")
+        entries_dir = os.path.join(self.cache_dir_, "entries")
+        blob_sizes = {}
+        for blob in os.listdir(objects_dir):
+            # skip the files being written
+            if blob.startswith("."):
+                continue
+            try:
+                blob_sizes[blob] = os.path.getsize(os.path.join(objects_dir, blob))
+            except OSError:
+                continue
+        if sum(blob_sizes.values()) <= self.max_bytes_:
+            return
+        entries = []
+        for entry_name in os.listdir(entries_dir):
+            if entry_name.startswith("."):
+                continue
+            entry_file = os.path.join(entries_dir, entry_name)
+            try:
+                with open(entry_file, 'r') as read_file:
+                    entries.append((os.path.getmtime(entry_file), entry_file, json.load(read_file)))
+            except (IOError, OSError, ValueError):
+                continue
+        # most recently used first
+        entries.sort(key=lambda entry: entry[0], reverse=True)
+        kept_blobs = set()
+        kept_bytes = 0
+        for _, entry_file, entry in entries:
+            new_blobs = set(entry.values()) - kept_blobs
+            new_bytes = sum(blob_sizes.get(blob, 0) for blob in new_blobs)
+            if kept_bytes + new_bytes <= self.max_bytes_:
+                kept_blobs |= new_blobs
+                kept_bytes += new_bytes
+            else:
+                self._remove(entry_file)
+        for blob in blob_sizes:
+            if blob not in kept_blobs:
+                self._remove(os.path.join(objects_dir, blob))
+
+    # Helper function to remove a file that may have been removed by another run already
+    # @param path: the path to the file
+    def _remove(self, path):
+        try:
+            os.remove(path)
+        except OSError:
+            pass
@@ -1,5 +1,6 @@
 from functools import partial
 from .setupFunctions import *
+from .SetupCache import SetupCache
 
 class ExperimentHelper:
     def __init__(self):
@@ -16,4 +17,7 @@ class ExperimentHelper:
             "travis" : partial(travis_setup, tag.lower(), override_run_command, upload_reports)
         }.get(ci_tool.lower(), None)
 
-        return partial(setup_template, rts_setup_function, ci_setup_function)
\ No newline at end of file
+        setup_function = partial(setup_template, rts_setup_function, ci_setup_function)
+        # identify the setup such that its result can be memoized by SetupCache
+        setup_function.setup_identity = (tag.lower(), ci_tool.lower(), override_run_command, upload_reports)
+        return setup_function
\ No newline at end of file
@@ -0,0 +1,188 @@
+#!/usr/bin/env python3
+# Cache of the RTS artifacts between CI jobs. travis_setup ships this file into the repository
+# and calls it in place of one "find | cpio" per artifact suffix, so it must only use the standard library.
+#
+# The cache directory (the directory the CI keeps between jobs) is content addressed:
+#   * objects/{hash[:2]}/{hash[2:]}: the content of the artifacts, one file per distinct content
+#   * manifest: one "{hash} {size} {mtime in ns} {path}" line per artifact, the path is relative to the build directory
+# The build directory is walked once for all suffixes. Artifacts whose size and modification time match the
+# manifest are not hashed again, only the artifacts with new content are copied into the cache, and only the
+# artifacts that differ from the files in the build directory are restored.
+import os
+import shutil
+import hashlib
+import tempfile
+from optparse import OptionParser
+
+MANIFEST_VERSION = "cireinteract-artifacts 1"
+
+# directories that never contain RTS artifacts of interest
+IGNORED_DIRECTORIES = set([".git", ".hg", ".svn"])
+
+HASH_CHUNK_SIZE = 1024 * 1024
+
+# Function that hashes the content of a file
+# @param path: the path to the file
+# @return the SHA-1 of the content as hex string
+def hash_file(path):
+    digest = hashlib.sha1()
+    with open(path, 'rb') as read_file:
+        for chunk in iter(lambda: read_file.read(HASH_CHUNK_SIZE), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+# Function that reads the manifest of a cache directory
+# @param cache_dir: the cache directory
+# @return dictionary that maps the relative path of an artifact to (hash, size, mtime in ns),
+#    empty if there is no manifest
+def read_manifest(cache_dir):
+    res = {}
+    try:
+        with open(os.path.join(cache_dir, "manifest"), 'r') as read_file:
+            if read_file.readline().rstrip("\n") != MANIFEST_VERSION:
+                return res
+            for line in read_file:
+                fields = line.rstrip("\n").split(" ", 3)
+                if len(fields) == 4:
+                    res[fields[3]] = (fields[0], int(fields[1]), int(fields[2]))
+    except (IOError, OSError, ValueError):
+        return {}
+    return res
+
+# Function that writes the manifest of a cache directory atomically
+# @param cache_dir: the cache directory
+# @param manifest: dictionary as returned by read_manifest
+def write_manifest(cache_dir, manifest):
+    fd, tmp_path = tempfile.mkstemp(prefix=".tmp", dir=cache_dir)
+    with os.fdopen(fd, 'w') as write_file:
+        write_file.write(MANIFEST_VERSION + "\n")
+        for path in sorted(manifest):
+            digest, size, mtime = manifest[path]
+            write_file.write("{} {} {} {}\n".format(digest, size, mtime, path))
+    os.replace(tmp_path, os.path.join(cache_dir, "manifest"))
+
+# @param cache_dir: the cache directory
+# @param digest: the hash of the content
+# @return the path to the object holding the content
+def object_path(cache_dir, digest):
+    return os.path.join(cache_dir, "objects", digest[:2], digest[2:])
+
+# Function that finds the artifacts in the build directory with one walk
+# @param build_dir: the build directory
+# @param suffixes: the list of artifact suffixes without dot, i.e. ["zlc", "graph"]
+# @param cache_dir: the cache directory, skipped if it is inside the build directory
+# @return a list of paths relative to the build directory
+def find_artifacts(build_dir, suffixes, cache_dir=None):
+    suffixes = tuple(".{}".format(suffix) for suffix in suffixes)
+    skipped = os.path.realpath(cache_dir) if cache_dir is not None else None
+    res = []
+    for root, dirs, files in os.walk(build_dir):
+        dirs[:] = [sub_dir for sub_dir in dirs if sub_dir not in IGNORED_DIRECTORIES \
+            and os.path.realpath(os.path.join(root, sub_dir)) != skipped]
+        for file_name in files:
+            if file_name.endswith(suffixes):
+                res.append(os.path.relpath(os.path.join(root, file_name), build_dir))
+    return res
+
+# Function that stores the artifacts in the build directory into the cache directory,
+# the manifest is replaced so that artifacts removed from the build are no longer restored
+# and the objects not referenced by the new manifest are removed
+# @param build_dir: the build directory
+# @param cache_dir: the cache directory, created if it doesn't exist
+# @param suffixes: the list of artifact suffixes without dot
+# @return tuple of (number of artifacts, number of objects written, number of objects removed)
+def store_artifacts(build_dir, cache_dir, suffixes):
+    os.makedirs(os.path.join(cache_dir, "objects"), exist_ok=True)
+    old_manifest = read_manifest(cache_dir)
+    manifest = {}
+    written = 0
+    for path in find_artifacts(build_dir, suffixes, cache_dir):
+        artifact = os.path.join(build_dir, path)
+        stat = os.stat(artifact)
+        old_entry = old_manifest.get(path)
+        if old_entry is not None and old_entry[1:] == (stat.st_size, stat.st_mtime_ns) \
+            and os.path.isfile(object_path(cache_dir, old_entry[0])):
+            # unchanged since it is stored or restored
+            manifest[path] = old_entry
+            continue
+        digest = hash_file(artifact)
+        stored_object = object_path(cache_dir, digest)
+        if not os.path.isfile(stored_object):
+            os.makedirs(os.path.dirname(stored_object), exist_ok=True)
+            fd, tmp_path = tempfile.mkstemp(prefix=".tmp", dir=os.path.dirname(stored_object))
+            os.close(fd)
+            shutil.copyfile(artifact, tmp_path)
+            os.replace(tmp_path, stored_object)
+            written += 1
+        manifest[path] = (digest, stat.st_size, stat.st_mtime_ns)
+    write_manifest(cache_dir, manifest)
+    removed = remove_unreferenced_objects(cache_dir, set(entry[0] for entry in manifest.values()))
+    return (len(manifest), written, removed)
+
+# Function that restores the artifacts in the manifest into the build directory,
+# the modification times are restored as well. Files in the build directory that already
+# have the content of the artifact are left as they are
+# @param build_dir: the build directory
+# @param cache_dir: the cache directory
+# @return tuple of (number of artifacts, number of files written)
+def restore_artifacts(build_dir, cache_dir):
+    manifest = read_manifest(cache_dir)
+    written = 0
+    for path, (digest, size, mtime) in manifest.items():
+        stored_object = object_path(cache_dir, digest)
+        if not os.path.isfile(stored_object):
+            continue
+        target = os.path.join(build_dir, path)
+        if os.path.isfile(target) and os.path.getsize(target) == size and hash_file(target) == digest:
+            continue
+        os.makedirs(os.path.dirname(target), exist_ok=True)
+        shutil.copyfile(stored_object, target)
+        os.utime(target, ns=(mtime, mtime))
+        written += 1
+    return (len(manifest), written)
+
+# Function that removes the objects that are not referenced
+# @param cache_dir: the cache directory
+# @param referenced: the set of hashes to be kept
+# @return the number of objects removed
+def remove_unreferenced_objects(cache_dir, referenced):
+    removed = 0
+    objects_dir = os.path.join(cache_dir, "objects")
+    for prefix in os.listdir(objects_dir):
+        prefix_dir = os.path.join(objects_dir, prefix)
+        if not os.path.isdir(prefix_dir):
+            continue
+        for name in os.listdir(prefix_dir):
+            # skip the files being written
+            if name.startswith(".") or prefix + name in referenced:
+                continue
+            try:
+                os.remove(os.path.join(prefix_dir, name))
+                removed += 1
+            except OSError:
+                pass
+        if len(os.listdir(prefix_dir)) == 0:
+            os.rmdir(prefix_dir)
+    return removed
+
+if __name__ == "__main__":
+    usage = "usage: python %prog [options] store|restore"
+    parser = OptionParser(usage=usage)
+    parser.add_option("--build-dir", dest="build_dir", default=os.environ.get("TRAVIS_BUILD_DIR", "."),
+                    help="directory the build runs in [default: $TRAVIS_BUILD_DIR or current directory]")
+    parser.add_option("--cache-dir", dest="cache_dir", default=None,
+                    help="directory kept between CI jobs")
+    parser.add_option("-s", "--suffix", action="append", dest="suffixes", default=[],
+                    help="suffix of the RTS artifacts to store (repeatable)")
+    (options, args) = parser.parse_args()
+
+    if len(args) != 1 or args[0] not in ["store", "restore"] or options.cache_dir is None:
+        parser.print_help()
+        exit(1)
+    if args[0] == "store":
+        total, written, removed = store_artifacts(options.build_dir, options.cache_dir, options.suffixes)
+        print("Stored {} artifacts: {} new objects, {} objects removed".format(total, written, removed))
+    else:
+        total, written = restore_artifacts(options.build_dir, options.cache_dir)
+        print("Restored {} of {} artifacts".format(written, total))
+    exit(0)
@@ -14,5 +14,11 @@ EKSTAZI_XML_PATH = "{}/ekstazi.xml".format(os.path.dirname(os.path.realpath(__fi
 STARTS_XML_PATH = "{}/starts.xml".format(os.path.dirname(os.path.realpath(__file__)))
 SUREFIRE_XML_PATH = "{}/surefire.xml".format(os.path.dirname(os.path.realpath(__file__)))
 
+# the artifact cache tool and the report uploader, and where they are placed in the repository set up for CI
+ARTIFACT_CACHE_SCRIPT_PATH = "{}/artifactCache.py".format(os.path.dirname(os.path.realpath(__file__)))
+ARTIFACT_CACHE_SCRIPT_TARGET = ".cireinteract/artifact_cache.py"
+REPORT_UPLOADER_SCRIPT_PATH = "{}/reportUploader.py".format(os.path.dirname(os.path.realpath(__file__)))
+REPORT_UPLOADER_SCRIPT_TARGET = ".cireinteract/report_uploader.py"
+
 WEBHOOK_ENTRY = "https://cireinteract.azurewebsites.net/api/CINotificationEndPoint?code=AEW9Jm5ijk8SNN2PA0hIPwAxIcb3lqjqWL97EadKyB6qWSkNqNC0bQ=="
 REPORT_STORAGE_ENTRY = "https://cireinteract.azurewebsites.net/api/StoreReportEndPoint?code=tl93p4oBpLOxwwYgaFanI/JhDdlynBag5LXYETBfNAM6QSjUaIfXgw=="
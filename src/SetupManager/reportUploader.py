@@ -0,0 +1,234 @@
+#!/usr/bin/env python3
+# Uploader of the surefire reports of a CI job. travis_setup ships this file into the repository
+# and calls it in after_script, so it must only use the standard library.
+#
+# The reports (TEST*.xml) are read straight from the build directory and streamed as a gzip compressed
+# tar in a chunked request, nothing is staged on disk. The endpoint is first asked which of the reports
+# it already has by their content hashes, only the missing ones are sent along with a manifest of all
+# reports of the job:
+#   POST {endpoint}&name={name} with application/json {"hashes": [...]} -> {"missing": [...]}
+#   POST {endpoint}&name={name} with REPORT_STREAM_CONTENT_TYPE: tar of reports/{path} and a last member "manifest"
+# The manifest has one "{hash} {size} {path}" line per report. Endpoints that don't answer the check
+# (i.e. the Azure function) receive all reports as {name}.tar.gz in a multipart/form-data request instead.
+import io
+import os
+import json
+import uuid
+import hashlib
+import tarfile
+from optparse import OptionParser
+from http.client import HTTPConnection, HTTPSConnection
+from urllib.parse import urlsplit, quote
+
+REPORT_STREAM_CONTENT_TYPE = "application/x-cireinteract-reports"
+MANIFEST_VERSION = "cireinteract-reports 1"
+
+# directories that never contain surefire reports of interest
+IGNORED_DIRECTORIES = set([".git", ".hg", ".svn"])
+
+CHUNK_SIZE = 64 * 1024
+
+# ChunkedRequestWriter class is a write-only file object that sends what is written to it
+# as the chunks of a request body, so that tarfile can write the archive straight into the request
+class ChunkedRequestWriter:
+    # Constructor that instantiate the writer on a connection whose headers have been sent
+    # @param connection: the HTTPConnection object
+    def __init__(self, connection):
+        self.connection_ = connection
+        self.buffer_ = []
+        self.buffered_ = 0
+        self.sent_ = 0
+
+    def write(self, data):
+        self.buffer_.append(bytes(data))
+        self.buffered_ += len(data)
+        if self.buffered_ >= CHUNK_SIZE:
+            self.flush()
+        return len(data)
+
+    def flush(self):
+        if self.buffered_ == 0:
+            return
+        data = b"".join(self.buffer_)
+        self.connection_.send("{:x}\r\n".format(len(data)).encode("latin-1") + data + b"\r\n")
+        self.sent_ += len(data)
+        self.buffer_ = []
+        self.buffered_ = 0
+
+    # Send the remaining data and the last chunk
+    def close(self):
+        self.flush()
+        self.connection_.send(b"0\r\n\r\n")
+
+# @param name: the name of the tar member
+# @param size: the size of the member
+# @return the TarInfo object of a regular file
+def sized_info(name, size):
+    info = tarfile.TarInfo(name)
+    info.size = size
+    return info
+
+# Function that finds the surefire reports in the build directory with one walk
+# @param build_dir: the build directory
+# @return a sorted list of paths relative to the build directory
+def find_reports(build_dir):
+    res = []
+    for root, dirs, files in os.walk(build_dir):
+        dirs[:] = [sub_dir for sub_dir in dirs if sub_dir not in IGNORED_DIRECTORIES]
+        for file_name in files:
+            if file_name.startswith("TEST") and file_name.endswith(".xml"):
+                res.append(os.path.relpath(os.path.join(root, file_name), build_dir).replace(os.sep, "/"))
+    return sorted(res)
+
+# Function that hashes the content of a file
+# @param path: the path to the file
+# @return the SHA-1 of the content as hex string
+def hash_file(path):
+    digest = hashlib.sha1()
+    with open(path, 'rb') as read_file:
+        for chunk in iter(lambda: read_file.read(CHUNK_SIZE), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+# Function that opens a request whose body is sent in chunks
+# @param url: the endpoint
+# @param content_type: the content type of the body
+# @return tuple of (HTTPConnection object, ChunkedRequestWriter object)
+def open_chunked_request(url, content_type):
+    parts = urlsplit(url)
+    connection_class = HTTPSConnection if parts.scheme == "https" else HTTPConnection
+    connection = connection_class(parts.netloc)
+    connection.putrequest("POST", parts.path + ("?" + parts.query if parts.query else ""))
+    connection.putheader("Content-Type", content_type)
+    connection.putheader("Transfer-Encoding", "chunked")
+    connection.endheaders()
+    return (connection, ChunkedRequestWriter(connection))
+
+# Function that reads the response of a request
+# @param connection: the HTTPConnection object
+# @return tuple of (HTTP status, body as string)
+def read_response(connection):
+    response = connection.getresponse()
+    body = response.read().decode("utf-8", "replace")
+    connection.close()
+    return (response.status, body)
+
+# Function that asks the endpoint which reports it doesn't have yet
+# @param url: the endpoint
+# @param hashes: the list of hashes of the reports
+# @return the set of missing hashes, None if the endpoint doesn't support the check
+def check_reports(url, hashes):
+    parts = urlsplit(url)
+    connection_class = HTTPSConnection if parts.scheme == "https" else HTTPConnection
+    connection = connection_class(parts.netloc)
+    try:
+        connection.request("POST", parts.path + ("?" + parts.query if parts.query else ""), \
+            json.dumps({"hashes" : hashes}), {"Content-Type" : "application/json"})
+        status, body = read_response(connection)
+        if status != 200:
+            return None
+        return set(json.loads(body)["missing"])
+    except (OSError, ValueError, KeyError, TypeError):
+        return None
+
+# Function that streams the missing reports and the manifest of all reports
+# @param url: the endpoint
+# @param build_dir: the build directory
+# @param reports: list of (path, hash, size) of all reports
+# @param missing: the set of hashes the endpoint doesn't have
+# @return tuple of (HTTP status, response body, number of compressed bytes sent)
+def upload_reports(url, build_dir, reports, missing):
+    connection, writer = open_chunked_request(url, REPORT_STREAM_CONTENT_TYPE)
+    sent = set()
+    with tarfile.open(fileobj=writer, mode="w|gz", format=tarfile.PAX_FORMAT) as archive:
+        for path, digest, size in reports:
+            if digest not in missing or digest in sent:
+                continue
+            sent.add(digest)
+            with open(os.path.join(build_dir, path), 'rb') as read_file:
+                archive.addfile(sized_info("reports/" + path, size), read_file)
+        manifest = (MANIFEST_VERSION + "\n" + "".join("{} {} {}\n".format(digest, size, path) \
+            for path, digest, size in reports)).encode("utf-8")
+        archive.addfile(sized_info("manifest", len(manifest)), io.BytesIO(manifest))
+    writer.close()
+    status, body = read_response(connection)
+    return (status, body, writer.sent_)
+
+# Function that streams all reports as {name}.tar.gz in a multipart/form-data request,
+# the format the Azure function in azure_function_code expects
+# @param url: the endpoint
+# @param build_dir: the build directory
+# @param reports: list of (path, hash, size) of all reports
+# @param name: the name of the upload, {branch}_{job}
+# @return tuple of (HTTP status, response body, number of compressed bytes sent)
+def upload_multipart(url, build_dir, reports, name):
+    boundary = uuid.uuid4().hex
+    connection, writer = open_chunked_request(url, "multipart/form-data; boundary={}".format(boundary))
+    writer.write("--{}\r\nContent-Disposition: form-data; name=\"reports\"; filename=\"{}.tar.gz\"\r\n" \
+        "Content-Type: application/gzip\r\n\r\n".format(boundary, name).encode("utf-8"))
+    with tarfile.open(fileobj=writer, mode="w|gz", format=tarfile.PAX_FORMAT) as archive:
+        for path, _, size in reports:
+            with open(os.path.join(build_dir, path), 'rb') as read_file:
+                archive.addfile(sized_info(path, size), read_file)
+    writer.write("\r\n--{}--\r\n".format(boundary).encode("utf-8"))
+    writer.close()
+    status, body = read_response(connection)
+    return (status, body, writer.sent_)
+
+# Function that adds the name of the upload to the endpoint
+# @param endpoint: the endpoint, possibly with a query string already
+# @param name: the name of the upload
+# @return the URL as string
+def with_name(endpoint, name):
+    return "{}{}name={}".format(endpoint, "&" if "?" in endpoint else "?", quote(name))
+
+# Function that uploads the reports in the build directory the way the endpoint supports: the missing
+# reports as a report stream if it answers the check, all reports as multipart/form-data otherwise
+# @param url: the endpoint with the name of the upload, see with_name
+# @param build_dir: the build directory
+# @param name: the name of the upload, {branch}_{job}
+# @param check: boolean to indicate if the endpoint is asked which reports it has.
+#    If False, all reports are sent as a report stream
+# @return tuple of (number of reports, HTTP status, response body, number of compressed bytes sent)
+def upload_build_reports(url, build_dir, name, check=True):
+    reports = []
+    for path in find_reports(build_dir):
+        full_path = os.path.join(build_dir, path)
+        reports.append((path, hash_file(full_path), os.path.getsize(full_path)))
+    missing = check_reports(url, [digest for _, digest, _ in reports]) if check else None
+    if missing is None and check:
+        # the endpoint doesn't deduplicate, send everything the way it expects
+        status, body, sent = upload_multipart(url, build_dir, reports, name)
+    else:
+        if missing is None:
+            missing = set(digest for _, digest, _ in reports)
+        status, body, sent = upload_reports(url, build_dir, reports, missing)
+    return (len(reports), status, body, sent)
+
+# @return the name of the upload of the current Travis job, {branch}_{job}
+def default_name():
+    job_number = os.environ.get("TRAVIS_JOB_NUMBER", "0.1")
+    return "{}_{}".format(os.environ.get("TRAVIS_BRANCH", "local"), job_number.split(".")[-1])
+
+if __name__ == "__main__":
+    usage = "usage: python %prog [options] ENDPOINT"
+    parser = OptionParser(usage=usage)
+    parser.add_option("--build-dir", dest="build_dir", default=os.environ.get("TRAVIS_BUILD_DIR", "."),
+                    help="directory to find the reports in [default: $TRAVIS_BUILD_DIR or current directory]")
+    parser.add_option("--name", dest="name", default=None,
+                    help="name of the upload [default: ${TRAVIS_BRANCH}_{job number}]")
+    parser.add_option("--no-check", action="store_false", dest="check", default=True,
+                    help="send all reports without asking the endpoint which ones it has")
+    (options, args) = parser.parse_args()
+
+    if len(args) != 1:
+        parser.print_help()
+        exit(1)
+    name = options.name or default_name()
+    try:
+        total, status, body, sent = upload_build_reports(with_name(args[0], name), options.build_dir, name, options.check)
+    except OSError as e:
+        print("Failed to upload reports: {}".format(e))
+        exit(1)
+    print("Uploaded {} reports ({} compressed bytes) as {}: {} {}".format(total, sent, name, status, body))
+    exit(0 if 200 <= status < 300 else 1)
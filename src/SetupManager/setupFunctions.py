@@ -3,6 +3,7 @@ from .constants import *
 import travis_yml
 import yaml
 import os
+import shutil
 
 # Function that is used to set up Travis for utilizing RTS tool
 # assuming that:
@@ -19,27 +20,24 @@ import os
 #    one for the CI build statistics that is generated by Travis
 #    (format: https://docs.travis-ci.com/user/notifications#webhooks-delivery-format),
 #    another endpoint for the individual test results generated by surefire-report.
-#    The test results will be compressed into one compressed file to be sent.
+#    The test results are streamed as one compressed upload by reportUploader.py,
+#    leaving out the reports the endpoint already has.
 # @param repo_dir: the local git directory where the Travis configuration file
 #    can be found and modified.
 # @return a list of files that are modified by the setup function
 def travis_setup(tag, use_predefined_command, upload_reports, repo_dir):
-    def restore_by_suffix(tag, suffix):
-        return "(cd $HOME/{}_cache && find . -name '*.{}' -print | cpio -pvdumB /)".format(tag, suffix)
+    # the artifacts of all suffixes are restored and stored by one call of the artifact cache tool
+    def restore_artifacts(tag):
+        return "python3 $TRAVIS_BUILD_DIR/{} restore --cache-dir $HOME/{}_cache".format(ARTIFACT_CACHE_SCRIPT_TARGET, tag)
 
-    def cache_by_suffix(tag, suffix):
-        return "find $TRAVIS_BUILD_DIR -name '*.{}' -print | cpio -pvdumB $HOME/{}_cache".format(suffix, tag)
+    def cache_artifacts(tag):
+        return "python3 $TRAVIS_BUILD_DIR/{} store --cache-dir $HOME/{}_cache {}".format(ARTIFACT_CACHE_SCRIPT_TARGET, \
+            tag, " ".join("-s {}".format(suffix) for suffix in RTS_ARTIFACT_SUFFIXES[tag]))
 
-    def compress_test_reports():
-        extract_job_number = r"`echo ${TRAVIS_JOB_NUMBER} | sed -e 's/[0-9]*\.//'`"
-        return r"tar -zcf ${TRAVIS_BRANCH}_" + extract_job_number + r".tar.gz $HOME/report_placeholder"
-
-    def report_uploader(predefined_after_script):
-        predefined_after_script.append("find $TRAVIS_BUILD_DIR -name 'TEST*.xml' -print | cpio -pvdumB $HOME/report_placeholder")
-        predefined_after_script.append(compress_test_reports())
-        extract_job_number = r"`echo ${TRAVIS_JOB_NUMBER} | sed -e 's/[0-9]*\.//'`"
-        predefined_after_script.append(r'curl -F "ekstazi=@${TRAVIS_BUILD_DIR}/${TRAVIS_BRANCH}_' + extract_job_number +r'.tar.gz" ' + REPORT_STORAGE_ENTRY)
-        return predefined_after_script
+    # the reports are streamed from the build directory as ${TRAVIS_BRANCH}_{job number}
+    # and only the reports the endpoint doesn't have yet are sent
+    def upload_test_reports():
+        return 'python3 $TRAVIS_BUILD_DIR/{} "{}"'.format(REPORT_UPLOADER_SCRIPT_TARGET, REPORT_STORAGE_ENTRY)
 
 
     read_file = open(os.path.join(repo_dir, ".travis.yml"), 'r')
@@ -61,11 +59,10 @@ def travis_setup(tag, use_predefined_command, upload_reports, repo_dir):
     if "before_cache" not in travis_setting:
         travis_setting["before_cache"] = []
 
-    for suffix in RTS_ARTIFACT_SUFFIXES[tag]:
-        if restore_by_suffix(tag, suffix) not in travis_setting["before_script"]:
-            travis_setting["before_script"].append(restore_by_suffix(tag, suffix))
-        if cache_by_suffix(tag, suffix) not in travis_setting["before_cache"]:
-            travis_setting["before_cache"].append(cache_by_suffix(tag, suffix))
+    if restore_artifacts(tag) not in travis_setting["before_script"]:
+        travis_setting["before_script"].append(restore_artifacts(tag))
+    if cache_artifacts(tag) not in travis_setting["before_cache"]:
+        travis_setting["before_cache"].append(cache_artifacts(tag))
     
     # Replace maven command if it is necessary,
     # i.e. STARTS needs to call "starts:starts" explicitly to run
@@ -90,17 +87,29 @@ def travis_setup(tag, use_predefined_command, upload_reports, repo_dir):
         travis_setting["notifications"]["webhooks"]["on_cancel"] = "never"
         travis_setting["notifications"]["webhooks"]["on_error"] = "always"
 
-        # Add after_script to upload test reports as compressed file for now
+        # Add after_script to upload test reports
         if "after_script" not in travis_setting:
             travis_setting["after_script"] = []
-        if compress_test_reports() not in travis_setting["after_script"]:
-            travis_setting["after_script"] = report_uploader(travis_setting["after_script"])
+        if upload_test_reports() not in travis_setting["after_script"]:
+            travis_setting["after_script"].append(upload_test_reports())
 
     write_file = open(os.path.join(repo_dir, ".travis.yml"), 'w')
     yaml.dump(travis_setting, write_file, default_flow_style=False, width=float("inf"))
     write_file.close()
+
+    # ship the scripts with the repository so that the CI job can call them
+    modified_files = [os.path.join(repo_dir, ".travis.yml")]
+    scripts = [(ARTIFACT_CACHE_SCRIPT_PATH, ARTIFACT_CACHE_SCRIPT_TARGET)]
+    if upload_reports:
+        scripts.append((REPORT_UPLOADER_SCRIPT_PATH, REPORT_UPLOADER_SCRIPT_TARGET))
+    for script_path, script_target in scripts:
+        script_file = os.path.join(repo_dir, script_target)
+        if not os.path.isdir(os.path.dirname(script_file)):
+            os.makedirs(os.path.dirname(script_file))
+        shutil.copyfile(script_path, script_file)
+        modified_files.append(script_file)
     print("Finished Travis-CI setup for {}".format(tag))
-    return os.path.join(repo_dir, ".travis.yml")
+    return modified_files
 
 # Function that is used to include the Ekstazi RTS tool into the project
 # assuming that the project is using Maven. In other words, the RTS tool
@@ -112,7 +121,7 @@ def ekstazi_setup(repo_dir):
     modified_files = []
     # add ekstazi in pom.xml file
     pm = PomManager(repo_dir)
-    pm.add_plugin(EKSTAZI_XML_PATH)
+    pm.add_plugin(EKSTAZI_XML_PATH, preserve_format=True)
     modified_files += pm.pom_list
     print("Finished Ekstazi setup")
     return modified_files
@@ -127,8 +136,7 @@ def starts_setup(repo_dir):
     modified_files = []
     # add starts (and surefire if it is not included) in pom.xml file
     pm = PomManager(repo_dir)
-    pm.add_plugin(STARTS_XML_PATH)
-    pm.add_plugin(SUREFIRE_XML_PATH)
+    pm.add_plugins([STARTS_XML_PATH, SUREFIRE_XML_PATH], preserve_format=True)
     
     modified_files += pm.pom_list
     print("Finished STARTS setup")
@@ -147,5 +155,10 @@ def starts_setup(repo_dir):
 # @return a list of files that are modified by the setup function
 def setup_template(rts_setup_function, ci_setup_function, repo_dir):
     modified_files = rts_setup_function(repo_dir)
-    modified_files.append(ci_setup_function(repo_dir))
+    ci_modified_files = ci_setup_function(repo_dir)
+    # a CI setup function may return a single file or a list of files
+    if isinstance(ci_modified_files, list):
+        modified_files += ci_modified_files
+    else:
+        modified_files.append(ci_modified_files)
     return modified_files
\ No newline at end of file
@@ -0,0 +1,304 @@
+import os
+import sys
+import json
+import time
+import shutil
+import platform
+import tempfile
+from optparse import OptionParser
+from subprocess import call, Popen, PIPE, DEVNULL
+
+from CommitSelector import CommitSelector
+from GitCommand import GitCommand
+from GitReplay import GitReplay
+from SetupManager import ExperimentHelper
+from SetupManager import PomManager
+from SetupManager import travis_setup
+from SetupManager.constants import EKSTAZI_XML_PATH
+
+# scales of the synthetic repositories: name -> (number of commits, number of modules, number of seeds)
+SCALES = {
+    "small" : (20, 4, 5),
+    "medium" : (200, 32, 20),
+    "large" : (1000, 128, 50),
+}
+
+TRAVIS_SHAPES = {
+    # only the script, travis_setup adds everything else
+    "minimal" : "language: java\nscript:\n- mvn test\n",
+    # a configuration that already has caches, hooks and notifications
+    "full" : "language: java\njdk:\n- openjdk8\ncache:\n  directories:\n  - $HOME/.m2\n" \
+        "install:\n- mvn install -DskipTests=true -B\nbefore_script:\n- echo before\n" \
+        "script:\n- mvn test -B\n- mvn verify -B\nafter_script:\n- echo after\n" \
+        "notifications:\n  email: false\n",
+}
+
+POM_TEMPLATE = """<?xml version="1.0" encoding="UTF-8"?>
+<project xmlns="http://maven.apache.org/POM/4.0.0" xmlns:xsi="http://www.w3.org/2001/XMLSchema-instance">
+  <modelVersion>4.0.0</modelVersion>
+  <groupId>bench</groupId>
+  <artifactId>{artifact}</artifactId>
+  <version>1.0</version>
+  <packaging>{packaging}</packaging>
+  <modules>
+{modules}  </modules>
+  <build>
+    <plugins>
+      <plugin>
+        <groupId>org.apache.maven.plugins</groupId>
+        <artifactId>maven-compiler-plugin</artifactId>
+        <version>3.8.0</version>
+      </plugin>
+    </plugins>
+  </build>
+</project>
+"""
+
+# Function that lays out the modules of the synthetic project as a tree,
+# module {i} is nested under module {(i-1)/2} so that the pom.xml files are nested
+# @param num_modules: the number of modules besides the root project
+# @return a list of module directories relative to the project root, the root is ""
+def module_layout(num_modules):
+    layout = [""]
+    for idx in range(1, num_modules + 1):
+        parent = layout[(idx - 1) // 2]
+        layout.append(os.path.join(parent, "m{}".format(idx)))
+    return layout
+
+# Function that renders the pom.xml of a module
+# @param layout: the list returned by module_layout
+# @param idx: the index of the module in the layout
+# @return the content of pom.xml as string
+def render_pom(layout, idx):
+    children = [child for child in range(len(layout)) if child != 0 and (child - 1) // 2 == idx]
+    modules = "".join("    <module>m{}</module>\n".format(child) for child in children)
+    return POM_TEMPLATE.format(artifact="m{}".format(idx), packaging="pom" if children else "jar", modules=modules)
+
+# Function that generates a synthetic Maven repository with a bare remote named origin,
+# the history is written with one git fast-import stream
+# @param path: the directory to create the repository in, the remote is created at {path}.remote.git
+# @param num_commits: the number of commits on master
+# @param num_modules: the number of nested modules
+# @param travis_shape: a key of TRAVIS_SHAPES
+def generate_repository(path, num_commits, num_modules, travis_shape):
+    remote = "{}.remote.git".format(path)
+    call(['git', 'init', '-q', '--bare', remote])
+    call(['git', 'init', '-q', path])
+    layout = module_layout(num_modules)
+    stream = []
+    def add_file(file_path, content):
+        data = content.encode("utf-8")
+        stream.append("M 100644 inline {}\ndata {}\n".format(file_path, len(data)).encode("utf-8") + data + b"\n")
+    for commit in range(num_commits):
+        message = "commit {}".format(commit).encode("utf-8")
+        stream.append("commit refs/heads/master\ncommitter Bench <bench@localhost> {} +0000\ndata {}\n".format( \
+            1500000000 + commit * 60, len(message)).encode("utf-8") + message + b"\n")
+        if commit == 0:
+            add_file(".travis.yml", TRAVIS_SHAPES[travis_shape])
+            for idx, module in enumerate(layout):
+                add_file(os.path.join(module, "pom.xml"), render_pom(layout, idx))
+        # touch one source file and one test file per commit, spread over the modules
+        module = layout[commit % len(layout)]
+        add_file(os.path.join(module, "src/main/java/bench/C{}.java".format(commit)), \
+            "package bench;\npublic class C{} {{}}\n".format(commit))
+        add_file(os.path.join(module, "src/test/java/bench/C{}Test.java".format(commit)), \
+            "package bench;\npublic class C{}Test {{}}\n".format(commit))
+    process = Popen(['git', 'fast-import', '--quiet'], stdin=PIPE, cwd=path)
+    process.communicate(b"".join(stream))
+    call(['git', 'checkout', '-q', '-f', 'master'], cwd=path)
+    call(['git', 'config', 'user.email', 'bench@localhost'], cwd=path)
+    call(['git', 'config', 'user.name', 'Bench'], cwd=path)
+    call(['git', 'remote', 'add', 'origin', remote], cwd=path)
+    call(['git', 'push', '-q', 'origin', 'master'], cwd=path, stdout=DEVNULL, stderr=DEVNULL)
+
+# Function that copies a generated repository (and its remote) so that each measurement starts from the same state
+# @param template: the path to the generated repository
+# @param path: the path to copy to
+def copy_repository(template, path):
+    shutil.copytree(template, path, symlinks=True)
+    shutil.copytree("{}.remote.git".format(template), "{}.remote.git".format(path), symlinks=True)
+    call(['git', 'remote', 'set-url', 'origin', "{}.remote.git".format(path)], cwd=path)
+
+# Function that runs a function with stdout and stderr (including those of subprocesses) discarded
+# @param function: the function to be run
+# @return the duration in seconds
+def timed_quietly(function):
+    sys.stdout.flush()
+    sys.stderr.flush()
+    saved_fds = (os.dup(1), os.dup(2))
+    with open(os.devnull, 'w') as devnull:
+        os.dup2(devnull.fileno(), 1)
+        os.dup2(devnull.fileno(), 2)
+        try:
+            start = time.perf_counter()
+            function()
+            return time.perf_counter() - start
+        finally:
+            sys.stdout.flush()
+            sys.stderr.flush()
+            os.dup2(saved_fds[0], 1)
+            os.dup2(saved_fds[1], 2)
+            os.close(saved_fds[0])
+            os.close(saved_fds[1])
+
+# The benchmarks, each takes (repository path, number of seeds) and returns
+# (preparation, measured function) so that only the operation itself is timed
+def bench_seeds_checkout(repo_dir, num_seeds):
+    git_repo = GitReplay(repo_dir)
+    return (None, lambda: git_repo.build_seeds_from_recent_commits(num_seeds, push=False))
+
+def bench_seeds_batch(repo_dir, num_seeds):
+    git_repo = GitReplay(repo_dir)
+    return (None, lambda: git_repo.build_seeds_from_recent_commits(num_seeds, push=False, batch=True))
+
+def bench_experiment_branches(repo_dir, num_seeds):
+    git_repo = GitReplay(repo_dir)
+    setup_function = ExperimentHelper.get_setup_function("ekstazi", "travis", True, True)
+    return (lambda: git_repo.build_seeds_from_recent_commits(num_seeds, push=False, batch=True), \
+        lambda: git_repo.create_experiment_branches_with_tag("ekstazi", git_repo.get_existing_seed(), \
+            setup_function, push=False))
+
+def bench_experiment_branches_fast_import(repo_dir, num_seeds):
+    git_repo = GitReplay(repo_dir)
+    setup_function = ExperimentHelper.get_setup_function("ekstazi", "travis", True, True)
+    return (lambda: git_repo.build_seeds_from_recent_commits(num_seeds, push=False, batch=True), \
+        lambda: git_repo.create_experiment_branches_with_tag("ekstazi", git_repo.get_existing_seed(), \
+            setup_function, push=False, fast_import=True))
+
+def bench_proceed_commit_history(repo_dir, num_seeds):
+    git_repo = GitReplay(repo_dir)
+    setup_function = ExperimentHelper.get_setup_function("ekstazi", "travis", True, True)
+    def prepare():
+        git_repo.build_seeds_from_recent_commits(num_seeds, push=False, batch=True)
+        git_repo.create_experiment_branches_with_tag("ekstazi", git_repo.get_existing_seed(), \
+            setup_function, push=False)
+    return (prepare, lambda: git_repo.proceed_commit_history("ekstazi", push=False))
+
+def bench_proceed_commit_history_in_memory(repo_dir, num_seeds):
+    git_repo = GitReplay(repo_dir)
+    setup_function = ExperimentHelper.get_setup_function("ekstazi", "travis", True, True)
+    def prepare():
+        git_repo.build_seeds_from_recent_commits(num_seeds, push=False, batch=True)
+        git_repo.create_experiment_branches_with_tag("ekstazi", git_repo.get_existing_seed(), \
+            setup_function, push=False)
+    return (prepare, lambda: git_repo.proceed_commit_history("ekstazi", push=False, in_memory=True))
+
+def bench_pom_add_plugin(repo_dir, num_seeds):
+    return (None, lambda: PomManager(repo_dir).add_plugin(EKSTAZI_XML_PATH))
+
+def bench_pom_add_plugin_preserve_format(repo_dir, num_seeds):
+    return (None, lambda: PomManager(repo_dir).add_plugin(EKSTAZI_XML_PATH, preserve_format=True))
+
+def bench_commit_selector(repo_dir, num_seeds):
+    selector = CommitSelector(GitCommand(repo_dir))
+    return (None, lambda: selector.load() and selector.select("every", every=2))
+
+def bench_travis_setup(repo_dir, num_seeds):
+    return (None, lambda: travis_setup("starts", True, True, repo_dir))
+
+BENCHMARKS = [
+    ("build_seeds_from_recent_commits", bench_seeds_checkout),
+    ("build_seeds_from_recent_commits[batch]", bench_seeds_batch),
+    ("CommitSelector.load", bench_commit_selector),
+    ("create_experiment_branches_with_tag", bench_experiment_branches),
+    ("create_experiment_branches_with_tag[fast_import]", bench_experiment_branches_fast_import),
+    ("proceed_commit_history", bench_proceed_commit_history),
+    ("proceed_commit_history[in_memory]", bench_proceed_commit_history_in_memory),
+    ("PomManager.add_plugin", bench_pom_add_plugin),
+    ("PomManager.add_plugin[preserve_format]", bench_pom_add_plugin_preserve_format),
+    ("travis_setup", bench_travis_setup),
+]
+
+# Function that runs the benchmarks over the given scales
+# @param scales: list of keys of SCALES
+# @param travis_shapes: list of keys of TRAVIS_SHAPES
+# @param repeat: the number of times each benchmark is run, the minimum is reported
+# @param selected: list of benchmark names to run, all benchmarks if None
+# @param work_dir: the directory to generate the repositories in
+# @return a list of result dictionaries
+def run_benchmarks(scales, travis_shapes, repeat, selected, work_dir):
+    results = []
+    for scale in scales:
+        num_commits, num_modules, num_seeds = SCALES[scale]
+        for travis_shape in travis_shapes:
+            template = os.path.join(work_dir, "{}_{}".format(scale, travis_shape))
+            generate_repository(template, num_commits, num_modules, travis_shape)
+            for name, benchmark in BENCHMARKS:
+                if selected is not None and name not in selected:
+                    continue
+                durations = []
+                for run in range(repeat):
+                    repo_dir = os.path.join(work_dir, "run")
+                    copy_repository(template, repo_dir)
+                    try:
+                        prepare, function = benchmark(repo_dir, num_seeds)
+                        if prepare is not None:
+                            timed_quietly(prepare)
+                        durations.append(timed_quietly(function))
+                    finally:
+                        shutil.rmtree(repo_dir, ignore_errors=True)
+                        shutil.rmtree("{}.remote.git".format(repo_dir), ignore_errors=True)
+                result = {
+                    "benchmark" : name, "scale" : scale, "travis_shape" : travis_shape,
+                    "commits" : num_commits, "modules" : num_modules, "seeds" : num_seeds,
+                    "seconds" : min(durations), "runs" : durations,
+                }
+                print("{:<50} {:<7} {:<8} {:>10.4f}s".format(name, scale, travis_shape, result["seconds"]))
+                results.append(result)
+    return results
+
+# Function that compares the results against a stored baseline
+# @param results: the list of result dictionaries
+# @param baseline: the list of result dictionaries of the baseline
+# @param threshold: the relative slowdown tolerated, i.e. 0.2 for 20%
+# @return a list of (result, baseline seconds) that are slower than tolerated
+def compare_with_baseline(results, baseline, threshold):
+    def key(result):
+        return (result["benchmark"], result["scale"], result["travis_shape"])
+    baseline_seconds = dict((key(result), result["seconds"]) for result in baseline)
+    regressions = []
+    for result in results:
+        expected = baseline_seconds.get(key(result))
+        if expected is not None and result["seconds"] > expected * (1 + threshold):
+            regressions.append((result, expected))
+    return regressions
+
+if __name__ == "__main__":
+    usage = "usage: python %prog [options]"
+    parser = OptionParser(usage=usage)
+    parser.add_option("-s", "--scale", action="append", dest="scales", default=None,
+                    help="scale to run, one of {} (repeatable) [default: small and medium]".format(", ".join(sorted(SCALES))))
+    parser.add_option("-t", "--travis-shape", action="append", dest="travis_shapes", default=None,
+                    help="shape of .travis.yml, one of {} (repeatable) [default: minimal]".format(", ".join(sorted(TRAVIS_SHAPES))))
+    parser.add_option("-b", "--benchmark", action="append", dest="benchmarks", default=None,
+                    help="benchmark to run (repeatable) [default: all]")
+    parser.add_option("-r", "--repeat", type="int", dest="repeat", default=3,
+                    help="number of runs per benchmark, the minimum is reported [default: %default]")
+    parser.add_option("-o", "--output", dest="output", default="bench_output.json",
+                    help="file to write the results to as JSON [default: %default]")
+    parser.add_option("--baseline", dest="baseline", default=None,
+                    help="JSON results of a previous run to compare against")
+    parser.add_option("--threshold", type="float", dest="threshold", default=0.2,
+                    help="relative slowdown against the baseline reported as regression [default: %default]")
+    (options, args) = parser.parse_args()
+
+    work_dir = tempfile.mkdtemp(prefix="cireinteract_bench_")
+    try:
+        results = run_benchmarks(options.scales or ["small", "medium"], options.travis_shapes or ["minimal"], \
+            options.repeat, options.benchmarks, work_dir)
+    finally:
+        shutil.rmtree(work_dir, ignore_errors=True)
+    with open(options.output, 'w') as write_file:
+        json.dump({"python" : platform.python_version(), "platform" : platform.platform(), \
+            "results" : results}, write_file, indent=2)
+    print("Results written to {}".format(options.output))
+
+    if options.baseline is not None:
+        with open(options.baseline, 'r') as read_file:
+            baseline = json.load(read_file)["results"]
+        regressions = compare_with_baseline(results, baseline, options.threshold)
+        for result, expected in regressions:
+            print("Regression: {} ({}, {}) took {:.4f}s, baseline {:.4f}s".format(result["benchmark"], \
+                result["scale"], result["travis_shape"], result["seconds"], expected))
+        exit(1 if len(regressions) > 0 else 0)
+    exit(0)
@@ -1,47 +1,385 @@
 import os
+import sys
+import time
+import functools
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor, as_completed
 from optparse import OptionParser
 
+from BuildCache import BuildCache
+from CommitSelector import CommitSelector
+from CommitSelector import STRATEGIES
+from CommitSelector import estimate_builds
+from ExperimentPlan import ExperimentPlan
+from ExperimentPlan import Task
+from ExperimentPlan import SKIPPED, SUCCEEDED, EXPECTED
+from GitCommand import GitCommand
 from GitReplay import GitReplay
 from GitReplay import populate_GitReplays
 from SetupManager import ExperimentHelper
+from SetupManager import SetupCache
 
-MAX_ROLLOUT = 5
+# the number of seeds rolled out by the "recent" strategy unless specified otherwise
+DEFAULT_NUM_SEEDS = 5
 
 # The directory that contain all the git projects you want to evaluate the RTS tools on
 REPO_BASE = os.environ.get('REPO_BASE')
 
 RTS_TOOLS = ["ekstazi", "starts"]
 
+# Function that selects the commits to be rolled out as seeds with the strategy in the options
+# @param git_repo: the GitReplay object of the repository
+# @param options: the parsed command line options
+# @return list of SHAs, the most recent first
+def select_seeds(git_repo, options):
+    selector = CommitSelector(git_repo.git_)
+    total = selector.load(options.range, options.max_commits)
+    count = options.seeds
+    if count is None and options.strategy == "recent":
+        count = DEFAULT_NUM_SEEDS
+    commits = selector.select(options.strategy, count=count, every=options.every, \
+        bucket_seconds=int(options.bucket_days * 86400), builds=options.budget or 0, \
+        num_tools=len(RTS_TOOLS), skip_uninformative=not options.all_commits)
+    print("Selected {} of {} commits in {} ({} informative) with the {} strategy".format( \
+        len(commits), total, options.range, len(selector.informative_commits()), options.strategy))
+    return commits
+
+# Function that creates the experiment branches of one RTS tool from the existing seeds
+# @param git_repo: the GitReplay object of the repository
+# @param tool_tag: the name of the RTS tool
+# @param fast_import: boolean to indicate if the branches are created without any checkout
+# @return True if the creation is success, False otherwise.
+def create_tool_branches(git_repo, tool_tag, fast_import):
+    return git_repo.create_experiment_branches_with_tag(tool_tag, git_repo.get_existing_seed(), \
+        ExperimentHelper.get_setup_function(tool_tag, "travis", True, True), fast_import=fast_import)
+
+# Function that creates the experiment branches of several RTS tools concurrently, each in its own worktree
+# @param git_repo: the GitReplay object of the repository
+# @param tool_tags: the names of the RTS tools
+# @return True if the creation is success for all tools, False otherwise.
+def create_tools_branches(git_repo, tool_tags):
+    return git_repo.create_experiment_branches_with_tags( \
+        [(tool_tag, ExperimentHelper.get_setup_function(tool_tag, "travis", True, True)) \
+            for tool_tag in tool_tags], git_repo.get_existing_seed())
+
+# Function that runs the local portion of the pipeline on one repository
+# @param repo_dir: the path to the git directory
+# @param options: the parsed command line options
+# @return True if every step is success, False otherwise.
+def setup_experiment(repo_dir, options):
+    setup_cache = None
+    if options.setup_cache is not None:
+        setup_cache = SetupCache(options.setup_cache, options.setup_cache_size * 1024 * 1024)
+    build_cache = None
+    if options.build_cache is not None:
+        build_cache = BuildCache(options.build_cache)
+    git_repo = GitReplay(repo_dir, defer_push=options.coalesce_push, setup_cache=setup_cache, journal=options.journal, \
+        build_cache=build_cache)
+    if git_repo.repo_dir_ is None:
+        print("Not a Git directory")
+        return False
+    success = True
+    # clean up such that this script can run repeatly for manual testing
+    # delete all branches with "seed" in the branch name
+    if options.clean is not None:
+        if options.batch:
+            success &= git_repo.delete_all_branches_with_tags(["seed"] + RTS_TOOLS)
+        else:
+            success &= git_repo.delete_all_branches_with_tag()
+            for tool_tag in RTS_TOOLS:
+                success &= git_repo.delete_all_branches_with_tag(tool_tag)
+
+    # building branches
+    success &= git_repo.build_seeds_from_commits(select_seeds(git_repo, options), batch=options.batch)
+    if options.worktree and not options.fast_import:
+        success &= create_tools_branches(git_repo, RTS_TOOLS)
+    else:
+        for tool_tag in RTS_TOOLS:
+            success &= create_tool_branches(git_repo, tool_tag, options.fast_import)
+    if options.coalesce_push:
+        success &= git_repo.flush_push()
+    if setup_cache is not None:
+        print(setup_cache.summary())
+    if build_cache is not None:
+        print(build_cache.summary())
+
+    # Note that if you are using Travis-CI (presumably also other CI tools),
+    # increment commit history only when the initial build for the experiment branches are done
+    # otherwise, no RTS artifact can be utilized (different builds on the same branch are run in parallel)
+    # however, it won't matter if you limit the number of concurrent jobs on CI
+
+    # Right now, this tool rely on Azure function to perform the increment step.
+    # Azure function is served as a reflector to receive the notification from initial build and trigger the increment step
+    return success
+
+# Function that adds the tasks of one repository to the experiment plan, the seeds are selected
+# right away (read only) so that the numbers of branches and CI builds are known up front.
+# The estimates assume a fresh run, steps already done according to the journal are skipped when run.
+# The tasks of a repository run one after another, except the RTS tools set up with fast-import
+# which don't share the working tree and run concurrently; the repositories are independent
+# @param plan: the ExperimentPlan object
+# @param repo_dir: the path to the git directory
+# @param options: the parsed command line options
+# @return the GitReplay object of the repository, None if it is not a git directory
+def plan_repository(plan, repo_dir, options):
+    name = os.path.basename(repo_dir)
+    # the caches create their directory and database, a dry run leaves the disk untouched
+    setup_cache = None
+    if options.setup_cache is not None and not options.dry_run:
+        setup_cache = SetupCache(options.setup_cache, options.setup_cache_size * 1024 * 1024)
+    build_cache = None
+    if options.build_cache is not None and not options.dry_run:
+        build_cache = BuildCache(options.build_cache)
+    # everything is pushed by the push task
+    git_repo = GitReplay(repo_dir, defer_push=True, setup_cache=setup_cache, journal=options.journal, \
+        build_cache=build_cache)
+    if git_repo.repo_dir_ is None:
+        print("{}: Not a Git directory".format(name))
+        return None
+    commits = select_seeds(git_repo, options)
+    num_seeds = len(commits)
+    # {tool}_seed_{idx} for every seed and {tool}_{idx}-{idx-1} between two consecutive seeds
+    tool_branches = max(2 * num_seeds - 1, 0)
+
+    dependencies = []
+    if options.clean is not None:
+        dependencies = [plan.add(Task(name, "clean", "git", \
+            lambda: git_repo.delete_all_branches_with_tags(["seed"] + RTS_TOOLS)))]
+    seeds = plan.add(Task(name, "seeds", "git", \
+        lambda: git_repo.build_seeds_from_commits(commits, batch=options.batch), \
+        dependencies=dependencies, branches=num_seeds))
+    setups = []
+    if options.worktree and not options.fast_import:
+        setups.append(plan.add(Task(name, "setup:{}".format("+".join(RTS_TOOLS)), "cpu", \
+            lambda: create_tools_branches(git_repo, RTS_TOOLS), \
+            dependencies=[seeds], branches=len(RTS_TOOLS) * tool_branches)))
+    else:
+        previous = seeds
+        for tool_tag in RTS_TOOLS:
+            setups.append(plan.add(Task(name, "setup:{}".format(tool_tag), "cpu", \
+                functools.partial(create_tool_branches, git_repo, tool_tag, options.fast_import), \
+                dependencies=[previous], branches=tool_branches)))
+            # the checkouts of different tools share the working tree
+            if not options.fast_import:
+                previous = setups[-1]
+    push = plan.add(Task(name, "push", "network", git_repo.flush_push, dependencies=setups))
+    plan.add(Task(name, "ci:seeds", "ci", dependencies=[push], builds=num_seeds))
+    for tool_tag in RTS_TOOLS:
+        plan.add(Task(name, "ci:{}".format(tool_tag), "ci", dependencies=[push], \
+            builds=estimate_builds(num_seeds, 1) - num_seeds))
+    return git_repo
+
+# Print the outcome of a finished task of the experiment plan
+# @param task: the Task object
+def report_task(task):
+    status = task.status_
+    if task.resource_ == "ci":
+        status += " ({} builds)".format(task.builds_)
+    elif task.status_ != SKIPPED:
+        status += " in {:.1f}s".format(task.elapsed_)
+    if task.error_ is not None:
+        status += " ({})".format(task.error_)
+    print("{}: {}".format(task.name(), status))
+
+# Function that sums up the executed plan per repository the same way as run_isolated
+# @param plan: the executed ExperimentPlan object
+# @param repo_dirs: the paths to the git directories in the plan
+# @return list of tuples of (repo_dir, success, elapsed seconds, error message or None, empty list)
+def plan_results(plan, repo_dirs):
+    results = []
+    for repo_dir in repo_dirs:
+        tasks = [task for task in plan.tasks_ if task.repo_ == os.path.basename(repo_dir)]
+        failed = [task for task in tasks if task.status_ not in [SUCCEEDED, EXPECTED]]
+        error = None
+        if len(failed) > 0:
+            error = failed[0].error_ or "{} {}".format(failed[0].step_, failed[0].status_)
+        results.append((repo_dir, len(failed) == 0, sum(task.elapsed_ for task in tasks), error, []))
+    return results
+
+# Function that runs setup_experiment with failure isolation, the output of the
+# repository (including the output of git) is redirected to its own log file if log_dir is provided.
+# The git commands of the repository are summarized at the end of its output
+# @param repo_dir: the path to the git directory
+# @param options: the parsed command line options
+# @return tuple of (repo_dir, success, elapsed seconds, error message or None,
+#    records of the git commands if trace is requested, otherwise an empty list)
+def run_isolated(repo_dir, options):
+    start = time.time()
+    log_file = None
+    saved_fds = None
+    if options.log_dir is not None:
+        log_file = open(os.path.join(options.log_dir, "{}.log".format(os.path.basename(repo_dir))), 'w')
+        sys.stdout.flush()
+        sys.stderr.flush()
+        saved_fds = (os.dup(1), os.dup(2))
+        os.dup2(log_file.fileno(), 1)
+        os.dup2(log_file.fileno(), 2)
+    error = None
+    try:
+        success = setup_experiment(repo_dir, options)
+    except Exception as e:
+        success = False
+        error = "{}: {}".format(type(e).__name__, e)
+        print(error)
+    finally:
+        records = GitCommand.drain_records()
+        print(GitCommand.summary(records))
+        if saved_fds is not None:
+            sys.stdout.flush()
+            sys.stderr.flush()
+            os.dup2(saved_fds[0], 1)
+            os.dup2(saved_fds[1], 2)
+            os.close(saved_fds[0])
+            os.close(saved_fds[1])
+            log_file.close()
+    return (repo_dir, success, time.time() - start, error, records if options.trace is not None else [])
+
+# Initializer of the worker processes, the push semaphore is inherited
+# from the main process to bound the number of concurrent pushes across repositories
+# @param push_semaphore: the semaphore shared by the workers, None for no bound
+# @param fail_fast: boolean to indicate if a failed git command stops the repository right away
+def init_worker(push_semaphore, fail_fast):
+    GitReplay.push_semaphore_ = push_semaphore
+    GitCommand.fail_fast_ = fail_fast
+    GitCommand.tracing_ = True
+
+# Print the progress of a finished repository
+# @param finished: the number of repositories finished so far
+# @param total: the number of repositories to be processed
+# @param result: the tuple returned by run_isolated
+def report_progress(finished, total, result):
+    repo_dir, success, elapsed, error, _ = result
+    status = "ok" if success else "FAILED"
+    if error is not None:
+        status += " ({})".format(error)
+    print("[{}/{}] {}: {} in {:.1f}s".format(finished, total, os.path.basename(repo_dir), status, elapsed))
+
+# Print the summary of the run
+# @param results: the list of tuples returned by run_isolated
+# @param elapsed: the wall-clock time of the whole run in seconds
+def report_summary(results, elapsed):
+    failed = [result for result in results if not result[1]]
+    print("Processed {} repositories in {:.1f}s: {} succeeded, {} failed".format( \
+        len(results), elapsed, len(results) - len(failed), len(failed)))
+    for repo_dir, _, _, error, _ in failed:
+        print("  failed: {}{}".format(repo_dir, "" if error is None else " ({})".format(error)))
+
 if __name__ == "__main__":
     usage = "usage: python %prog [options]"
     parser = OptionParser(usage=usage)
     parser.add_option("-c", "--clean", action="store_true", dest="clean",
                     help="clean branches related to the experiment first if any")
+    parser.add_option("-b", "--batch", action="store_true", dest="batch", default=False,
+                    help="create and delete seed branches in batch without touching the working tree")
+    parser.add_option("-w", "--worktree", action="store_true", dest="worktree", default=False,
+                    help="set up the RTS tools concurrently, each in its own git worktree")
+    parser.add_option("-f", "--fast-import", action="store_true", dest="fast_import", default=False,
+                    help="create the experiment branches with one fast-import stream per RTS tool without any checkout")
+    parser.add_option("-p", "--coalesce-push", action="store_true", dest="coalesce_push", default=False,
+                    help="push all created branches in one atomic push at the end instead of after each step")
+    parser.add_option("--setup-cache", dest="setup_cache", default=None,
+                    help="directory to memoize the experiment setup across seeds and runs")
+    parser.add_option("--setup-cache-size", type="int", dest="setup_cache_size", default=512,
+                    help="maximum size of the setup cache in MB [default: %default]")
+    parser.add_option("--build-cache", dest="build_cache", default=None,
+                    help="report directory of the responsive server whose build cache is consulted before pushing, "
+                        "branches whose content has been built before are not pushed and their results are reused")
+    parser.add_option("--no-journal", action="store_false", dest="journal", default=True,
+                    help="don't keep the progress in .git/cireinteract/journal.json, a rerun then requires clean")
+    parser.add_option("-r", "--range", dest="range", default="master",
+                    help="revision range to select the seeds from along the first parent [default: %default]")
+    parser.add_option("--max-commits", type="int", dest="max_commits", default=None,
+                    help="maximum number of commits of the range to be considered, the most recent first")
+    parser.add_option("-s", "--strategy", type="choice", choices=STRATEGIES, dest="strategy", default="recent",
+                    help="how the seeds are selected, one of {} [default: %default]".format(", ".join(STRATEGIES)))
+    parser.add_option("-n", "--seeds", type="int", dest="seeds", default=None,
+                    help="maximum number of seeds [default: {} for the recent strategy, otherwise no maximum]".format(DEFAULT_NUM_SEEDS))
+    parser.add_option("--every", type="int", dest="every", default=1,
+                    help="select every k-th commit with the every strategy [default: %default]")
+    parser.add_option("--bucket-days", type="float", dest="bucket_days", default=7.0,
+                    help="select the most recent commit per bucket of days with the time strategy [default: %default]")
+    parser.add_option("--budget", type="int", dest="budget", default=None,
+                    help="maximum number of CI builds with the budget strategy")
+    parser.add_option("--all-commits", action="store_true", dest="all_commits", default=False,
+                    help="also select commits that change no Java or pom.xml file")
+    parser.add_option("--plan", action="store_true", dest="plan", default=False,
+                    help="plan the tasks of all repositories first and run them with bounded concurrency per resource")
+    parser.add_option("--dry-run", action="store_true", dest="dry_run", default=False,
+                    help="print the plan with the estimated branches and CI builds without running it")
+    parser.add_option("--git-jobs", type="int", dest="git_jobs", default=4,
+                    help="number of git tasks (seeds, clean) run concurrently with --plan [default: %default]")
+    parser.add_option("--cpu-jobs", type="int", dest="cpu_jobs", default=os.cpu_count() or 1,
+                    help="number of setup tasks run concurrently with --plan, they share the GIL of one process [default: %default]")
+    parser.add_option("--network-jobs", type="int", dest="network_jobs", default=None,
+                    help="number of push tasks run concurrently with --plan [default: --max-push or 2]")
+    parser.add_option("-j", "--jobs", type="int", dest="jobs", default=1,
+                    help="number of repositories to be processed concurrently [default: %default]")
+    parser.add_option("--max-push", type="int", dest="max_push", default=None,
+                    help="maximum number of concurrent pushes across repositories")
+    parser.add_option("--log-dir", dest="log_dir", default=None,
+                    help="directory to write one log file per repository")
+    parser.add_option("--trace", dest="trace", default=None,
+                    help="file to write the git commands of the run to as Chrome trace (chrome://tracing)")
+    parser.add_option("--fail-fast", action="store_true", dest="fail_fast", default=False,
+                    help="stop processing a repository as soon as one of its git commands fails")
     (options, args) = parser.parse_args()
-    
-    git_repos = populate_GitReplays(REPO_BASE)
-
-    for git_repo in git_repos:
-        # clean up such that this script can run repeatly for manual testing
-        # delete all branches with "seed" in the branch name
-        if options.clean is not None:
-            git_repo.delete_all_branches_with_tag()
-            for tool_tag in RTS_TOOLS:
-                git_repo.delete_all_branches_with_tag(tool_tag)
-        
-        # building branches
-        git_repo.build_seeds_from_recent_commits(MAX_ROLLOUT)
-        for tool_tag in RTS_TOOLS:
-            git_repo.create_experiment_branches_with_tag( \
-                tool_tag, git_repo.get_existing_seed(), \
-                ExperimentHelper.get_setup_function(tool_tag, "travis", True, True))
-        
-        # Note that if you are using Travis-CI (presumably also other CI tools),
-        # increment commit history only when the initial build for the experiment branches are done
-        # otherwise, no RTS artifact can be utilized (different builds on the same branch are run in parallel)
-        # however, it won't matter if you limit the number of concurrent jobs on CI
-
-        # Right now, this tool rely on Azure function to perform the increment step.
-        # Azure function is served as a reflector to receive the notification from initial build and trigger the increment step
-
-    exit(0)
+    if options.strategy == "budget" and options.budget is None:
+        parser.error("the budget strategy requires --budget")
+    if options.log_dir is not None and (options.plan or options.dry_run):
+        parser.error("--log-dir can't be used with --plan, the tasks of the repositories are interleaved")
+
+    if options.log_dir is not None and not os.path.isdir(options.log_dir):
+        os.makedirs(options.log_dir)
+    repo_dirs = [git_repo.repo_dir_ for git_repo in populate_GitReplays(REPO_BASE)]
+
+    push_semaphore = None
+    if options.max_push is not None:
+        push_semaphore = multiprocessing.Semaphore(options.max_push)
+
+    start = time.time()
+    results = []
+    records = []
+    if options.plan or options.dry_run:
+        init_worker(push_semaphore, options.fail_fast)
+        plan = ExperimentPlan()
+        git_repos = [plan_repository(plan, repo_dir, options) for repo_dir in repo_dirs]
+        print(plan.describe())
+        if options.dry_run:
+            exit(0)
+        network_jobs = options.network_jobs or options.max_push or 2
+        plan.execute({"git" : options.git_jobs, "cpu" : options.cpu_jobs, "network" : network_jobs}, report_task)
+        for git_repo in git_repos:
+            if git_repo is None:
+                continue
+            for cache in [git_repo.setup_cache_, git_repo.build_cache_]:
+                if cache is not None:
+                    print(cache.summary())
+        records = GitCommand.drain_records()
+        print(GitCommand.summary(records))
+        results = plan_results(plan, [repo_dir for repo_dir, git_repo in zip(repo_dirs, git_repos) if git_repo is not None])
+        results += [(repo_dir, False, 0.0, "Not a Git directory", []) \
+            for repo_dir, git_repo in zip(repo_dirs, git_repos) if git_repo is None]
+    elif options.jobs <= 1:
+        init_worker(push_semaphore, options.fail_fast)
+        for repo_dir in repo_dirs:
+            results.append(run_isolated(repo_dir, options))
+            report_progress(len(results), len(repo_dirs), results[-1])
+    else:
+        with ProcessPoolExecutor(max_workers=options.jobs, initializer=init_worker, \
+                initargs=(push_semaphore, options.fail_fast)) as executor:
+            futures = {executor.submit(run_isolated, repo_dir, options) : repo_dir for repo_dir in repo_dirs}
+            for future in as_completed(futures):
+                try:
+                    results.append(future.result())
+                except Exception as e:
+                    # the worker itself died, i.e. killed by the OS
+                    results.append((futures[future], False, 0.0, "{}: {}".format(type(e).__name__, e), []))
+                report_progress(len(results), len(repo_dirs), results[-1])
+    report_summary(results, time.time() - start)
+    if options.trace is not None:
+        records += [record for result in results for record in result[4]]
+        GitCommand.export_chrome_trace(records, options.trace)
+        print("Trace of {} git commands written to {}".format( \
+            len([record for record in records if record["kind"] == "command"]), options.trace))
+
+    exit(0 if all(result[1] for result in results) else 1)
@@ -0,0 +1,31 @@
+import os
+import sys
+import asyncio
+import threading
+
+import pytest
+
+# the modules under src/ import each other by name, as the scripts are run from there
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "src"))
+
+from ResponsiveServer import ResponsiveServer
+
+# Fixture that runs a ResponsiveServer on a free port in an event loop of its own thread,
+# the parameter of the fixture holds more keyword arguments of ResponsiveServer
+# @return tuple of (report endpoint, report directory)
+@pytest.fixture
+def server(tmp_path, request):
+    report_dir = str(tmp_path / "reports")
+    responsive_server = ResponsiveServer(str(tmp_path), report_dir, merge_workers=1, push=False, \
+        **getattr(request, "param", {}))
+    loop = asyncio.new_event_loop()
+    thread = threading.Thread(target=loop.run_forever)
+    thread.start()
+    try:
+        port = asyncio.run_coroutine_threadsafe(responsive_server.start(port=0), loop).result(10)
+        yield ("http://127.0.0.1:{}/api/StoreReportEndPoint".format(port), report_dir)
+        asyncio.run_coroutine_threadsafe(responsive_server.stop(), loop).result(10)
+    finally:
+        loop.call_soon_threadsafe(loop.stop)
+        thread.join()
+        loop.close()
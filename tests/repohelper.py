@@ -0,0 +1,47 @@
+import os
+from subprocess import run, PIPE
+
+# Function that runs a git command in a scratch repository
+# @param repo_dir: the path to the repository
+# @param args: the arguments of git
+# @param input: the stdin of the command as byte string
+# @return the stdout as string without the trailing newline
+def git(repo_dir, *args, input=None):
+    return run(['git'] + list(args), cwd=repo_dir, input=input, stdout=PIPE, check=True).stdout.decode("utf-8").strip()
+
+# Function that creates an empty repository with master checked out and an identity to commit with
+# @param repo_dir: the path to the repository, created if it doesn't exist
+# @return repo_dir
+def init_repo(repo_dir):
+    os.makedirs(repo_dir, exist_ok=True)
+    git(repo_dir, 'init', '-q')
+    git(repo_dir, 'symbolic-ref', 'HEAD', 'refs/heads/master')
+    git(repo_dir, 'config', 'user.email', 'test@localhost')
+    git(repo_dir, 'config', 'user.name', 'Test')
+    return repo_dir
+
+# Function that commits files on the branch checked out
+# @param repo_dir: the path to the repository
+# @param files: dictionary that maps the path of the files to their content as byte string, None to delete the file
+# @param message: the commit message
+# @return the SHA of the commit
+def commit_files(repo_dir, files, message="change"):
+    for path, content in files.items():
+        full_path = os.path.join(repo_dir, path)
+        if content is None:
+            os.remove(full_path)
+            continue
+        os.makedirs(os.path.dirname(full_path), exist_ok=True)
+        with open(full_path, 'wb') as write_file:
+            write_file.write(content)
+    git(repo_dir, 'add', '-A')
+    git(repo_dir, 'commit', '-q', '-m', message)
+    return git(repo_dir, 'rev-parse', 'HEAD')
+
+# Function that gets the content of a file in a revision
+# @param repo_dir: the path to the repository
+# @param revision: the revision, i.e. a branch name
+# @param path: the path of the file
+# @return the content as byte string
+def show_file(repo_dir, revision, path):
+    return run(['git', 'cat-file', 'blob', '{}:{}'.format(revision, path)], cwd=repo_dir, stdout=PIPE, check=True).stdout
@@ -0,0 +1,115 @@
+import os
+
+from SetupManager import artifactCache
+from SetupManager.artifactCache import store_artifacts, restore_artifacts, read_manifest, object_path
+
+SUFFIXES = ["zlc", "graph"]
+
+# Function that writes files into a directory
+# @param root: the directory
+# @param files: dictionary that maps relative paths to their content as byte string
+def write_files(root, files):
+    for path, content in files.items():
+        full_path = os.path.join(root, path)
+        os.makedirs(os.path.dirname(full_path), exist_ok=True)
+        with open(full_path, 'wb') as write_file:
+            write_file.write(content)
+
+# Function that lists the objects of a cache directory
+# @param cache_dir: the cache directory
+# @return the set of hashes of the objects
+def list_objects(cache_dir):
+    objects_dir = os.path.join(cache_dir, "objects")
+    return set(prefix + name for prefix in os.listdir(objects_dir) for name in os.listdir(os.path.join(objects_dir, prefix)))
+
+# Function that counts the files hashed while storing
+# @return the list the paths of the hashed files are appended to
+def count_hashes(monkeypatch):
+    hashed = []
+    hash_file = artifactCache.hash_file
+    def counting_hash_file(path):
+        hashed.append(path)
+        return hash_file(path)
+    monkeypatch.setattr(artifactCache, "hash_file", counting_hash_file)
+    return hashed
+
+ARTIFACTS = {
+    "a/.ekstazi/A.zlc" : b"a",
+    "a/.ekstazi/B.zlc" : b"same",
+    "b/.starts/deps.graph" : b"graph",
+    "b/.starts/copy.zlc" : b"same",
+    "b/src/Main.java" : b"class Main {}",
+}
+
+def test_store_restore_store(tmp_path, monkeypatch):
+    build_dir = str(tmp_path / "build")
+    cache_dir = str(tmp_path / "cache")
+    write_files(build_dir, ARTIFACTS)
+
+    # identical contents share one object, other files are left out
+    assert store_artifacts(build_dir, cache_dir, SUFFIXES) == (4, 3, 0)
+    assert sorted(read_manifest(cache_dir)) == sorted(path for path in ARTIFACTS if not path.endswith(".java"))
+
+    fresh_dir = str(tmp_path / "fresh")
+    assert restore_artifacts(fresh_dir, cache_dir) == (4, 4)
+    for path, (digest, size, mtime) in read_manifest(cache_dir).items():
+        with open(os.path.join(fresh_dir, path), 'rb') as read_file:
+            assert read_file.read() == ARTIFACTS[path]
+        assert os.stat(os.path.join(fresh_dir, path)).st_mtime_ns == mtime
+    assert not os.path.exists(os.path.join(fresh_dir, "b/src/Main.java"))
+    # restoring again leaves the files as they are
+    assert restore_artifacts(fresh_dir, cache_dir) == (4, 0)
+
+    # the restored files have the size and modification time of the manifest, so nothing is hashed
+    hashed = count_hashes(monkeypatch)
+    assert store_artifacts(fresh_dir, cache_dir, SUFFIXES) == (4, 0, 0)
+    assert hashed == []
+
+def test_store_skips_unchanged_files(tmp_path, monkeypatch):
+    build_dir = str(tmp_path / "build")
+    cache_dir = str(tmp_path / "cache")
+    write_files(build_dir, ARTIFACTS)
+    store_artifacts(build_dir, cache_dir, SUFFIXES)
+    hashed = count_hashes(monkeypatch)
+
+    # same size, new modification time
+    write_files(build_dir, {"a/.ekstazi/A.zlc" : b"b"})
+    stat = os.stat(os.path.join(build_dir, "a/.ekstazi/A.zlc"))
+    os.utime(os.path.join(build_dir, "a/.ekstazi/A.zlc"), ns=(stat.st_atime_ns, stat.st_mtime_ns + 10 ** 9))
+    # same modification time, new size
+    mtime = read_manifest(cache_dir)["b/.starts/deps.graph"][2]
+    write_files(build_dir, {"b/.starts/deps.graph" : b"new graph"})
+    os.utime(os.path.join(build_dir, "b/.starts/deps.graph"), ns=(mtime, mtime))
+
+    assert store_artifacts(build_dir, cache_dir, SUFFIXES) == (4, 2, 2)
+    assert sorted(hashed) == sorted(os.path.join(build_dir, path) for path in ["a/.ekstazi/A.zlc", "b/.starts/deps.graph"])
+    assert read_manifest(cache_dir)["a/.ekstazi/A.zlc"][0] == artifactCache.hashlib.sha1(b"b").hexdigest()
+
+def test_store_removes_stale_objects(tmp_path):
+    build_dir = str(tmp_path / "build")
+    cache_dir = str(tmp_path / "cache")
+    write_files(build_dir, ARTIFACTS)
+    store_artifacts(build_dir, cache_dir, SUFFIXES)
+    stale = read_manifest(cache_dir)["b/.starts/deps.graph"][0]
+
+    # an object still referenced by another artifact is kept
+    os.remove(os.path.join(build_dir, "b/.starts/deps.graph"))
+    os.remove(os.path.join(build_dir, "b/.starts/copy.zlc"))
+
+    assert store_artifacts(build_dir, cache_dir, SUFFIXES) == (2, 0, 1)
+    assert sorted(read_manifest(cache_dir)) == ["a/.ekstazi/A.zlc", "a/.ekstazi/B.zlc"]
+    assert list_objects(cache_dir) == set(entry[0] for entry in read_manifest(cache_dir).values())
+    assert not os.path.exists(object_path(cache_dir, stale))
+    assert not os.path.exists(os.path.dirname(object_path(cache_dir, stale)))
+
+def test_cache_directory_inside_build_directory(tmp_path):
+    build_dir = str(tmp_path / "build")
+    cache_dir = os.path.join(build_dir, "cache")
+    write_files(build_dir, ARTIFACTS)
+    write_files(cache_dir, {"stray.zlc" : b"stray"})
+
+    assert store_artifacts(build_dir, cache_dir, SUFFIXES) == (4, 3, 0)
+    # the same directory through another path is skipped as well
+    assert store_artifacts(build_dir, os.path.join(build_dir, "a", "..", "cache"), SUFFIXES) == (4, 0, 0)
+    assert not any(path.startswith("cache") for path in read_manifest(cache_dir))
+    assert restore_artifacts(build_dir, cache_dir) == (4, 0)
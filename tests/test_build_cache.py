@@ -0,0 +1,26 @@
+import os
+
+from BuildCache import BuildCache
+from SetupManager.reportUploader import MANIFEST_VERSION as REPORT_MANIFEST_VERSION
+
+JOB_RECORDS = "Finished abstracting data: id 1; state passed; time 90.0\n"
+KEY = ("tree", "", "")
+
+def test_reused_branch_is_counted_once(tmp_path):
+    report_dir = str(tmp_path / "reports")
+    cache = BuildCache(report_dir)
+    assert not cache.reuse("repo", "seed_0", KEY)
+    with open(os.path.join(report_dir, "seed_0_1.manifest"), 'w') as write_file:
+        write_file.write(REPORT_MANIFEST_VERSION + "\n")
+    assert cache.store("repo", "seed_0", JOB_RECORDS, ["1"])
+
+    # seed_1 has the content of seed_0, it is never pushed, so every rerun looks it up again
+    for _ in range(3):
+        rerun = BuildCache(report_dir)
+        assert rerun.reuse("repo", "seed_1", KEY)
+        with open(os.path.join(report_dir, "seed_1.txt"), 'r') as read_file:
+            assert read_file.read() == JOB_RECORDS
+        assert os.path.isfile(os.path.join(report_dir, "seed_1_1.manifest"))
+    assert (rerun.hits_, rerun.builds_saved_) == (0, 0)
+    assert cache.stats() == [{"repo" : "repo", "lookups" : 2, "hits" : 1, "misses" : 1, \
+        "builds_saved" : 1, "seconds_saved" : 90.0}]
@@ -0,0 +1,30 @@
+from CommitSelector import CommitSelector
+from GitCommand import GitCommand
+from repohelper import git, init_repo, commit_files
+
+def test_load_reads_raw_paths(tmp_path):
+    repo_dir = str(tmp_path / "repo")
+    init_repo(repo_dir)
+    first = commit_files(repo_dir, {"src/A.java" : b"a\n", "é/pom.xml" : b"<project/>\n"})
+    second = commit_files(repo_dir, {'tab\t"quoted".java' : b"a\nb\n", "new\nline.java" : b"a\n", "bin.dat" : b"\0\1"})
+    git(repo_dir, 'commit', '-q', '--allow-empty', '-m', "empty")
+    empty = git(repo_dir, 'rev-parse', 'HEAD')
+    git(repo_dir, 'checkout', '-q', '-b', 'topic')
+    commit_files(repo_dir, {"src/A.java" : b"a\nb\nc\n"})
+    git(repo_dir, 'checkout', '-q', 'master')
+    git(repo_dir, 'merge', '-q', '--no-ff', '-m', "merge", 'topic')
+    merge = git(repo_dir, 'rev-parse', 'HEAD')
+
+    selector = CommitSelector(GitCommand(repo_dir))
+    assert selector.load("master") == 4
+    assert [(sha, sorted(files)) for sha, _, files in selector.commits_] == [
+        # a merge is diffed against its first parent
+        (merge, [("src/A.java", 2, 0)]),
+        (empty, []),
+        # binary files have no line counts
+        (second, [("bin.dat", 0, 0), ("new\nline.java", 1, 0), ('tab\t"quoted".java', 2, 0)]),
+        (first, [("src/A.java", 1, 0), ("é/pom.xml", 1, 0)]),
+    ]
+    assert all(isinstance(commit_time, int) for _, commit_time, _ in selector.commits_)
+    assert [sha for sha, _, _ in selector.informative_commits()] == [merge, second, first]
+    assert selector.load("master", max_count=2) == 2
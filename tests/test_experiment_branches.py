@@ -0,0 +1,72 @@
+import os
+import shutil
+
+from GitReplay import GitReplay
+from SetupManager import starts_setup
+from repohelper import git, init_repo, commit_files, show_file
+
+# Function that creates the setup of the experiment branches, which adds a file after the content of pom.xml
+# @param prefix: the first line of the added file
+# @return the setup function
+def experiment_setup(prefix):
+    def setup(repo_dir):
+        with open(os.path.join(repo_dir, "pom.xml"), 'r') as read_file:
+            content = read_file.read()
+        with open(os.path.join(repo_dir, "setup.txt"), 'w') as write_file:
+            write_file.write(prefix + "\n" + content)
+        return ["setup.txt"]
+    return setup
+
+def test_fast_import_detaches_head_from_created_branches(tmp_path):
+    repo_dir = str(tmp_path / "repo")
+    init_repo(repo_dir)
+    commits = []
+    for idx in range(3):
+        commits.insert(0, commit_files(repo_dir, {"pom.xml" : "v{}\n".format(idx).encode("utf-8")}))
+    git_repo = GitReplay(repo_dir)
+    assert git_repo.build_seeds_from_commits(commits, push=False, batch=True)
+    assert git_repo.create_experiment_branches_with_tag('t', git_repo.get_existing_seed(), experiment_setup("v1"), push=False)
+    git(repo_dir, 'checkout', '-q', 't_1-0')
+    head = git(repo_dir, 'rev-parse', 'HEAD')
+
+    # recreate the branches with another setup with fast-import while one of them is checked out
+    assert git_repo.create_experiment_branches_with_tag('t', git_repo.get_existing_seed(), experiment_setup("v2"), \
+        push=False, fast_import=True)
+    assert git(repo_dir, 'rev-parse', '--symbolic-full-name', 'HEAD') == "HEAD"
+    assert git(repo_dir, 'rev-parse', 't_1-0') != head
+    assert git(repo_dir, 'rev-parse', 'HEAD') == head
+    assert git(repo_dir, 'status', '--porcelain') == ""
+
+POM = '<project xmlns="http://maven.apache.org/POM/4.0.0">\n  <build>\n    <plugins>\n{}    </plugins>\n  </build>\n</project>\n'
+SUREFIRE = '      <plugin>\n        <artifactId>maven-surefire-plugin</artifactId>\n      </plugin>\n'
+
+def test_fast_import_sets_up_the_pristine_seeds(tmp_path):
+    repo_dir = str(tmp_path / "checkout")
+    init_repo(repo_dir)
+    commits = []
+    commits.insert(0, commit_files(repo_dir, {"pom.xml" : POM.format("").encode("utf-8"), "m/pom.xml" : POM.format("").encode("utf-8")}))
+    commits.insert(0, commit_files(repo_dir, {"a.txt" : b"a\n"}))
+    # a seed that deletes a module and one that declares a plugin the setup splices
+    commits.insert(0, commit_files(repo_dir, {"m/pom.xml" : None}))
+    commits.insert(0, commit_files(repo_dir, {"pom.xml" : POM.format(SUREFIRE).encode("utf-8")}))
+    git_repo = GitReplay(repo_dir)
+    assert git_repo.build_seeds_from_commits(commits, push=False, batch=True)
+    import_dir = str(tmp_path / "fast_import")
+    shutil.copytree(repo_dir, import_dir, symlinks=True)
+
+    assert git_repo.create_experiment_branches_with_tag('t', git_repo.get_existing_seed(), starts_setup, push=False)
+    import_repo = GitReplay(import_dir)
+    assert import_repo.create_experiment_branches_with_tag('t', import_repo.get_existing_seed(), starts_setup, \
+        push=False, fast_import=True)
+
+    for idx in range(len(commits)):
+        # the seed with the setup applied to its own files
+        work_dir = str(tmp_path / "seed_{}".format(idx))
+        git(import_dir, 'worktree', 'add', '-q', '--detach', work_dir, 'seed_{}'.format(idx))
+        starts_setup(work_dir)
+        git(work_dir, 'add', '-A')
+        assert git(import_dir, 'rev-parse', 't_seed_{}^{{tree}}'.format(idx)) == git(work_dir, 'write-tree')
+    assert show_file(import_dir, 't_seed_0', 'pom.xml').decode("utf-8").count("<artifactId>maven-surefire-plugin") == 1
+    # the checkout keeps the set up module the seed deletes, see _materialize_experiment_branches
+    assert "m/pom.xml" not in git(import_dir, 'ls-tree', '-r', '--name-only', 't_seed_1').split()
+    assert "m/pom.xml" in git(repo_dir, 'ls-tree', '-r', '--name-only', 't_seed_1').split()
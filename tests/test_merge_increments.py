@@ -0,0 +1,125 @@
+import os
+import shutil
+
+from GitCommand import GitCommand
+from GitReplay import GitReplay
+from repohelper import git, init_repo, commit_files, show_file
+
+LINES = ["line {}\n".format(idx) for idx in range(30)]
+
+# @param changes: dictionary that maps line numbers to the new lines
+# @return the content of a text file of 30 lines with the changes
+def text(changes):
+    return "".join(changes.get(idx, line) for idx, line in enumerate(LINES)).encode("utf-8")
+
+# Function that creates t_1-0 and t_seed_0 diverging from a common commit
+# @return the GitReplay object of the repository
+def diverge(repo_dir, base, ours, theirs):
+    init_repo(repo_dir)
+    commit_files(repo_dir, base, "base")
+    git(repo_dir, 'checkout', '-q', '-b', 't_1-0')
+    commit_files(repo_dir, ours, "ours")
+    git(repo_dir, 'checkout', '-q', '-b', 't_seed_0', 'master')
+    commit_files(repo_dir, theirs, "theirs")
+    git(repo_dir, 'checkout', '-q', 'master')
+    return GitReplay(repo_dir)
+
+# Function that merges the way proceed_commit_history does with a checkout, in a worktree
+# @return the SHA of the merged tree
+def merge_with_checkout(repo_dir, ours, theirs):
+    work_dir = repo_dir + "_merge"
+    git(repo_dir, 'worktree', 'add', '-q', '--detach', work_dir, ours)
+    try:
+        git(work_dir, 'merge', '-q', '--strategy-option=theirs', '--no-edit', theirs)
+        return git(work_dir, 'rev-parse', 'HEAD^{tree}')
+    finally:
+        git(repo_dir, 'worktree', 'remove', '--force', work_dir)
+
+def test_binary_and_text_hunks_resolved_as_theirs(tmp_path):
+    repo_dir = str(tmp_path / "repo")
+    git_repo = diverge(repo_dir, \
+        {"a.txt" : text({}), "bin.dat" : b"\0\1base"}, \
+        {"a.txt" : text({2 : "ours 2\n", 20 : "ours 20\n"}), "bin.dat" : b"\0\1ours"}, \
+        {"a.txt" : text({2 : "theirs 2\n", 10 : "theirs 10\n"}), "bin.dat" : b"\0\1theirs"})
+    expected = merge_with_checkout(repo_dir, 't_1-0', 't_seed_0')
+    ours = git(repo_dir, 'rev-parse', 't_1-0')
+
+    assert git_repo.merge_increments('t', push=False, idx_list=[1]) == {}
+    assert git(repo_dir, 'rev-parse', 't_1-0^{tree}') == expected
+    assert git(repo_dir, 'rev-parse', 't_1-0^1') == ours
+    assert show_file(repo_dir, 't_1-0', 'bin.dat') == b"\0\1theirs"
+    assert show_file(repo_dir, 't_1-0', 'a.txt') == text({2 : "theirs 2\n", 10 : "theirs 10\n", 20 : "ours 20\n"})
+
+def test_modify_delete_is_reported_and_branch_left_as_is(tmp_path):
+    repo_dir = str(tmp_path / "repo")
+    git_repo = diverge(repo_dir, \
+        {"a.txt" : text({}), "gone.txt" : b"gone\n"}, \
+        {"a.txt" : text({20 : "ours 20\n"}), "gone.txt" : b"modified\n"}, \
+        {"a.txt" : text({2 : "theirs 2\n"}), "gone.txt" : None})
+    ours = git(repo_dir, 'rev-parse', 't_1-0')
+
+    assert git_repo.merge_increments('t', push=False, idx_list=[1]) == {"t_1-0" : ["gone.txt"]}
+    assert git(repo_dir, 'rev-parse', 't_1-0') == ours
+
+def test_fast_forward_and_incremented_before(tmp_path):
+    repo_dir = str(tmp_path / "repo")
+    init_repo(repo_dir)
+    commit_files(repo_dir, {"a.txt" : text({})})
+    git(repo_dir, 'branch', 't_1-0')
+    theirs = commit_files(repo_dir, {"a.txt" : text({2 : "theirs 2\n"})})
+    git(repo_dir, 'branch', 't_seed_0')
+    git_repo = GitReplay(repo_dir)
+
+    assert git_repo.merge_increments('t', push=False, idx_list=[1]) == {}
+    assert git(repo_dir, 'rev-parse', 't_1-0') == theirs
+    assert git_repo.merge_increments('t', push=False, idx_list=[1]) == {}
+    assert git(repo_dir, 'rev-parse', 't_1-0') == theirs
+
+# the setup of the experiment branches: changes the first line of a.txt and adds a file
+def experiment_setup(repo_dir):
+    with open(os.path.join(repo_dir, "a.txt"), 'rb') as read_file:
+        lines = read_file.read().decode("utf-8").splitlines(True)
+    lines[0] = "set up\n"
+    with open(os.path.join(repo_dir, "a.txt"), 'wb') as write_file:
+        write_file.write("".join(lines).encode("utf-8"))
+    with open(os.path.join(repo_dir, "setup.txt"), 'w') as write_file:
+        write_file.write("setup\n")
+    return ["a.txt", "setup.txt"]
+
+def test_in_memory_matches_checkout(tmp_path):
+    repo_dir = str(tmp_path / "checkout")
+    init_repo(repo_dir)
+    commit_files(repo_dir, {"a.txt" : text({}), "bin.dat" : b"\0\1v0"})
+    commits = []
+    for idx, changes in enumerate([{1 : "c1\n"}, {5 : "c2\n", 6 : "c2\n"}, {20 : "c3\n"}, {1 : "c4\n", 29 : "c4\n"}]):
+        commits.insert(0, commit_files(repo_dir, {"a.txt" : text(changes), "bin.dat" : "\0\1v{}".format(idx + 1).encode("utf-8")}))
+    git_repo = GitReplay(repo_dir)
+    assert git_repo.build_seeds_from_commits(commits, push=False, batch=True)
+    assert git_repo.create_experiment_branches_with_tag('t', git_repo.get_existing_seed(), experiment_setup, push=False)
+    # a change on each experiment branch since it was created, so that the increments are real merges
+    for idx in range(1, len(commits)):
+        git(repo_dir, 'checkout', '-q', 't_{}-{}'.format(idx, idx - 1))
+        content = show_file(repo_dir, 'HEAD', 'a.txt').decode("utf-8").splitlines(True)
+        content[1] = "branch {}\n".format(idx)
+        content[15] = "branch {}\n".format(idx)
+        commit_files(repo_dir, {"a.txt" : "".join(content).encode("utf-8"), "bin.dat" : b"\0\1branch"})
+    git(repo_dir, 'checkout', '-q', 'master')
+    memory_dir = str(tmp_path / "memory")
+    shutil.copytree(repo_dir, memory_dir, symlinks=True)
+    branches = ['t_{}-{}'.format(idx, idx - 1) for idx in range(1, len(commits))]
+
+    assert git_repo.proceed_commit_history('t', push=False, in_memory=False)
+    GitCommand.tracing_ = True
+    GitCommand.drain_records()
+    try:
+        assert GitReplay(memory_dir).proceed_commit_history('t', push=False, in_memory=True)
+        records = GitCommand.drain_records()
+    finally:
+        GitCommand.tracing_ = False
+    for branch in branches:
+        assert git(memory_dir, 'rev-parse', branch + '^{tree}') == git(repo_dir, 'rev-parse', branch + '^{tree}')
+        assert git(memory_dir, 'rev-parse', branch + '^2') == git(repo_dir, 'rev-parse', branch + '^2')
+    # all branches are updated in one ref transaction, without any checkout
+    commands = [record["command"] for record in records if record["kind"] == "command"]
+    assert len([command for command in commands if command.startswith("git update-ref --stdin")]) == 1
+    assert not any(command.startswith("git checkout") or command.startswith("git merge ") for command in commands)
@@ -0,0 +1,126 @@
+import os
+import xml.etree.ElementTree as ET
+
+import pytest
+
+from SetupManager.PomManager import PomManager
+from SetupManager.constants import STARTS_XML_PATH, SUREFIRE_XML_PATH
+
+PROJECT = '<project xmlns="http://maven.apache.org/POM/4.0.0">'
+
+POMS = {
+    "normal" : """<?xml version="1.0" encoding="UTF-8"?>
+<!-- keep this comment -->
+{}
+  <modelVersion>4.0.0</modelVersion>
+  <build>
+    <pluginManagement><plugins><plugin><artifactId>starts-maven-plugin</artifactId></plugin></plugins></pluginManagement>
+    <plugins>
+      <plugin>
+        <artifactId>maven-compiler-plugin</artifactId>
+      </plugin>
+    </plugins>
+  </build>
+</project>
+""".format(PROJECT),
+    "empty_element" : "{}\n  <build>\n    <plugins/>\n  </build>\n</project>\n".format(PROJECT),
+    "empty_element_with_space" : "{}\n  <build>\n    <plugins />\n  </build>\n</project>\n".format(PROJECT),
+    "one_line" : "{}<build><plugins><plugin><artifactId>x</artifactId></plugin></plugins></build></project>\n".format(PROJECT),
+    "crlf" : "{}\r\n  <build>\r\n    <plugins>\r\n      <plugin>\r\n        <artifactId>x</artifactId>\r\n" \
+        "      </plugin>\r\n    </plugins>\r\n  </build>\r\n</project>\r\n".format(PROJECT),
+    "tabs" : "{}\n\t<build>\n\t\t<plugins>\n\t\t\t<plugin>\n\t\t\t\t<artifactId>x</artifactId>\n\t\t\t</plugin>\n" \
+        "\t\t</plugins>\n\t</build>\n</project>\n".format(PROJECT),
+    "already_present" : """{}
+  <build>
+    <plugins>
+      <plugin>
+        <artifactId>maven-surefire-plugin</artifactId>
+      </plugin>
+    </plugins>
+  </build>
+</project>
+""".format(PROJECT),
+    "no_build" : "{}\n  <modelVersion>4.0.0</modelVersion>\n</project>\n".format(PROJECT),
+    "profile_build_first" : """{}
+  <profiles>
+    <profile>
+      <build>
+        <plugins>
+        </plugins>
+      </build>
+    </profile>
+  </profiles>
+  <build>
+    <plugins>
+    </plugins>
+  </build>
+</project>
+""".format(PROJECT),
+    "close_after_last_plugin" : """{}
+  <build>
+    <plugins>
+      <plugin><artifactId>x</artifactId></plugin></plugins>
+  </build>
+</project>
+""".format(PROJECT),
+}
+
+# Function that adds the starts and surefire plugins to a pom.xml file
+# @param repo_dir: the directory to write the pom.xml file to
+# @param pom: the content of the pom.xml file as string
+# @param preserve_format: see PomManager.add_plugins
+# @return the content of the pom.xml file afterwards as byte string
+def add_plugins(repo_dir, pom, preserve_format):
+    os.makedirs(repo_dir)
+    pom_file = os.path.join(repo_dir, "pom.xml")
+    with open(pom_file, 'wb') as write_file:
+        write_file.write(pom.encode("utf-8"))
+    PomManager(repo_dir).add_plugins([STARTS_XML_PATH, SUREFIRE_XML_PATH], preserve_format=preserve_format)
+    with open(pom_file, 'rb') as read_file:
+        return read_file.read()
+
+@pytest.mark.parametrize("name", sorted(POMS))
+def test_splice_matches_rewrite(tmp_path, name, capsys):
+    spliced = add_plugins(str(tmp_path / "spliced"), POMS[name], True)
+    rewritten = add_plugins(str(tmp_path / "rewritten"), POMS[name], False)
+
+    assert ET.canonicalize(spliced.decode("utf-8"), strip_text=True) == \
+        ET.canonicalize(rewritten.decode("utf-8"), strip_text=True)
+    # the splice never falls back to the rewrite
+    assert "Failed to splice" not in capsys.readouterr().out
+
+def test_splice_keeps_the_rest_of_the_file(tmp_path):
+    spliced = add_plugins(str(tmp_path / "spliced"), POMS["normal"], True).decode("utf-8")
+
+    assert spliced.startswith('<?xml version="1.0" encoding="UTF-8"?>\n<!-- keep this comment -->\n')
+    assert """      </plugin>
+      <plugin>
+        <groupId>edu.illinois</groupId>
+        <artifactId>starts-maven-plugin</artifactId>
+        <version>1.3</version>
+      </plugin>
+""" in spliced
+    assert "\r\n" not in spliced
+
+def test_splice_follows_newlines_and_indentation(tmp_path):
+    crlf = add_plugins(str(tmp_path / "crlf"), POMS["crlf"], True).decode("utf-8")
+    tabs = add_plugins(str(tmp_path / "tabs"), POMS["tabs"], True).decode("utf-8")
+
+    assert "\r\n      <plugin>\r\n        <groupId>edu.illinois</groupId>\r\n" in crlf
+    assert "\n" not in crlf.replace("\r\n", "")
+    assert "\n\t\t\t<plugin>\n\t\t\t\t<groupId>edu.illinois</groupId>\n" in tabs
+
+def test_splice_expands_empty_element(tmp_path):
+    spliced = add_plugins(str(tmp_path / "spliced"), POMS["empty_element_with_space"], True).decode("utf-8")
+
+    assert "    <plugins>\n      <plugin>\n        <groupId>edu.illinois</groupId>\n" in spliced
+    assert "      </plugin>\n    </plugins>\n  </build>\n" in spliced
+
+def test_splice_after_last_plugin_on_the_closing_line(tmp_path):
+    spliced = add_plugins(str(tmp_path / "spliced"), POMS["close_after_last_plugin"], True).decode("utf-8")
+
+    assert """      <plugin><artifactId>x</artifactId></plugin>
+      <plugin>
+        <groupId>edu.illinois</groupId>
+""" in spliced
+    assert "      </plugin>\n    </plugins>\n  </build>\n" in spliced
@@ -0,0 +1,115 @@
+import os
+import json
+import socket
+import tarfile
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+
+from ReportStore import ReportStore
+from SetupManager import reportUploader
+from SetupManager.reportUploader import upload_build_reports, with_name, REPORT_STREAM_CONTENT_TYPE
+
+REPORT = """<?xml version="1.0" encoding="UTF-8"?>
+<testsuite name="{0}" tests="2">
+  <testcase classname="{0}" name="testA" time="0.5"/>
+  <testcase classname="{0}" name="testB" time="1,000.25"><failure message="boom"/></testcase>
+</testsuite>
+"""
+
+REPORTS = {
+    "a/target/surefire-reports/TEST-a.ATest.xml" : REPORT.format("a.ATest"),
+    "a/target/surefire-reports/TEST-a.BTest.xml" : REPORT.format("a.BTest"),
+    "b/target/surefire-reports/TEST-b.CTest.xml" : REPORT.format("b.CTest"),
+    "b/target/surefire-reports/b.CTest.txt" : "not a report",
+}
+
+@pytest.fixture
+def build_dir(tmp_path):
+    build_dir = str(tmp_path / "build")
+    for path, content in REPORTS.items():
+        os.makedirs(os.path.dirname(os.path.join(build_dir, path)), exist_ok=True)
+        with open(os.path.join(build_dir, path), 'w') as write_file:
+            write_file.write(content)
+    return build_dir
+
+def test_second_upload_is_deduplicated(server, build_dir, tmp_path):
+    endpoint, report_dir = server
+
+    total, status, body, sent = upload_build_reports(with_name(endpoint, "seed_0_1"), build_dir, "seed_0_1")
+    assert (total, status) == (3, 200)
+    assert json.loads(body) == {"stored" : 3, "deduplicated" : 0, "missing" : []}
+    total, status, body, small = upload_build_reports(with_name(endpoint, "seed_0_2"), build_dir, "seed_0_2")
+    assert (total, status) == (3, 200)
+    assert json.loads(body) == {"stored" : 0, "deduplicated" : 3, "missing" : []}
+    # only the manifest is sent the second time
+    assert small < sent
+
+    store = ReportStore(str(tmp_path / "results.db"))
+    try:
+        for job in [1, 2]:
+            assert store.ingest_manifest(os.path.join(report_dir, "seed_0_{}.manifest".format(job))) == 6
+        rows = store.connection_.execute("SELECT branches.name, job, tests, failures, test_seconds FROM branch_stats " \
+            "JOIN branches ON branches.id = branch_id ORDER BY job").fetchall()
+    finally:
+        store.close()
+    assert rows == [("seed_0", 1, 6, 3, 3 * 1000.75), ("seed_0", 2, 6, 3, 3 * 1000.75)]
+
+def test_multipart_fallback_without_check(server, build_dir, monkeypatch):
+    endpoint, report_dir = server
+    # an endpoint that doesn't answer the check, i.e. the Azure function
+    monkeypatch.setattr(reportUploader, "check_reports", lambda url, hashes: None)
+
+    total, status, body, sent = upload_build_reports(with_name(endpoint, "seed_0_1"), build_dir, "seed_0_1")
+    assert (total, status, body) == (3, 200, "Message Received")
+    assert not os.path.exists(os.path.join(report_dir, "seed_0_1.manifest"))
+    with tarfile.open(os.path.join(report_dir, "seed_0_1.tar.gz"), 'r:gz') as archive:
+        assert sorted(archive.getnames()) == sorted(path for path in REPORTS if path.endswith(".xml"))
+
+# Function that writes reports whose content doesn't compress, so that each upload is many chunks
+# @param build_dir: the build directory
+# @param count: the number of reports
+# @param size: the size of each report in bytes
+def write_large_reports(build_dir, count, size):
+    for idx in range(count):
+        path = os.path.join(build_dir, "m{}".format(idx), "target", "surefire-reports", "TEST-m{}.ATest.xml".format(idx))
+        os.makedirs(os.path.dirname(path))
+        with open(path, 'wb') as write_file:
+            write_file.write(b"<testsuite>\n<!--" + os.urandom(size).hex().encode("ascii")[:size] + b"-->\n</testsuite>\n")
+
+@pytest.mark.parametrize("server", [{"report_workers" : 2}], indirect=True)
+def test_more_uploads_than_workers(server, tmp_path):
+    endpoint, report_dir = server
+    build_dir = str(tmp_path / "large")
+    write_large_reports(build_dir, 20, 100 * 1024)
+    # more uploads at once than the threads of the default executor and of the report executor
+    uploads = 4 * (os.cpu_count() or 1) + 8
+    names = ["seed_0_{}".format(job) for job in range(1, uploads + 1)]
+
+    with ThreadPoolExecutor(max_workers=uploads) as executor:
+        results = list(executor.map(lambda name: upload_build_reports(with_name(endpoint, name), build_dir, name, \
+            check=False), names))
+        for result in results:
+            assert result[:2] == (20, 200)
+    for name in names:
+        assert os.path.isfile(os.path.join(report_dir, "{}.manifest".format(name)))
+    assert sum(json.loads(result[2])["stored"] for result in results) == 20
+
+@pytest.mark.parametrize("server", [{"report_workers" : 1}], indirect=True)
+def test_disconnect_in_the_middle_of_the_body(server, build_dir):
+    endpoint, report_dir = server
+    host, port = endpoint.split("/")[2].split(":")
+    connection = socket.create_connection((host, int(port)))
+    connection.sendall("POST /api/StoreReportEndPoint?name=seed_0_1 HTTP/1.1\r\nHost: {}\r\nContent-Type: {}\r\n" \
+        "Transfer-Encoding: chunked\r\n\r\n".format(host, REPORT_STREAM_CONTENT_TYPE).encode("latin-1"))
+    # the start of a chunk that never arrives in full
+    connection.sendall(b"10000\r\n\x1f\x8b\x08\x00")
+    connection.close()
+
+    # the only report slot is free again
+    with ThreadPoolExecutor(max_workers=1) as executor:
+        total, status, body, _ = executor.submit(upload_build_reports, with_name(endpoint, "seed_0_2"), build_dir, \
+            "seed_0_2").result(timeout=30)
+    assert (total, status) == (3, 200)
+    assert not os.path.exists(os.path.join(report_dir, "seed_0_1.manifest"))
+    assert os.path.isfile(os.path.join(report_dir, "seed_0_2.manifest"))
@@ -0,0 +1,52 @@
+import os
+import json
+import time
+import sqlite3
+from concurrent.futures import ThreadPoolExecutor
+from http.client import HTTPConnection
+from urllib.parse import urlsplit
+
+import pytest
+
+from BuildCache import BUILD_CACHE_FILE_NAME
+
+# Function that posts a JSON body to an endpoint of the server
+# @param endpoint: the report endpoint, the path is replaced
+# @param path: the path of the endpoint
+# @param body: the body as dictionary
+# @return tuple of (HTTP status, response body as string)
+def post(endpoint, path, body):
+    connection = HTTPConnection(urlsplit(endpoint).netloc, timeout=30)
+    try:
+        connection.request("POST", path, json.dumps(body), {"Content-Type" : "application/json"})
+        response = connection.getresponse()
+        return (response.status, response.read().decode("utf-8"))
+    finally:
+        connection.close()
+
+NOTIFICATION = {"branch" : "seed_0", "repository" : {"name" : "repo"}, "matrix" : [{"id" : 1, "number" : "7.1", \
+    "state" : "passed", "started_at" : "2019-04-28T02:41:58Z", "finished_at" : "2019-04-28T02:42:58Z"}]}
+
+@pytest.mark.parametrize("server", [{"build_cache" : True}], indirect=True)
+def test_locked_build_cache_does_not_stall_requests(server):
+    endpoint, report_dir = server
+    # a pipeline in the middle of a transaction on the build cache
+    connection = sqlite3.connect(os.path.join(report_dir, BUILD_CACHE_FILE_NAME))
+    connection.execute("BEGIN EXCLUSIVE")
+    try:
+        with ThreadPoolExecutor(max_workers=1) as executor:
+            notification = executor.submit(post, endpoint, "/api/CINotificationEndPoint", NOTIFICATION)
+            # the job records are written before the build cache is stored into
+            deadline = time.time() + 30
+            while not os.path.exists(os.path.join(report_dir, "seed_0.txt")) and time.time() < deadline:
+                time.sleep(0.01)
+            # the notification waits for the lock, the other requests are served meanwhile
+            assert post(endpoint, "/api/StoreReportEndPoint", {"hashes" : ["0" * 40]}) == \
+                (200, json.dumps({"missing" : ["0" * 40]}))
+            assert not notification.done()
+            connection.rollback()
+            assert notification.result(timeout=30) == (200, "Message Received")
+    finally:
+        connection.close()
+    with open(os.path.join(report_dir, "seed_0.txt"), 'r') as read_file:
+        assert "state passed; time 60.0" in read_file.read()
@@ -0,0 +1,45 @@
+from GitReplay import GitReplay
+from repohelper import git, init_repo, commit_files
+
+# the setup of the experiment branches: adds a file
+def experiment_setup(repo_dir):
+    with open(repo_dir + "/setup.txt", 'w') as write_file:
+        write_file.write("setup\n")
+    return ["setup.txt"]
+
+# Function that creates a repository with seeds and experiment branches kept in the journal
+# @return tuple of (repository directory, list of the SHAs of the seeds, the most recent first)
+def journal_repo(tmp_path):
+    repo_dir = str(tmp_path / "repo")
+    init_repo(repo_dir)
+    commits = []
+    for idx in range(3):
+        commits.insert(0, commit_files(repo_dir, {"a.txt" : "v{}\n".format(idx).encode("utf-8")}))
+    git_repo = GitReplay(repo_dir, journal=True)
+    assert git_repo.build_seeds_from_commits(commits, push=False, batch=True)
+    assert git_repo.create_experiment_branches_with_tag('t', git_repo.get_existing_seed(), experiment_setup, push=False)
+    git(repo_dir, 'checkout', '-q', 'master')
+    return (repo_dir, commits)
+
+# @return the output of "git for-each-ref" of the branches
+def branches(repo_dir):
+    return git(repo_dir, 'for-each-ref', '--format=%(objectname) %(refname)', 'refs/heads/')
+
+def test_extend_adds_newer_seeds(tmp_path):
+    repo_dir, commits = journal_repo(tmp_path)
+    newer = commit_files(repo_dir, {"a.txt" : b"v3\n"})
+
+    git_repo = GitReplay(repo_dir, journal=True)
+    assert git_repo.build_seeds_from_commits([newer] + commits, push=False, batch=True)
+    assert [git(repo_dir, 'rev-parse', 'seed_{}'.format(idx)) for idx in range(4)] == [newer] + commits
+
+def test_extend_refused_after_the_server_incremented(tmp_path):
+    repo_dir, commits = journal_repo(tmp_path)
+    # the responsive server increments without the journal
+    assert GitReplay(repo_dir).merge_increments('t', push=False, idx_list=[1]) == {}
+    newer = commit_files(repo_dir, {"a.txt" : b"v3\n"})
+    before = branches(repo_dir)
+
+    git_repo = GitReplay(repo_dir, journal=True)
+    assert not git_repo.build_seeds_from_commits([newer] + commits, push=False, batch=True)
+    assert branches(repo_dir) == before